@@ -8,39 +8,326 @@ API מלא לשליטה מרחוק, screenshots, ומילוי טפסים.
 Author: Embassy V4 Architecture
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, has_request_context, request, jsonify, send_file
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import (
+    TimeoutException,
+    JavascriptException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+    InvalidSessionIdException,
+    WebDriverException
+)
 import os
 import time
+import uuid
+import json
 import base64
+import select
+import socket
+import zlib
+import difflib
+import hashlib
+import hmac
+import secrets
+import heapq
+import re
+import queue
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from io import BytesIO
 from PIL import Image
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as DriverConnectionError
+
+import psutil
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+try:
+    import brotli  # אופציונלי - Content-Encoding: br
+except ImportError:
+    brotli = None
+
+try:
+    import yaml  # אופציונלי - recipes ב-YAML
+except ImportError:
+    yaml = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Global browser instance
-driver = None
+# ==================== Metrics ====================
 
-def init_browser():
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))  # 256B .. 64MB
+
+REQUEST_SECONDS = Histogram(
+    'embassy_http_request_duration_seconds', 'HTTP request latency',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+RESPONSE_BYTES = Histogram(
+    'embassy_http_response_bytes', 'HTTP response body size (when known up front)',
+    ['route'], buckets=SIZE_BUCKETS
+)
+WEBDRIVER_SECONDS = Histogram(
+    'embassy_webdriver_command_duration_seconds', 'WebDriver command latency',
+    ['command'], buckets=LATENCY_BUCKETS
+)
+WAIT_SECONDS = Histogram(
+    'embassy_page_wait_duration_seconds', 'Time spent in wait_until conditions',
+    ['condition', 'timed_out'], buckets=LATENCY_BUCKETS
+)
+ENCODE_SECONDS = Histogram(
+    'embassy_encode_duration_seconds', 'Time spent encoding payloads (base64, image, compression)',
+    ['kind'], buckets=LATENCY_BUCKETS
+)
+ERRORS = Counter(
+    'embassy_errors_total', 'Failed actions by exception type',
+    ['action', 'exception']
+)
+ACTIVE_SESSIONS = Gauge('embassy_active_sessions', 'Open browser sessions in the pool')
+STANDBY_BROWSERS = Gauge('embassy_standby_browsers', 'Pre-warmed browsers waiting to replace a recycled one')
+SCREENCAST_VIEWERS = Gauge('embassy_screencast_viewers', 'Open /screencast streams')
+NOVNC_VIEWERS = Gauge('embassy_novnc_viewers', 'Open noVNC WebSocket tunnels')
+PAGE_CACHE_REQUESTS = Counter('embassy_page_cache_requests_total', 'Rendered-page cache lookups', ['result'])
+PAGE_CACHE_BYTES = Gauge('embassy_page_cache_bytes', 'Memory held by the rendered-page cache')
+STARTUP_SECONDS = Histogram(
+    'embassy_browser_startup_seconds', 'Browser cold start by phase (driver_spawn, first_blank_page, ...)',
+    ['phase'], buckets=LATENCY_BUCKETS
+)
+RECYCLES = Counter('embassy_browser_recycles_total', 'Browsers replaced by the watchdog', ['reason'])
+QUEUE_WAIT_SECONDS = Histogram(
+    'embassy_queue_wait_seconds', 'Time spent waiting for a browser (or tab) to be free',
+    ['priority'], buckets=LATENCY_BUCKETS
+)
+QUEUE_WAITING = Gauge('embassy_queue_waiting', 'Requests waiting in browser work queues', ['priority'])
+QUEUE_REJECTIONS = Counter('embassy_queue_rejections_total', 'Requests turned away with 429', ['priority', 'reason'])
+
+
+# החלון (window handle) שהפקודות של ה-thread הנוכחי מיועדות אליו - נקבע ב-lease של session/טאב
+_window = threading.local()
+
+# פקודות ברמת הדפדפן כולו - לא צריך לעבור לחלון לפניהן
+DRIVER_LEVEL_COMMANDS = frozenset((
+    'newSession', 'quit', 'getLog', 'getAvailableLogTypes', 'w3cGetWindowHandles', 'switchToWindow'
+))
+
+
+@contextmanager
+def on_window(handle):
+    """
+    כל פקודות ה-WebDriver בתוך הבלוק (ב-thread הזה) ירוצו בחלון handle (None = החלון הנוכחי)
+    """
+    previous = getattr(_window, 'handle', None)
+    _window.handle = handle
+    try:
+        yield
+    finally:
+        _window.handle = previous
+
+
+def instrument_driver(driver):
     """
-    אתחול דפדפן Chrome עם Selenium
+    עטיפת driver.execute (גם פקודות של WebElement עוברות דרכו):
+    - מדידת זמן לכל פקודה
+    - פקודה אחת בכל פעם לכל דפדפן, ומעבר לחלון של הטאב שמריץ אותה אם צריך
     """
-    global driver
+    execute = driver.execute
+    command_lock = threading.Lock()
+    state = {"window": None}  # החלון הפעיל כרגע ב-chromedriver (None = לא ידוע / הראשי)
+    
+    def timed_execute(driver_command, params=None):
+        handle = getattr(_window, 'handle', None)
+        with command_lock:
+            if handle and handle != state["window"] and driver_command not in DRIVER_LEVEL_COMMANDS:
+                execute('switchToWindow', {'handle': handle})
+                state["window"] = handle
+            started = time.perf_counter()
+            try:
+                return execute(driver_command, params)
+            finally:
+                WEBDRIVER_SECONDS.labels(driver_command).observe(time.perf_counter() - started)
+                if driver_command == 'close':
+                    state["window"] = None
     
-    if driver is not None:
-        logger.info("Browser already initialized")
-        return driver
+    driver.execute = timed_execute
+    return driver
+
+
+def browser_processes(driver):
+    """
+    תהליך ה-chromedriver וכל תהליכי Chrome שמתחתיו (ריק ל-Remote WebDriver)
+    """
+    process = getattr(getattr(driver, 'service', None), 'process', None)
+    if process is None:
+        return []
+    try:
+        root = psutil.Process(process.pid)
+        return [root] + root.children(recursive=True)
+    except psutil.Error:
+        return []
+
+
+def browser_usage(driver):
+    """
+    RSS (bytes) וזמן CPU (שניות) של כל תהליכי הדפדפן
+    """
+    rss = 0
+    cpu = 0.0
+    for proc in browser_processes(driver):
+        try:
+            rss += proc.memory_info().rss
+            times = proc.cpu_times()
+            cpu += times.user + times.system
+        except psutil.Error:
+            continue
+    return rss, cpu
+
+
+class BrowserProcessCollector:
+    """
+    זיכרון ו-CPU של הדפדפן של כל session - נמדד בזמן ה-scrape
+    """
     
+    def collect(self):
+        rss = GaugeMetricFamily('embassy_browser_rss_bytes', 'Resident memory of chromedriver + Chrome', labels=['session'])
+        cpu = CounterMetricFamily('embassy_browser_cpu_seconds', 'CPU time of chromedriver + Chrome', labels=['session'])
+        
+        with pool.lock:
+            sessions = list(pool.sessions.values())
+        for session in sessions:
+            session_rss, session_cpu = browser_usage(session.driver)
+            rss.add_metric([session.id], session_rss)
+            cpu.add_metric([session.id], session_cpu)
+        
+        yield rss
+        yield cpu
+
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    if 'queue_wait' in g:
+        response.headers['X-Queue-Wait-Ms'] = str(round(g.queue_wait * 1000))
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(time.perf_counter() - started)
+        if response.content_length is not None:
+            RESPONSE_BYTES.labels(route).observe(response.content_length)
+    return response
+
+
+# הגדרות מאגר הדפדפנים
+POOL_SIZE = int(os.environ.get('POOL_SIZE', 4))
+SESSION_IDLE_TIMEOUT = int(os.environ.get('SESSION_IDLE_TIMEOUT', 600))
+SESSION_MAX_LIFETIME = int(os.environ.get('SESSION_MAX_LIFETIME', 3600))
+REAPER_INTERVAL = 30
+
+# watchdog - בדיקת בריאות ומיחזור דפדפנים (0 = ללא מגבלה)
+WATCHDOG_INTERVAL = int(os.environ.get('WATCHDOG_INTERVAL', 15))
+RECYCLE_AFTER_NAVIGATIONS = int(os.environ.get('RECYCLE_AFTER_NAVIGATIONS', 200))
+BROWSER_RSS_LIMIT_MB = int(os.environ.get('BROWSER_RSS_LIMIT_MB', 1500))
+WARM_STANDBY = int(os.environ.get('WARM_STANDBY', 1))  # דפדפנים מוכנים מראש, מעבר ל-POOL_SIZE
+
+# admission control - תור עבודה לכל דפדפן (ולכל טאב)
+QUEUE_DEPTH = int(os.environ.get('QUEUE_DEPTH', 4))  # בקשות ממתינות מעבר לזו שרצה
+QUEUE_MAX_WAIT = int(os.environ.get('QUEUE_MAX_WAIT', 60))  # שניות - ואז 429 במקום timeout של gunicorn
+PRIORITIES = ('interactive', 'bulk')  # לפי סדר העדיפות
+
+# warm-up - הפעלת הדפדפן הראשי מיד כשה-worker עולה (gunicorn post_fork)
+WARM_UP = os.environ.get('WARM_UP', '1') != '0'
+WARM_UP_WAIT = int(os.environ.get('WARM_UP_WAIT', 60))  # כמה בקשה ממתינה ל-warm-up שבתהליך
+
+# טאבים בתוך הדפדפן של session (window handles)
+MAX_TABS_PER_SESSION = int(os.environ.get('MAX_TABS_PER_SESSION', 8))
+
+# none (ברירת מחדל): ההמתנה רק דרך wait_until - טאבים של אותו דפדפן נטענים במקביל באמת.
+# normal: ‏chromedriver ממתין לטעינת הדף בכל פקודה (והדפדפן כולו, כל הטאבים, תפוס בזמן הזה)
+PAGE_LOAD_STRATEGY = os.environ.get('PAGE_LOAD_STRATEGY', 'none')
+
+# screencast - שידור חי של הדף (Page.startScreencast), חלופה ל-VNC לצפייה בלבד
+SCREENCAST_FPS = int(os.environ.get('SCREENCAST_FPS', 5))
+SCREENCAST_MAX_FPS = 30
+SCREENCAST_QUALITY = int(os.environ.get('SCREENCAST_QUALITY', 60))
+SCREENCAST_MAX_WIDTH = int(os.environ.get('SCREENCAST_MAX_WIDTH', 1280))
+# כל צופה מחזיק thread של gunicorn לכל אורך השידור - כמו NOVNC_MAX_VIEWERS
+SCREENCAST_MAX_VIEWERS = int(os.environ.get('SCREENCAST_MAX_VIEWERS', 2))
+SCREENCAST_KEEPALIVE = 5  # שניות - שליחת ה-frame האחרון שוב בדף שלא משתנה (כך מזהים צופה שהתנתק)
+CDP_BACKLOG_LIMIT = 5000  # אירועים שמחכים לכל חלון בזמן screencast בלי פעולות
+
+# הודעות WebDriver שמעידות שהדפדפן מת (ולא שהפעולה נכשלה)
+CRASH_MARKERS = (
+    'chrome not reachable',
+    'disconnected',
+    'session deleted because of page crash',
+    'tab crashed',
+    'target window already closed'
+)
+
+# ה-session שמשמש בקשות בלי session_id (הדפדפן הגלובלי הישן)
+DEFAULT_SESSION_ID = 'default'
+
+# פרופילי חסימת משאבים (Network.setBlockedURLs)
+DEFAULT_RESOURCE_PROFILE = os.environ.get('RESOURCE_PROFILE', 'full')
+
+RESOURCE_TYPE_PATTERNS = {
+    'image': ['png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico', 'bmp'],
+    'media': ['mp4', 'webm', 'mp3', 'ogg', 'wav', 'm4a', 'mov', 'm3u8'],
+    'font': ['woff', 'woff2', 'ttf', 'otf', 'eot'],
+    'stylesheet': ['css']
+}
+
+TRACKER_URL_PATTERNS = [
+    '*google-analytics.com*',
+    '*googletagmanager.com*',
+    '*doubleclick.net*',
+    '*googlesyndication.com*',
+    '*facebook.net*',
+    '*connect.facebook.com*',
+    '*hotjar.com*',
+    '*segment.io*',
+    '*segment.com/analytics*',
+    '*newrelic.com*',
+    '*nr-data.net*',
+    '*clarity.ms*',
+    '*mixpanel.com*'
+]
+
+RESOURCE_PROFILES = {
+    'full': {},
+    'no-trackers': {'block_urls': TRACKER_URL_PATTERNS},
+    'lite': {'block_types': ['image', 'media', 'font'], 'block_urls': TRACKER_URL_PATTERNS},
+    'text': {'block_types': ['image', 'media', 'font', 'stylesheet'], 'block_urls': TRACKER_URL_PATTERNS}
+}
+
+# המתנה לטעינת דף (wait_until)
+WAIT_CONDITIONS = ('none', 'domcontentloaded', 'load', 'networkidle', 'url-change')
+DEFAULT_WAIT_TIMEOUT = 10
+NETWORK_IDLE_WINDOW_MS = 500
+
+
+def init_browser():
+    """
+    יצירת דפדפן Chrome חדש עם Selenium
+    כל session במאגר מקבל דפדפן משלו
+    """
     logger.info("Initializing Chrome browser...")
     
     options = Options()
@@ -58,7 +345,14 @@ def init_browser():
     # User agent
     options.add_argument('--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36')
     
+    # אירועי רשת (performance log) - לספירת בקשות חסומות/מותרות ו-bytes
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    # enablePage: אירועי Page.screencastFrame של /screencast
+    options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': True})
+    options.page_load_strategy = PAGE_LOAD_STRATEGY
+    
     # נסה למצוא ChromeDriver
+    started = time.perf_counter()
     try:
         driver = webdriver.Chrome(options=options)
     except Exception as e:
@@ -70,537 +364,4830 @@ def init_browser():
             options=options
         )
     driver.set_page_load_timeout(30)
+    instrument_driver(driver)
+    spawn_seconds = time.perf_counter() - started
+    STARTUP_SECONDS.labels('driver_spawn').observe(spawn_seconds)
     
-    logger.info("✅ Chrome browser initialized!")
+    logger.info(f"✅ Chrome browser initialized in {int(spawn_seconds * 1000)}ms!")
     return driver
 
 
-@app.route('/')
-def home():
+def probe_driver(driver):
     """
-    דף בית
+    האם הדפדפן עונה (round-trip אחד דרך chromedriver עד ה-renderer)
     """
-    return jsonify({
-        "service": "Browser Embassy V5 with VNC",
-        "status": "operational",
-        "description": "Remote browser automation with visual control",
-        "vnc_url": "/vnc",
-        "vnc_password": "browser123",
-        "endpoints": {
-            "/navigate": "Navigate to URL",
-            "/screenshot": "Get current page screenshot",
-            "/extract_fields": "Extract form fields",
-            "/fill_field": "Fill a form field",
-            "/click": "Click an element",
-            "/get_html": "Get page HTML",
-            "/execute_js": "Execute JavaScript",
-            "/status": "Browser status",
-            "/vnc": "noVNC web interface (visual browser control)"
-        }
-    })
+    try:
+        return driver.execute_script('return 1') == 1
+    except Exception:
+        return False
 
 
-@app.route('/vnc')
-def vnc_page():
+def browser_crashed(error):
     """
-    דף גישה ל-noVNC דרך iframe
+    האם השגיאה אומרת שהדפדפן עצמו מת (crash, chromedriver נפל, session נמחק)
     """
-    return '''
-    <!DOCTYPE html>
-    <html dir="rtl" lang="he">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Browser Embassy - VNC Access</title>
-        <style>
-            * { margin: 0; padding: 0; box-sizing: border-box; }
-            body {
-                font-family: Arial, sans-serif;
-                background: #1a1a2e;
-                color: white;
-                overflow: hidden;
-            }
-            .header {
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                padding: 15px 30px;
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                box-shadow: 0 2px 10px rgba(0,0,0,0.3);
-            }
-            .header h1 {
-                font-size: 1.5em;
-                display: flex;
-                align-items: center;
-                gap: 10px;
-            }
-            .status {
-                background: rgba(76, 175, 80, 0.2);
-                padding: 8px 16px;
-                border-radius: 20px;
-                font-size: 0.9em;
-            }
-            .status::before {
-                content: "●";
-                color: #4CAF50;
-                margin-left: 8px;
-                animation: pulse 2s infinite;
-            }
-            @keyframes pulse {
-                0%, 100% { opacity: 1; }
-                50% { opacity: 0.5; }
-            }
-            .vnc-container {
-                width: 100vw;
-                height: calc(100vh - 70px);
-                background: #000;
-            }
-            iframe {
-                width: 100%;
-                height: 100%;
-                border: none;
+    if isinstance(error, (InvalidSessionIdException, DriverConnectionError, ConnectionError)):
+        return True
+    if isinstance(error, WebDriverException):
+        message = (error.msg or '').lower()
+        return any(marker in message for marker in CRASH_MARKERS)
+    return False
+
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception as e:
+        logger.warning(f"Failed to quit browser: {e}")
+
+
+def block_urls(driver, patterns):
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+
+
+class PoolExhausted(Exception):
+    """
+    כל הדפדפנים במאגר תפוסים
+    """
+
+
+class AdmissionError(Exception):
+    """
+    בקשה שלא נכנסה לתור של הדפדפן - נענית ב-status בלי להגיע ל-driver
+    """
+    status = 503
+    retry_after = None
+
+
+class QueueFull(AdmissionError):
+    """
+    התור של הדפדפן מלא, או שההמתנה בו עברה את QUEUE_MAX_WAIT - 429 עם Retry-After
+    """
+    status = 429
+    
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueClosed(AdmissionError):
+    """
+    ה-session (או הטאב) נסגר בזמן שהבקשה חיכתה בתור - 503
+    """
+
+
+class UnknownPriority(AdmissionError):
+    """
+    X-Priority (או ?priority=) שאינו ב-PRIORITIES - 400
+    """
+    status = 400
+
+
+class WorkQueue:
+    """
+    תור העבודה של דפדפן (או טאב): פעולה אחת בכל פעם, הממתינים לפי עדיפות ואז לפי סדר הגעה
+    
+    בקשת HTTP נדחית מיד כשיש לפניה QUEUE_DEPTH ממתינים (interactive נספרת רק מול interactive,
+    bulk מול כולם), או כשההמתנה עוברת QUEUE_MAX_WAIT. עבודת רקע (jobs, fetch_many) ממתינה תמיד.
+    """
+    
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.waiting = []  # heap של (rank, ticket)
+        self.tickets = 0
+        self.owner = None  # ה-thread שמחזיק את התור כרגע
+        self.service = 1.0  # ממוצע נע של משך פעולה (שניות) - להערכת Retry-After
+        self.rejected = 0
+        self.closed = None  # הודעת הסגירה - מרגע זה כל הממתינים (והבאים) מקבלים QueueClosed
+    
+    def retry_after(self, ahead):
+        return max(1, min(60, round(self.service * (ahead + 1))))
+    
+    def _reject(self, priority, reason, message, ahead):
+        self.rejected += 1
+        QUEUE_REJECTIONS.labels(priority, reason).inc()
+        raise QueueFull(message, self.retry_after(ahead))
+    
+    @contextmanager
+    def turn(self, priority, bounded=True):
+        """
+        המתנה לתור - מחזיר כמה שניות חיכינו
+        """
+        me = threading.get_ident()
+        if self.owner == me:  # lease מקונן באותו thread
+            yield 0.0
+            return
+        
+        rank = PRIORITIES.index(priority)
+        started = time.monotonic()
+        with self.cond:
+            if self.closed:
+                raise QueueClosed(self.closed)
+            if self.owner is not None or self.waiting:
+                ahead = sum(1 for other, _ in self.waiting if other <= rank)
+                if bounded and ahead >= QUEUE_DEPTH:
+                    self._reject(priority, 'full', f"Browser queue is full ({ahead} {priority} requests waiting)", ahead)
+                self.tickets += 1
+                ticket = (rank, self.tickets)
+                heapq.heappush(self.waiting, ticket)
+                QUEUE_WAITING.labels(priority).inc()
+                try:
+                    while self.owner is not None or self.waiting[0] != ticket:
+                        if self.closed:
+                            raise QueueClosed(self.closed)
+                        remaining = started + QUEUE_MAX_WAIT - time.monotonic() if bounded else None
+                        if remaining is not None and remaining <= 0:
+                            self._reject(priority, 'timeout', f"Waited {QUEUE_MAX_WAIT}s in the browser queue",
+                                         len(self.waiting))
+                        self.cond.wait(remaining)
+                finally:
+                    self.waiting.remove(ticket)
+                    heapq.heapify(self.waiting)
+                    QUEUE_WAITING.labels(priority).dec()
+                    self.cond.notify_all()
+            self.owner = me
+        
+        waited = time.monotonic() - started
+        QUEUE_WAIT_SECONDS.labels(priority).observe(waited)
+        try:
+            yield waited
+        finally:
+            with self.cond:
+                self.owner = None
+                self.service = 0.8 * self.service + 0.2 * (time.monotonic() - started - waited)
+                self.cond.notify_all()
+    
+    def close(self, message):
+        """
+        סגירת התור לפני סגירת הדפדפן - הממתינים יוצאים עם QueueClosed במקום לרוץ על driver מת
+        """
+        with self.cond:
+            self.closed = message
+            self.cond.notify_all()
+    
+    def check_open(self):
+        """
+        אחרי קבלת הנעילה: התור נסגר בין קבלת התור לקבלת הנעילה
+        """
+        if self.closed:
+            raise QueueClosed(self.closed)
+    
+    def info(self):
+        with self.cond:
+            ranks = [rank for rank, _ in self.waiting]
+            return {
+                "busy": self.owner is not None,
+                "waiting": {priority: ranks.count(rank) for rank, priority in enumerate(PRIORITIES)},
+                "avg_service_ms": round(self.service * 1000),
+                "rejected": self.rejected
             }
-        </style>
-    </head>
-    <body>
-        <div class="header">
-            <h1>🖥️ Browser Embassy - VNC Console</h1>
-            <div class="status">מחובר</div>
-        </div>
-        <div class="vnc-container">
-            <iframe src="/novnc/" allow="clipboard-read; clipboard-write"></iframe>
-        </div>
-    </body>
-    </html>
-    '''
 
-@app.route('/novnc/')
-@app.route('/novnc/<path:path>')
-def novnc_proxy(path=''):
+
+def request_priority():
     """
-    Proxy ל-noVNC דרך Flask
+    העדיפות של הבקשה הנוכחית (X-Priority או ?priority=) - נבדקת רק בבקשות שעוברות בתור
+    """
+    priority = request.headers.get('X-Priority') or request.args.get('priority') or 'interactive'
+    if priority not in PRIORITIES:
+        raise UnknownPriority(f"Unknown priority: {priority} (expected {', '.join(PRIORITIES)})")
+    return priority
+
+
+@contextmanager
+def admitted(work_queue, priority=None):
+    """
+    תור לפי העדיפות של הבקשה הנוכחית (X-Priority) - בלי בקשה, עבודת רקע ב-bulk.
+    זמן ההמתנה נצבר ב-g.queue_wait (queue_wait_ms בתשובה)
+    """
+    in_request = has_request_context()
+    if priority is None:
+        priority = request_priority() if in_request else 'bulk'
+    with work_queue.turn(priority, bounded=in_request) as waited:
+        if in_request:
+            g.queue_wait = g.get('queue_wait', 0) + waited
+        yield
+
+
+@app.errorhandler(AdmissionError)
+def _not_admitted(e):
+    if e.retry_after is None:
+        return jsonify({"error": str(e)}), e.status
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+class BrowserSession:
+    """
+    דפדפן אחד מהמאגר, מושכר ל-client לפי session_id
     """
-    novnc_url = f'http://localhost:6080/{path}'
     
-    try:
-        # העבר את הבקשה ל-noVNC
-        resp = requests.get(
-            novnc_url,
-            headers={k: v for k, v in request.headers if k.lower() != 'host'},
-            stream=True,
-            timeout=30
-        )
+    def __init__(self, session_id, driver):
+        self.id = session_id
+        self.driver = driver
+        self.lock = threading.RLock()  # פקודה אחת בכל פעם לכל דפדפן
+        self.queue = WorkQueue()  # הבקשות שממתינות ל-lock, לפי עדיפות
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.last_frame = None  # hashes של ה-tiles בצילום האחרון (screenshot delta)
+        self.frame_seq = 0  # מספור ה-frames - ממשיך גם אחרי מיחזור, כדי ש-since ישן לא יתאים ל-frame חדש
+        self.fields_cache = None  # תוצאת extract_fields האחרונה + גרסת ה-DOM שלה
+        self.resource_profile = 'full'
+        self.blocked_urls = []
+        self.html_snapshot = None  # {"hash", "lines"} - הבסיס ל-get_html diff
+        self.element_cache = {}  # (method, selector) -> WebElement
+        self.element_hits = 0
+        self.element_misses = 0
+        self.navigations = 0  # מאז הדפדפן הנוכחי - למיחזור לפי RECYCLE_AFTER_NAVIGATIONS
+        self.recycles = 0
+        self.rss = None
+        self.last_health_check = None
+        self.handle = None  # החלון הראשי - נקבע כשנפתח הטאב הראשון
+        self.tabs = {}  # tab_id -> BrowserTab
+        self.cdp_backlog = {}  # webview -> אירועי CDP של טאבים אחרים שעוד לא נקראו
+        self.cdp_lock = threading.Lock()
+        self.screencasts = {}  # webview -> Screencast פעיל (None = החלון הראשי לפני שהוכר)
+        self.injected_scripts = {}  # script_id -> identifier של Page.addScriptToEvaluateOnNewDocument
+        self.pending_page = None  # דף שהוגש מ-page_cache בלי driver.get - נטען באמת רק כשצריך
+        self.screencast_lock = threading.Lock()
+    
+    @property
+    def root(self):
+        return self
+    
+    @contextmanager
+    def lease(self, priority=None, cached=False):
+        """
+        נעילת הדפדפן לבקשה הנוכחית (אחרי התור שלו)
         
-        # החזר את התשובה
-        from flask import Response
-        return Response(
-            resp.iter_content(chunk_size=8192),
-            content_type=resp.headers.get('content-type', 'text/html'),
-            status=resp.status_code
-        )
-    except Exception as e:
-        logger.error(f"noVNC proxy error: {e}")
-        return jsonify({"error": str(e)}), 500
+        דף ממתין מ-page_cache נטען כאן באמת, כך שכל endpoint רואה אותו - חוץ ממי שיודע
+        לענות מהמטמון בעצמו (cached=True: run_action, screenshot, get_html)
+        """
+        with admitted(self.queue, priority), self.lock, on_window(self.handle):
+            self.queue.check_open()
+            if not cached and self.pending_page is not None:
+                materialize_page(self)
+            self.last_used = time.time()
+            try:
+                yield self.driver
+            finally:
+                self.last_used = time.time()
+    
+    def expired(self, now):
+        """
+        האם עבר זמן החיים המקסימלי או זמן ההמתנה ללא שימוש
+        """
+        if now - self.created_at > SESSION_MAX_LIFETIME:
+            return True
+        if self.id == DEFAULT_SESSION_ID:
+            return False
+        return now - self.last_used > SESSION_IDLE_TIMEOUT
+    
+    def close_queues(self, message):
+        """
+        סגירת התורים של ה-session ושל כל הטאבים שלו - לפני quit
+        """
+        self.queue.close(message)
+        for tab in list(self.tabs.values()):
+            tab.queue.close(message)
+    
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning(f"Failed to quit browser for session {self.id}: {e}")
+    
+    def health_problem(self):
+        """
+        בדיקת בריאות (רק כשה-session לא באמצע פקודה)
+        
+        Returns:
+            סיבה למיחזור (navigations | crash | memory) או None
+        """
+        self.last_health_check = time.time()
+        if RECYCLE_AFTER_NAVIGATIONS and self.navigations >= RECYCLE_AFTER_NAVIGATIONS:
+            return 'navigations'
+        if not probe_driver(self.driver):
+            return 'crash'
+        self.rss, _ = browser_usage(self.driver)
+        if BROWSER_RSS_LIMIT_MB and self.rss > BROWSER_RSS_LIMIT_MB * 1024 * 1024:
+            return 'memory'
+        return None
+    
+    def open_tab(self):
+        """
+        פתיחת טאב חדש בדפדפן של ה-session (מקבל את פרופיל חסימת המשאבים של ה-session)
+        """
+        with self.lock:
+            if len(self.tabs) >= MAX_TABS_PER_SESSION:
+                raise PoolExhausted(f"Tab limit reached ({MAX_TABS_PER_SESSION} per session)")
+            driver = self.driver
+            if self.handle is None:
+                self.handle = driver.current_window_handle
+            # newWindow נכשל אם החלון הנוכחי נסגר (טאב קודם) - לכן מהחלון הראשי
+            with on_window(self.handle):
+                handle = driver.execute('newWindow', {'type': 'tab'})['value']['handle']
+            tab = BrowserTab(self, uuid.uuid4().hex[:8], handle)
+            self.tabs[tab.tab_id] = tab
+        
+        # Network.setBlockedURLs חל על כל טאב בנפרד
+        if tab.blocked_urls:
+            with tab.lease():
+                block_urls(driver, tab.blocked_urls)
+        logger.info(f"Opened tab {tab.tab_id} in session {self.id}")
+        return tab
+    
+    def close_tab(self, tab_id):
+        """
+        סגירת טאב (ממתין שהפעולה הנוכחית שלו תסתיים)
+        """
+        tab = self.tabs.get(tab_id)
+        if tab is None:
+            return False
+        with tab.lease() as driver:
+            if self.tabs.pop(tab_id, None) is None:
+                return False
+            tab.queue.close(f"Tab {tab_id} was closed")
+            try:
+                driver.close()
+            except Exception as e:
+                logger.warning(f"Failed to close tab {tab_id}: {e}")
+        with self.cdp_lock:
+            self.cdp_backlog.pop(webview_id(tab.handle), None)
+        logger.info(f"Closed tab {tab_id} in session {self.id}")
+        return True
+    
+    def tabs_idle(self):
+        """
+        האם אף טאב לא באמצע פעולה
+        """
+        for tab in list(self.tabs.values()):
+            if not tab.lock.acquire(blocking=False):
+                return False
+            tab.lock.release()
+        return True
+    
+    def swap_driver(self, driver):
+        """
+        החלפת הדפדפן (אותו session_id) - כל המטמונים של הדף הקודם כבר לא תקפים
+        
+        Returns:
+            הדפדפן הישן
+        """
+        old = self.driver
+        self.driver = driver
+        if self.blocked_urls:
+            block_urls(driver, self.blocked_urls)
+        self.last_frame = None
+        self.fields_cache = None
+        self.html_snapshot = None
+        self.element_cache.clear()
+        self.navigations = 0
+        self.recycles += 1
+        self.rss = None
+        self.handle = None
+        self.pending_page = None
+        self.injected_scripts.clear()
+        # הטאבים נסגרו עם הדפדפן הישן - הממתינים בתורים שלהם מקבלים 503
+        for tab in list(self.tabs.values()):
+            tab.queue.close(f"Tab {tab.tab_id} was closed when session {self.id} was recycled")
+        self.tabs.clear()
+        with self.cdp_lock:
+            self.cdp_backlog.clear()
+        return old
+    
+    def info(self):
+        now = time.time()
+        return {
+            "session_id": self.id,
+            "age": round(now - self.created_at, 1),
+            "idle": round(now - self.last_used, 1),
+            "resource_profile": self.resource_profile,
+            "element_cache": {
+                "size": len(self.element_cache),
+                "hits": self.element_hits,
+                "misses": self.element_misses
+            },
+            "queue": self.queue.info(),
+            "pending_page": self.pending_page['url'] if self.pending_page else None,
+            "tabs": [tab.info() for tab in list(self.tabs.values())],
+            "health": {
+                "navigations": self.navigations,
+                "recycles": self.recycles,
+                "rss_mb": round(self.rss / (1024 * 1024), 1) if self.rss is not None else None,
+                "last_check": round(now - self.last_health_check, 1) if self.last_health_check else None
+            }
+        }
+
+
+def webview_id(handle):
+    """
+    ה-window handle בלי הקידומת הישנה CDwindow- (כמו שדה ה-webview ב-performance log)
+    """
+    return handle[len('CDwindow-'):] if handle and handle.startswith('CDwindow-') else handle
+
+
+class BrowserTab:
+    """
+    טאב נוסף בדפדפן של session - מתנהג כמו session לכל הפעולות, עם מטמונים משלו.
+    
+    לכל טאב נעילה משלו: פעולות בטאבים שונים רצות במקביל, והפקודות שלהן
+    מתחלפות ברמת הפקודה הבודדת (instrument_driver עובר לחלון של כל פקודה).
+    """
+    
+    def __init__(self, session, tab_id, handle):
+        self.session = session
+        self.tab_id = tab_id
+        self.handle = handle
+        self.lock = threading.RLock()
+        self.queue = WorkQueue()
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.last_frame = None
+        self.frame_seq = 0
+        self.fields_cache = None
+        self.resource_profile = session.resource_profile
+        self.blocked_urls = session.blocked_urls
+        self.html_snapshot = None
+        self.element_cache = {}
+        self.element_hits = 0
+        self.element_misses = 0
+        self.injected_scripts = {}  # ההזרקות הן לכל טאב (target) בנפרד
+        self.pending_page = None
+    
+    @property
+    def root(self):
+        return self.session
+    
+    @property
+    def id(self):
+        return self.session.id
+    
+    @property
+    def driver(self):
+        return self.session.driver
+    
+    @property
+    def navigations(self):
+        return self.session.navigations
+    
+    @navigations.setter
+    def navigations(self, value):
+        # מיחזור הדפדפן לפי ניווטים סופר את כל הטאבים יחד
+        self.session.navigations = value
+    
+    @contextmanager
+    def lease(self, priority=None, cached=False):
+        with admitted(self.queue, priority), self.lock, on_window(self.handle):
+            self.queue.check_open()
+            if not cached and self.pending_page is not None:
+                materialize_page(self)
+            self.last_used = self.session.last_used = time.time()
+            try:
+                yield self.driver
+            finally:
+                self.last_used = self.session.last_used = time.time()
+    
+    def info(self):
+        now = time.time()
+        return {
+            "tab_id": self.tab_id,
+            "age": round(now - self.created_at, 1),
+            "idle": round(now - self.last_used, 1),
+            "resource_profile": self.resource_profile,
+            "element_cache": {
+                "size": len(self.element_cache),
+                "hits": self.element_hits,
+                "misses": self.element_misses
+            },
+            "queue": self.queue.info(),
+            "pending_page": self.pending_page['url'] if self.pending_page else None
+        }
+
+
+class BrowserPool:
+    """
+    מאגר דפדפנים - כל session מקבל Chrome משלו
+    """
+    
+    def __init__(self, size):
+        self.size = size
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self._opening = 0
+        self._reaper = None
+        self._watchdog = None
+        self.standby = []  # דפדפנים מוכנים (warm) שעוד לא שייכים ל-session
+        self._warming = 0
+    
+    def open(self, session_id=None, profile=None):
+        """
+        פתיחת session חדש (או החזרת הקיים אם ה-id כבר פתוח)
+        
+        Args:
+            session_id: מזהה רצוי (ברירת מחדל: אקראי)
+            profile: פרופיל חסימת משאבים (ברירת מחדל: RESOURCE_PROFILE)
+        """
+        session_id = session_id or uuid.uuid4().hex[:12]
+        session = None
+        
+        with self.lock:
+            if session_id in self.sessions:
+                return self.sessions[session_id]
+            if len(self.sessions) + self._opening >= self.size:
+                raise PoolExhausted(f"Browser pool exhausted ({self.size} sessions)")
+            self._opening += 1
+        
+        # הפעלת Chrome לוקחת זמן - לא מחזיקים את נעילת המאגר
+        try:
+            session = BrowserSession(session_id, self.take_driver())
+            apply_resource_profile(session, profile or DEFAULT_RESOURCE_PROFILE)
+        except Exception:
+            if session is not None:
+                session.quit()
+            raise
+        finally:
+            with self.lock:
+                self._opening -= 1
+        
+        with self.lock:
+            existing = self.sessions.get(session_id)
+            if existing is None:
+                self.sessions[session_id] = session
+        
+        if existing is not None:
+            session.quit()
+            return existing
+        
+        self.start_reaper()
+        self.start_watchdog()
+        logger.info(f"Opened browser session {session_id}")
+        return session
+    
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+    
+    def take_driver(self):
+        """
+        דפדפן מה-standby אם יש אחד חי, אחרת הפעלת Chrome חדש
+        """
+        while True:
+            with self.lock:
+                driver = self.standby.pop() if self.standby else None
+            if driver is None:
+                break
+            if probe_driver(driver):
+                self.fill_standby()
+                return driver
+            quit_driver(driver)
+        
+        self.fill_standby()
+        return init_browser()
+    
+    def fill_standby(self):
+        """
+        השלמת ה-standby ל-WARM_STANDBY דפדפנים ברקע
+        """
+        with self.lock:
+            missing = WARM_STANDBY - len(self.standby) - self._warming
+            if missing <= 0:
+                return
+            self._warming += missing
+        
+        for _ in range(missing):
+            threading.Thread(target=self._warm_one, name='browser-standby', daemon=True).start()
+    
+    def _warm_one(self):
+        driver = None
+        try:
+            driver = init_browser()
+        except Exception as e:
+            logger.error(f"Standby browser failed to start: {e}")
+        finally:
+            with self.lock:
+                self._warming -= 1
+                if driver is not None:
+                    self.standby.append(driver)
+    
+    def recycle(self, session, reason):
+        """
+        החלפת הדפדפן של session בדפדפן חדש (מה-standby) - ה-session_id נשמר
+        """
+        session = session.root
+        with session.lock:
+            started = time.monotonic()
+            old = session.swap_driver(self.take_driver())
+            RECYCLES.labels(reason).inc()
+            logger.warning(
+                f"Recycled browser for session {session.id} ({reason}) "
+                f"in {int((time.monotonic() - started) * 1000)}ms"
+            )
+        
+        # דפדפן שקרס יכול להיתקע ב-quit - לא מעכבים את הבקשה
+        threading.Thread(target=quit_driver, args=(old,), name='browser-quit', daemon=True).start()
+    
+    def release(self, session_id):
+        """
+        סגירת session והחזרת המקום למאגר
+        """
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        
+        if session is None:
+            return False
+        
+        # הממתינים בתור מקבלים 503; הפקודה הנוכחית מסתיימת לפני סגירת הדפדפן
+        session.close_queues(f"Session {session_id} was released")
+        with session.lock:
+            session.quit()
+        
+        logger.info(f"Released browser session {session_id}")
+        return True
+    
+    def reap(self):
+        """
+        סגירת sessions שפג תוקפם (רק כאלה שאינם באמצע פקודה)
+        """
+        now = time.time()
+        with self.lock:
+            candidates = [s for s in self.sessions.values() if s.expired(now)]
+        
+        for session in candidates:
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                with self.lock:
+                    if self.sessions.get(session.id) is not session:
+                        continue
+                    del self.sessions[session.id]
+                session.close_queues(f"Session {session.id} expired")
+                session.quit()
+                logger.info(f"Reaped expired browser session {session.id}")
+            finally:
+                session.lock.release()
+    
+    def start_reaper(self):
+        with self.lock:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name='session-reaper', daemon=True)
+        self._reaper.start()
+    
+    def _reap_loop(self):
+        while True:
+            time.sleep(REAPER_INTERVAL)
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"Session reaper error: {e}")
+    
+    def check_health(self):
+        """
+        סבב watchdog: מיחזור דפדפנים שקרסו / דלפו / עברו את מכסת הניווטים,
+        וזריקת standby מתים
+        """
+        with self.lock:
+            sessions = list(self.sessions.values())
+            standby = list(self.standby)
+        
+        for session in sessions:
+            if not session.lock.acquire(blocking=False):
+                continue  # באמצע פקודה - נבדוק בסבב הבא
+            try:
+                if self.get(session.id) is not session or not session.tabs_idle():
+                    continue
+                with on_window(session.handle):
+                    reason = session.health_problem()
+                if reason and reason != 'crash' and session.tabs:
+                    continue  # מיחזור מונע היה סוגר טאבים פתוחים - ממתינים שייסגרו
+                if reason:
+                    self.recycle(session, reason)
+            except Exception as e:
+                logger.error(f"Watchdog failed to recycle session {session.id}: {e}")
+            finally:
+                session.lock.release()
+        
+        for driver in standby:
+            if probe_driver(driver):
+                continue
+            with self.lock:
+                if driver not in self.standby:
+                    continue
+                self.standby.remove(driver)
+            logger.warning("Dropped dead standby browser")
+            quit_driver(driver)
+        self.fill_standby()
+    
+    def start_watchdog(self):
+        if not WATCHDOG_INTERVAL:
+            return
+        with self.lock:
+            if self._watchdog is not None:
+                return
+            self._watchdog = threading.Thread(target=self._watchdog_loop, name='browser-watchdog', daemon=True)
+        self._watchdog.start()
+    
+    def _watchdog_loop(self):
+        while True:
+            time.sleep(WATCHDOG_INTERVAL)
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"Browser watchdog error: {e}")
+    
+    def stats(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            standby = len(self.standby)
+        return {
+            "size": self.size,
+            "active": len(sessions),
+            "available": max(self.size - len(sessions), 0),
+            "standby": standby,
+            "recycle_after_navigations": RECYCLE_AFTER_NAVIGATIONS,
+            "rss_limit_mb": BROWSER_RSS_LIMIT_MB,
+            "idle_timeout": SESSION_IDLE_TIMEOUT,
+            "max_lifetime": SESSION_MAX_LIFETIME,
+            "sessions": [s.info() for s in sessions]
+        }
+
+
+pool = BrowserPool(POOL_SIZE)
+ACTIVE_SESSIONS.set_function(lambda: len(pool.sessions))
+STANDBY_BROWSERS.set_function(lambda: len(pool.standby))
+REGISTRY.register(BrowserProcessCollector())
+
+
+class WarmUp:
+    """
+    הפעלה מוקדמת של דפדפן ה-default (וה-standby) כשה-worker עולה,
+    עם מדידת זמן לכל שלב - כדי שהבקשה הראשונה לא תשלם את ה-cold start
+    """
+    
+    def __init__(self):
+        self.state = 'pending'  # pending | warming | ready | failed | disabled
+        self.phases = {}  # phase -> ms
+        self.error = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+    
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.phases[name] = int(seconds * 1000)
+            STARTUP_SECONDS.labels(name).observe(seconds)
+    
+    def start(self, background=True):
+        """
+        התחלת ה-warm-up (פעם אחת לכל תהליך)
+        """
+        with self.lock:
+            if self.state != 'pending':
+                return
+            if not WARM_UP:
+                self.state = 'disabled'
+                self.done.set()
+                return
+            self.state = 'warming'
+        
+        if background:
+            threading.Thread(target=self._run, name='browser-warmup', daemon=True).start()
+        else:
+            self._run()
+    
+    def _run(self):
+        try:
+            with self.phase('total'):
+                with self.phase('session_open'):
+                    session = pool.open(DEFAULT_SESSION_ID)
+                with self.phase('first_blank_page'):
+                    with session.lease() as driver:
+                        open_url(driver, 'about:blank')
+                        wait_for_page(driver, 'load')
+            self.state = 'ready'
+            logger.info(f"✅ Warm-up done in {self.phases['total']}ms (pid {os.getpid()}): {self.phases}")
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            logger.error(f"Warm-up failed: {e}")
+        finally:
+            self.done.set()
+    
+    def wait(self, timeout=WARM_UP_WAIT):
+        """
+        המתנה ל-warm-up שכבר רץ (לא מתחיל אחד חדש)
+        """
+        if self.state == 'warming':
+            self.done.wait(timeout)
+    
+    @property
+    def ready(self):
+        # pending = לא רצים תחת gunicorn.conf.py / __main__ - הדפדפן יעלה בבקשה הראשונה
+        return self.state != 'warming'
+    
+    def info(self):
+        return {
+            "state": self.state,
+            "pid": os.getpid(),
+            "phases_ms": dict(self.phases),
+            "error": self.error
+        }
+
+
+warmup = WarmUp()
+
+
+def _requested_session_id():
+    """
+    session_id מה-header, מה-query או מגוף ה-JSON
+    """
+    session_id = request.headers.get('X-Session-Id') or request.args.get('session_id')
+    if not session_id and request.is_json:
+        session_id = (request.get_json(silent=True) or {}).get('session_id')
+    return session_id
+
+
+def _requested_tab_id():
+    """
+    tab_id מה-header, מה-query או מגוף ה-JSON
+    """
+    tab_id = request.headers.get('X-Tab-Id') or request.args.get('tab_id')
+    if not tab_id and request.is_json:
+        tab_id = (request.get_json(silent=True) or {}).get('tab_id')
+    return tab_id
+
+
+def _get_session(create=False):
+    """
+    מציאת ה-session של הבקשה (או הטאב שלה, אם נשלח tab_id)
+    
+    Returns:
+        (session, None) או (None, error_response)
+    """
+    session, error = _get_browser_session(create)
+    tab_id = _requested_tab_id()
+    if error or not tab_id:
+        return session, error
+    
+    tab = session.tabs.get(tab_id)
+    if tab is None:
+        return None, (jsonify({"error": f"Unknown tab: {tab_id}"}), 404)
+    return tab, None
+
+
+def _get_browser_session(create=False):
+    session_id = _requested_session_id()
+    
+    if session_id:
+        session = pool.get(session_id)
+        if session is None:
+            return None, (jsonify({"error": f"Unknown session: {session_id}"}), 404)
+        return session, None
+    
+    session = pool.get(DEFAULT_SESSION_ID)
+    if session is None:
+        # הדפדפן עוד עולה - לא מפעילים Chrome שני במקביל
+        warmup.wait()
+        session = pool.get(DEFAULT_SESSION_ID)
+    if session is None:
+        if not create:
+            return None, (jsonify({"error": "Browser not initialized"}), 400)
+        try:
+            session = pool.open(DEFAULT_SESSION_ID)
+        except PoolExhausted as e:
+            return None, (jsonify({"error": str(e)}), 503)
+    return session, None
+
+
+def check_wait_until(wait_until):
+    """
+    בדיקת ערך wait_until - זורק ValueError אם לא מוכר
+    """
+    if wait_until is None or wait_until in WAIT_CONDITIONS:
+        return
+    if wait_until.startswith('selector:') and len(wait_until) > len('selector:'):
+        return
+    raise ValueError(
+        f"Unknown wait_until: {wait_until} "
+        f"(expected one of {', '.join(WAIT_CONDITIONS)} or selector:<css>)"
+    )
+
+
+# מסמן את המסמך הנוכחי לפני ניווט: עם PAGE_LOAD_STRATEGY=none ה-get חוזר מיד, ו-wait_for_page
+# לא צריך להתבלבל מה-readyState של הדף הישן. ניווט ל-#hash באותו מסמך מוריד את הסימון.
+MARK_STALE_SCRIPT = """
+window.__embassyStale = true;
+const clear = () => { delete window.__embassyStale; };
+window.addEventListener('hashchange', clear, {once: true});
+window.addEventListener('popstate', clear, {once: true});
+"""
+
+
+def open_url(driver, url):
+    """
+    driver.get אחרי סימון המסמך הקודם (ההמתנה עצמה - wait_for_page)
+    """
+    try:
+        driver.execute_script(MARK_STALE_SCRIPT)
+    except WebDriverException:
+        pass  # אין מסמך שאפשר להריץ בו סקריפט (דף שגיאה, data:)
+    driver.get(url)
+
+
+def _fresh(condition):
+    # התנאי נבדק רק על המסמך החדש (לא על זה שסומן לפני הניווט)
+    def fresh(driver):
+        return driver.execute_script('return !window.__embassyStale') and condition(driver)
+    return fresh
+
+
+def _document_ready(states):
+    def condition(driver):
+        return driver.execute_script('return document.readyState') in states
+    return condition
+
+
+def _network_idle(driver):
+    # אין בקשות חדשות (resource entries) במשך NETWORK_IDLE_WINDOW_MS אחרי load
+    return driver.execute_script("""
+        const count = performance.getEntriesByType('resource').length;
+        const now = performance.now();
+        const idle = window.__embassyIdle || (window.__embassyIdle = {count: -1, since: now});
+        if (idle.count !== count) {
+            idle.count = count;
+            idle.since = now;
+        }
+        return document.readyState === 'complete' && now - idle.since >= arguments[0];
+    """, NETWORK_IDLE_WINDOW_MS)
+
+
+def wait_for_page(driver, wait_until, timeout=DEFAULT_WAIT_TIMEOUT, previous_url=None):
+    """
+    המתנה מבוססת אירועים במקום sleep קבוע
+    
+    Args:
+        wait_until: none | domcontentloaded | load | networkidle | selector:<css> | url-change
+        timeout: מקסימום שניות להמתנה
+        previous_url: הכתובת לפני הפעולה (עבור url-change)
+    
+    Returns:
+        {"wait_until": ..., "waited_ms": ..., "timed_out": bool}
+    """
+    check_wait_until(wait_until)
+    started = time.monotonic()
+    timed_out = False
+    
+    if wait_until and wait_until != 'none':
+        if wait_until == 'domcontentloaded':
+            condition = _document_ready(('interactive', 'complete'))
+        elif wait_until == 'load':
+            condition = _document_ready(('complete',))
+        elif wait_until == 'networkidle':
+            condition = _network_idle
+        elif wait_until == 'url-change':
+            condition = EC.url_changes(previous_url)
+        else:
+            condition = EC.presence_of_element_located(
+                (By.CSS_SELECTOR, wait_until[len('selector:'):])
+            )
+        if wait_until != 'url-change':
+            condition = _fresh(condition)
+        
+        # בזמן מעבר בין דפים הסקריפט יכול להיכשל - ממשיכים לנסות
+        wait = WebDriverWait(
+            driver,
+            timeout,
+            poll_frequency=0.1,
+            ignored_exceptions=(JavascriptException, NoSuchElementException, StaleElementReferenceException)
+        )
+        try:
+            wait.until(condition)
+        except TimeoutException:
+            timed_out = True
+            logger.warning(f"Wait for {wait_until} timed out after {timeout}s")
+    
+    waited = time.monotonic() - started
+    WAIT_SECONDS.labels(wait_until or 'none', str(timed_out).lower()).observe(waited)
+    
+    return {
+        "wait_until": wait_until or 'none',
+        "waited_ms": round(waited * 1000),
+        "timed_out": timed_out
+    }
+
+
+def resolve_resource_profile(profile):
+    """
+    פרופיל לפי שם או הגדרה ישירה {"block_types": [...], "block_urls": [...]}
+    
+    Returns:
+        (name, url_patterns)
+    """
+    if isinstance(profile, dict):
+        name, spec = 'custom', profile
+    elif profile in RESOURCE_PROFILES:
+        name, spec = profile, RESOURCE_PROFILES[profile]
+    else:
+        raise ValueError(f"Unknown resource profile: {profile} (expected one of {', '.join(RESOURCE_PROFILES)} or an object)")
+    
+    block_types = spec.get('block_types', [])
+    unknown = [t for t in block_types if t not in RESOURCE_TYPE_PATTERNS]
+    if unknown:
+        raise ValueError(f"Unknown resource types: {', '.join(unknown)} (expected {', '.join(RESOURCE_TYPE_PATTERNS)})")
+    
+    patterns = []
+    for resource_type in block_types:
+        for extension in RESOURCE_TYPE_PATTERNS[resource_type]:
+            patterns += [f'*.{extension}', f'*.{extension}?*']
+    patterns += list(spec.get('block_urls', []))
+    return name, patterns
+
+
+def apply_resource_profile(session, profile):
+    """
+    הפעלת פרופיל חסימה על הדפדפן של ה-session (נשאר בתוקף עד שמחליפים)
+    """
+    name, patterns = resolve_resource_profile(profile)
+    if patterns == session.blocked_urls:
+        session.resource_profile = name
+        return
+    
+    block_urls(session.driver, patterns)
+    session.resource_profile = name
+    session.blocked_urls = patterns
+    logger.info(f"Session {session.id} resource profile: {name} ({len(patterns)} patterns)")
+
+
+def drain_cdp_events(session, stash=False):
+    """
+    קריאת אירועי ה-CDP שהצטברו ב-performance log מאז הקריאה הקודמת
+    
+    ה-log משותף לכל הטאבים: כשיש טאבים, מחזיר רק את האירועים של החלון של session
+    ושומר את של השאר עד שהם יקראו. frames של screencast הולכים ל-Screencast שלהם.
+    
+    Args:
+        stash: לשמור את כל האירועים לקורא הבא במקום להחזיר אותם (ה-screencast שואב את ה-log)
+    """
+    root = session.root
+    try:
+        entries = session.driver.get_log('performance')
+    except Exception:
+        return []
+    
+    with root.cdp_lock:
+        events = []
+        for entry in entries:
+            try:
+                data = json.loads(entry['message'])
+                message = data['message']
+            except (KeyError, ValueError):
+                continue
+            webview = data.get('webview')
+            if message.get('method') == 'Page.screencastFrame':
+                cast = root.screencasts.get(webview) or root.screencasts.get(None)
+                if cast is not None:
+                    cast.push(message.get('params', {}))
+            elif root.tabs:
+                root.cdp_backlog.setdefault(webview, []).append(message)
+            elif stash:
+                root.cdp_backlog.setdefault(None, []).append(message)
+            else:
+                events.append(message)
+        
+        if stash:
+            for backlog in root.cdp_backlog.values():
+                del backlog[:-CDP_BACKLOG_LIMIT]
+            return []
+        
+        if root.tabs or root.cdp_backlog:
+            events = root.cdp_backlog.pop(webview_id(session.handle), []) + events
+            if session is root:
+                # אירועים בלי webview או מלפני שהחלון הראשי הוכר
+                events = root.cdp_backlog.pop(None, []) + events
+    return events
+
+
+def document_status(events):
+    """
+    קוד ה-HTTP של המסמך הראשי (ה-Document הראשון שהתקבל - iframes מגיעים אחריו)
+    """
+    for event in events:
+        params = event.get('params', {})
+        if event.get('method') == 'Network.responseReceived' and params.get('type') == 'Document':
+            return params.get('response', {}).get('status')
+    return None
+
+
+def network_stats(events):
+    """
+    סיכום בקשות הרשת: כמה נשלחו, נחסמו, הושלמו וכמה bytes הועברו
+    """
+    stats = {"requests": 0, "allowed": 0, "blocked": 0, "failed": 0, "bytes": 0}
+    for event in events:
+        method = event.get('method')
+        params = event.get('params', {})
+        if method == 'Network.requestWillBeSent':
+            stats["requests"] += 1
+        elif method == 'Network.loadingFinished':
+            stats["allowed"] += 1
+            stats["bytes"] += int(params.get('encodedDataLength', 0))
+        elif method == 'Network.loadingFailed':
+            if params.get('blockedReason'):
+                stats["blocked"] += 1
+            else:
+                stats["failed"] += 1
+    return stats
+
+
+@app.route('/')
+def home():
+    """
+    דף בית
+    """
+    return jsonify({
+        "service": "Browser Embassy V5 with VNC",
+        "status": "operational",
+        "description": "Remote browser automation with visual control",
+        "vnc_url": "/vnc",
+        "vnc_password": "browser123",
+        "endpoints": {
+            "/navigate": "Navigate to URL",
+            "/screenshot": "Get current page screenshot",
+            "/screencast": "Live MJPEG stream of the page (view-only, repaints only)",
+            "/extract_fields": "Extract form fields",
+            "/fill_field": "Fill a form field",
+            "/click": "Click an element",
+            "/get_html": "Get page HTML",
+            "/execute_js": "Execute JavaScript (inline, or a registered script_id with args)",
+            "/scripts": "Register (POST), list (GET) and run (POST /scripts/<id>/run) reusable scripts",
+            "/batch": "Run a sequence of actions in one request",
+            "/fetch_many": "Load many URLs in parallel, results streamed as NDJSON",
+            "/jobs": "Run an action in the background (POST), poll the result (GET /jobs/<id>?wait=30)",
+            "/status": "Browser status",
+            "/metrics": "Prometheus metrics",
+            "/sessions": "Open (POST), list (GET) or release (DELETE /sessions/<id>) browser sessions",
+            "/tabs": "Open (POST), list (GET) or close (DELETE /tabs/<id>) tabs; address one with X-Tab-Id",
+            "/auth_snapshots": "Cached logins (GET), clear them (DELETE, ?identity=...)",
+            "/page_cache": "Rendered-page cache stats and hit rate (GET), clear it (DELETE, ?url=...)",
+            "/recipes": "Register (POST), list (GET) and run (POST /recipes/<name>/run) declarative flows",
+            "/vnc": "noVNC web interface (visual browser control)"
+        }
+    })
+
+
+@app.route('/vnc')
+def vnc_page():
+    """
+    דף גישה ל-noVNC דרך iframe
+    """
+    return '''
+    <!DOCTYPE html>
+    <html dir="rtl" lang="he">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>Browser Embassy - VNC Access</title>
+        <style>
+            * { margin: 0; padding: 0; box-sizing: border-box; }
+            body {
+                font-family: Arial, sans-serif;
+                background: #1a1a2e;
+                color: white;
+                overflow: hidden;
+            }
+            .header {
+                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                padding: 15px 30px;
+                display: flex;
+                justify-content: space-between;
+                align-items: center;
+                box-shadow: 0 2px 10px rgba(0,0,0,0.3);
+            }
+            .header h1 {
+                font-size: 1.5em;
+                display: flex;
+                align-items: center;
+                gap: 10px;
+            }
+            .status {
+                background: rgba(76, 175, 80, 0.2);
+                padding: 8px 16px;
+                border-radius: 20px;
+                font-size: 0.9em;
+            }
+            .status::before {
+                content: "●";
+                color: #4CAF50;
+                margin-left: 8px;
+                animation: pulse 2s infinite;
+            }
+            @keyframes pulse {
+                0%, 100% { opacity: 1; }
+                50% { opacity: 0.5; }
+            }
+            .vnc-container {
+                width: 100vw;
+                height: calc(100vh - 70px);
+                background: #000;
+            }
+            iframe {
+                width: 100%;
+                height: 100%;
+                border: none;
+            }
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>🖥️ Browser Embassy - VNC Console</h1>
+            <div class="status">מחובר</div>
+        </div>
+        <div class="vnc-container">
+            <iframe src="/novnc/vnc.html?path=novnc/websockify" allow="clipboard-read; clipboard-write"></iframe>
+        </div>
+    </body>
+    </html>
+    '''
+
+# ==================== noVNC proxy ====================
+
+NOVNC_HOST = 'localhost'
+NOVNC_PORT = int(os.environ.get('NOVNC_PORT', 6080))
+NOVNC_CACHE_MAX_BYTES = int(os.environ.get('NOVNC_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+# כל viewer מחזיק thread של gunicorn לכל אורך החיבור - משאירים threads לבקשות ה-API
+NOVNC_MAX_VIEWERS = int(os.environ.get('NOVNC_MAX_VIEWERS', 2))
+
+# headers שלא עוברים דרך proxy (RFC 7230 hop-by-hop + host)
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade', 'host'
+}
+
+# קבצים סטטיים של noVNC שנשמרים בזיכרון
+NOVNC_STATIC_EXTENSIONS = (
+    '.html', '.js', '.mjs', '.css', '.json', '.png', '.svg', '.ico',
+    '.woff', '.woff2', '.ttf', '.oga', '.mp3'
+)
+
+# חיבור אחד משותף (keep-alive) ל-websockify
+novnc_http = requests.Session()
+novnc_http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=16))
+
+novnc_viewers = threading.BoundedSemaphore(NOVNC_MAX_VIEWERS)
+
+
+class StaticAssetCache:
+    """
+    מטמון בזיכרון לקבצים הסטטיים של noVNC, עם ETag לתשובות 304
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = {}
+        self.size = 0
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            return self.entries.get(key)
+    
+    def put(self, key, body, headers):
+        entry = {
+            "body": body,
+            "headers": headers,
+            "etag": hashlib.sha1(body).hexdigest()
+        }
+        with self.lock:
+            if key not in self.entries and self.size + len(body) <= self.max_bytes:
+                self.entries[key] = entry
+                self.size += len(body)
+        return entry
+
+
+novnc_cache = StaticAssetCache(NOVNC_CACHE_MAX_BYTES)
+
+
+def _upstream_headers():
+    return {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+
+def _novnc_static(path, url):
+    """
+    קובץ סטטי - מהמטמון, או 304 אם ל-browser כבר יש אותו
+    """
+    key = request.full_path
+    entry = novnc_cache.get(key)
+    
+    if entry is None:
+        headers = {k: v for k, v in _upstream_headers().items()
+                   if k.lower() not in ('if-none-match', 'if-modified-since')}
+        upstream = novnc_http.get(url, headers=headers, timeout=30)
+        if upstream.status_code != 200:
+            return Response(upstream.content, status=upstream.status_code,
+                            content_type=upstream.headers.get('content-type'))
+        
+        # requests כבר פתח את ה-content-encoding - שומרים רק את ה-headers הרלוונטיים
+        kept = {k: v for k, v in upstream.headers.items()
+                if k.lower() in ('content-type', 'last-modified')}
+        entry = novnc_cache.put(key, upstream.content, kept)
+    
+    etag = f'"{entry["etag"]}"'
+    if request.if_none_match.contains(entry['etag']):
+        return Response(status=304, headers={"ETag": etag})
+    
+    return Response(
+        entry['body'] if request.method == 'GET' else b'',
+        headers={**entry['headers'], "ETag": etag, "Cache-Control": "no-cache"}
+    )
+
+
+class _HijackedResponse(Response):
+    """
+    תשובה לחיבור WebSocket שכבר טופל ישירות על ה-socket - לא כותבים עליו כלום
+    """
+    
+    def __call__(self, environ, start_response):
+        if 'gunicorn.socket' in environ:
+            raise StopIteration()  # gunicorn סוגר את החיבור בשקט
+        raise ConnectionError("WebSocket tunnel closed")  # שרת הפיתוח של werkzeug
+
+
+def _pump(client_sock, upstream_sock):
+    """
+    העברת bytes בשני הכיוונים עד שאחד הצדדים סוגר
+    """
+    peers = {client_sock: upstream_sock, upstream_sock: client_sock}
+    try:
+        while True:
+            readable, _, broken = select.select(list(peers), [], list(peers))
+            if broken:
+                return
+            for sock in readable:
+                data = sock.recv(65536)
+                if not data:
+                    return
+                peers[sock].sendall(data)
+    except OSError:
+        return
+
+
+def _novnc_websocket(path):
+    """
+    העברת WebSocket (‏RFB של noVNC) ל-websockify דרך אותו port חיצוני
+    
+    ה-handshake נשלח כמו שהוא ל-websockify, ומשם ה-socket של ה-client
+    מחובר ישירות ל-socket של websockify.
+    """
+    client_sock = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+    if client_sock is None:
+        return jsonify({"error": "WebSocket proxying is not supported by this server"}), 501
+    
+    if not novnc_viewers.acquire(blocking=False):
+        return jsonify({"error": f"Too many VNC viewers (max {NOVNC_MAX_VIEWERS}) - use port {NOVNC_PORT} directly"}), 503
+    try:
+        return _novnc_tunnel(client_sock, path)
+    finally:
+        novnc_viewers.release()
+
+
+def _novnc_tunnel(client_sock, path):
+    """
+    ה-handshake ל-websockify והמנהרה עצמה - רץ עד שה-viewer מתנתק
+    """
+    try:
+        upstream_sock = socket.create_connection((NOVNC_HOST, NOVNC_PORT), timeout=10)
+    except OSError as e:
+        logger.error(f"noVNC websocket connect error: {e}")
+        return jsonify({"error": str(e)}), 502
+    
+    target = f'/{path}'
+    if request.query_string:
+        target += '?' + request.query_string.decode('latin-1')
+    
+    lines = [f'GET {target} HTTP/1.1', f'Host: {NOVNC_HOST}:{NOVNC_PORT}']
+    lines += [f'{k}: {v}' for k, v in request.headers.items() if k.lower() != 'host']
+    
+    try:
+        upstream_sock.sendall(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        upstream_sock.settimeout(None)
+        client_sock.settimeout(None)
+        NOVNC_VIEWERS.inc()
+        try:
+            _pump(client_sock, upstream_sock)
+        finally:
+            NOVNC_VIEWERS.dec()
+    finally:
+        upstream_sock.close()
+    
+    return _HijackedResponse()
+
+
+@app.route('/websockify', websocket=True)
+@app.route('/novnc/<path:path>', websocket=True)
+@app.route('/novnc/', methods=['GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
+@app.route('/novnc/<path:path>', methods=['GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
+def novnc_proxy(path=''):
+    """
+    Proxy ל-noVNC דרך Flask
+    
+    - WebSocket (Upgrade) - מנהרה ישירה ל-websockify
+    - קבצים סטטיים - מטמון בזיכרון עם ETag/304
+    - כל השאר - streaming עם העברת headers
+    """
+    if request.path == '/websockify':
+        path = 'websockify'
+    
+    if request.headers.get('Upgrade', '').lower() == 'websocket':
+        return _novnc_websocket(path)
+    
+    novnc_url = f'http://{NOVNC_HOST}:{NOVNC_PORT}/{path}'
+    if request.query_string:
+        novnc_url += '?' + request.query_string.decode('latin-1')
+    
+    try:
+        if request.method in ('GET', 'HEAD') and (path == '' or path.endswith(NOVNC_STATIC_EXTENSIONS)):
+            return _novnc_static(path, novnc_url)
+        
+        # העבר את הבקשה ל-noVNC
+        upstream = novnc_http.request(
+            request.method,
+            novnc_url,
+            headers=_upstream_headers(),
+            data=request.get_data(),
+            stream=True,
+            allow_redirects=False,
+            timeout=30
+        )
+        
+        def body():
+            try:
+                yield from upstream.raw.stream(8192, decode_content=False)
+            finally:
+                upstream.close()
+        
+        # החזר את התשובה
+        return Response(
+            body(),
+            status=upstream.status_code,
+            headers=[(k, v) for k, v in upstream.raw.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+        )
+    except Exception as e:
+        logger.error(f"noVNC proxy error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/status')
+def status():
+    """
+    בדיקת סטטוס הדפדפן
+    
+    readiness gate: עד שה-warm-up של ה-worker מסתיים מחזיר 503
+    """
+    if not warmup.ready:
+        return jsonify({
+            "browser": "warming_up",
+            "ready": False,
+            "warmup": warmup.info(),
+            "pool": pool.stats()
+        }), 503
+    
+    session, error = _get_session()
+    
+    if session is None:
+        return jsonify({
+            "browser": "not_initialized",
+            "ready": False,
+            "warmup": warmup.info(),
+            "pool": pool.stats()
+        })
+    
+    # לא ממתינים לדפדפן שבאמצע פעולה ארוכה - health check צריך לחזור מיד
+    if not session.lock.acquire(blocking=False):
+        return jsonify({
+            "browser": "busy",
+            "ready": True,
+            "session_id": session.id,
+            "warmup": warmup.info(),
+            "pool": pool.stats()
+        })
+    
+    try:
+        pending = session.pending_page
+        if pending is not None:
+            # הדף הוגש מ-page_cache ועוד לא נטען בדפדפן - health check לא טוען אותו
+            current_url, title = pending['entry']['final_url'], pending['entry']['title']
+        else:
+            with on_window(session.handle):
+                current_url = session.driver.current_url
+                title = session.driver.title
+        
+        return jsonify({
+            "browser": "ready",
+            "ready": True,
+            "session_id": session.id,
+            "current_url": current_url,
+            "page_title": title,
+            "pending_page": pending is not None,
+            "warmup": warmup.info(),
+            "pool": pool.stats()
+        })
+    except Exception as e:
+        if browser_crashed(e):
+            try:
+                pool.recycle(session, 'crash')
+                return jsonify({
+                    "browser": "recycled",
+                    "ready": True,
+                    "session_id": session.id,
+                    "error": str(e),
+                    "warmup": warmup.info(),
+                    "pool": pool.stats()
+                })
+            except Exception as recycle_error:
+                logger.error(f"Recycle after crash failed: {recycle_error}")
+        return jsonify({
+            "browser": "error",
+            "ready": False,
+            "error": str(e),
+            "warmup": warmup.info(),
+            "pool": pool.stats()
+        })
+    finally:
+        session.lock.release()
+
+
+@app.route('/metrics')
+def metrics():
+    """
+    מדדים בפורמט Prometheus: זמני בקשות, פקודות WebDriver, המתנות, קידוד,
+    גודל תשובות, sessions פעילים, זיכרון/CPU של הדפדפנים ושגיאות
+    """
+    return Response(generate_latest(REGISTRY), mimetype=CONTENT_TYPE_LATEST)
+
+
+@app.route('/sessions', methods=['POST'])
+def open_session():
+    """
+    פתיחת session חדש עם דפדפן משלו מהמאגר
+    
+    Body (אופציונלי):
+        {"profile": "lite"}  // פרופיל חסימת משאבים: full|no-trackers|lite|text או אובייקט
+    
+    Returns:
+        {"session_id": "..."} - לשלוח בכל קריאה (header X-Session-Id או שדה session_id)
+    """
+    profile = (request.get_json(silent=True) or {}).get('profile')
+    
+    try:
+        if profile is not None:
+            resolve_resource_profile(profile)
+        session = pool.open(profile=profile)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except PoolExhausted as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        logger.error(f"Open session error: {e}")
+        return jsonify({"error": str(e)}), 500
+    
+    return jsonify({
+        "success": True,
+        "session_id": session.id,
+        "resource_profile": session.resource_profile
+    }), 201
+
+
+@app.route('/sessions/<session_id>/profile', methods=['POST'])
+def set_session_profile(session_id):
+    """
+    החלפת פרופיל חסימת המשאבים של session
+    
+    Body:
+        {"profile": "text"}  // או {"profile": {"block_types": ["image"], "block_urls": ["*ads*"]}}
+    """
+    session = pool.get(session_id)
+    if session is None:
+        return jsonify({"error": f"Unknown session: {session_id}"}), 404
+    
+    profile = (request.json or {}).get('profile')
+    if profile is None:
+        return jsonify({"error": "profile is required"}), 400
+    
+    try:
+        with session.lease():
+            apply_resource_profile(session, profile)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except AdmissionError:
+        raise
+    except Exception as e:
+        logger.error(f"Set profile error: {e}")
+        return jsonify({"error": str(e)}), 500
+    
+    return jsonify({
+        "success": True,
+        "session_id": session.id,
+        "resource_profile": session.resource_profile,
+        "blocked_patterns": len(session.blocked_urls)
+    })
+
+
+@app.route('/sessions', methods=['GET'])
+def list_sessions():
+    """
+    רשימת ה-sessions הפתוחים במאגר
+    """
+    return jsonify(pool.stats())
+
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def release_session(session_id):
+    """
+    שחרור session וסגירת הדפדפן שלו
+    """
+    if not pool.release(session_id):
+        return jsonify({"error": f"Unknown session: {session_id}"}), 404
+    
+    return jsonify({
+        "success": True,
+        "session_id": session_id,
+        "released": True
+    })
+
+
+@app.route('/tabs', methods=['POST'])
+def open_tab():
+    """
+    פתיחת טאב חדש בדפדפן של ה-session (בלי Chrome נוסף)
+    
+    Body (אופציונלי):
+        {"url": "https://example.com", "wait_until": "load"}  // ניווט ראשון בטאב
+    
+    Returns:
+        {"tab_id": "..."} - לשלוח בקריאות הבאות (header X-Tab-Id או שדה tab_id)
+    """
+    session, error = _get_browser_session(create=True)
+    if error:
+        return error
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        tab = session.open_tab()
+    except PoolExhausted as e:
+        return jsonify({"error": str(e)}), 503
+    except AdmissionError:
+        raise
+    except Exception as e:
+        logger.error(f"Open tab error: {e}")
+        return jsonify({"error": str(e)}), 500
+    
+    response = {"success": True, "session_id": session.id, "tab_id": tab.tab_id}
+    if data.get('url'):
+        with tab.lease(cached=True):
+            result, status = run_action(tab, 'navigate', data)
+        response["navigate"] = result
+    return jsonify(response), 201
+
+
+@app.route('/tabs', methods=['GET'])
+def list_tabs():
+    """
+    הטאבים הפתוחים ב-session
+    """
+    session, error = _get_browser_session()
+    if error:
+        return error
+    return jsonify({
+        "session_id": session.id,
+        "max_tabs": MAX_TABS_PER_SESSION,
+        "tabs": [tab.info() for tab in list(session.tabs.values())]
+    })
+
+
+@app.route('/tabs/<tab_id>', methods=['DELETE'])
+def close_tab(tab_id):
+    """
+    סגירת טאב
+    """
+    session, error = _get_browser_session()
+    if error:
+        return error
+    if not session.close_tab(tab_id):
+        return jsonify({"error": f"Unknown tab: {tab_id}"}), 404
+    return jsonify({"success": True, "session_id": session.id, "tab_id": tab_id, "closed": True})
+
+
+# ==================== Actions ====================
+#
+# כל פעולה על הדפדפן רשומה ב-ACTIONS ומקבלת (session, data).
+# ה-endpoints, ‏/batch ושאר המנגנונים מריצים אותן דרך run_action.
+
+class ActionError(Exception):
+    """
+    שגיאה בפרמטרים של פעולה - מוחזרת ל-client עם status מתאים (ו-details בגוף התשובה)
+    """
+    
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.status = status
+        self.details = details or {}
+
+
+BrowserAction = namedtuple('BrowserAction', ['func', 'label', 'create'])
+
+ACTIONS = {}
+
+
+def browser_action(name, label, create=False):
+    """
+    רישום פעולה ב-ACTIONS
+    
+    Args:
+        name: שם הפעולה (כמו ה-endpoint)
+        label: שם לשורת הלוג בשגיאה
+        create: האם לפתוח את דפדפן ברירת המחדל אם עוד לא קיים
+    """
+    def register(func):
+        ACTIONS[name] = BrowserAction(func, label, create)
+        return func
+    return register
+
+
+def run_action(session, name, data):
+    """
+    הרצת פעולה אחת על session שכבר מושכר
+    
+    Returns:
+        (result, status)
+    """
+    action = ACTIONS[name]
+    try:
+        if session.pending_page is not None and name not in PAGE_CACHE_ACTIONS:
+            materialize_page(session)
+        return action.func(session, data), 200
+    except ActionError as e:
+        return {**e.details, "error": str(e)}, e.status
+    except Exception as e:
+        logger.error(f"{action.label} error: {e}")
+        ERRORS.labels(name, type(e).__name__).inc()
+        if browser_crashed(e):
+            # הדפדפן מת - מחליפים אותו כבר עכשיו, הבקשה הבאה תעבוד
+            try:
+                pool.recycle(session.root, 'crash')
+                return {"error": str(e), "recycled": True}, 503
+            except Exception as recycle_error:
+                logger.error(f"Recycle after crash failed: {recycle_error}")
+        return {"error": str(e)}, 500
+
+
+def _action_response(name, data):
+    """
+    הרצת פעולה מתוך endpoint והחזרת תשובת JSON
+    """
+    session, error = _get_session(create=ACTIONS[name].create)
+    if error:
+        return error
+    
+    with session.lease(cached=True):
+        result, status = run_action(session, name, data or {})
+    result["queue_wait_ms"] = round(g.queue_wait * 1000)
+    return jsonify(result), status
+
+
+def _wait_params(data, default):
+    """
+    wait_until ו-timeout מגוף הבקשה
+    """
+    wait_until = data.get('wait_until', default)
+    try:
+        check_wait_until(wait_until)
+        timeout = float(data.get('timeout', DEFAULT_WAIT_TIMEOUT))
+    except ValueError as e:
+        raise ActionError(str(e))
+    return wait_until, timeout
+
+
+def find_element(driver, method, selector):
+    """
+    מציאת אלמנט לפי method: id, name, xpath או css (ברירת מחדל)
+    """
+    if method == 'id':
+        return driver.find_element(By.ID, selector)
+    elif method == 'name':
+        return driver.find_element(By.NAME, selector)
+    elif method == 'xpath':
+        return driver.find_element(By.XPATH, selector)
+    else:  # css
+        return driver.find_element(By.CSS_SELECTOR, selector)
+
+
+class ElementLookup:
+    """
+    חיפוש אלמנטים דרך מטמון ה-session, עם ספירת hits/misses לבקשה הנוכחית
+    """
+    
+    def __init__(self, session):
+        self.session = session
+        self.hits = 0
+        self.misses = 0
+    
+    def _find(self, method, selector, timeout):
+        driver = self.session.driver
+        if not timeout:
+            return find_element(driver, method, selector)
+        return WebDriverWait(driver, timeout, ignored_exceptions=(NoSuchElementException,)).until(
+            lambda d: find_element(d, method, selector)
+        )
+    
+    def _resolve(self, method, selector, timeout):
+        session = self.session
+        element = session.element_cache.get((method, selector))
+        if element is not None:
+            self.hits += 1
+            session.element_hits += 1
+            return element
+        
+        element = self._find(method, selector, timeout)
+        session.element_cache[(method, selector)] = element
+        self.misses += 1
+        session.element_misses += 1
+        return element
+    
+    def run(self, method, selector, operation, timeout=0):
+        """
+        הרצת operation(element) - אם האלמנט מהמטמון כבר stale, מחפש מחדש ומנסה שוב
+        
+        Args:
+            timeout: כמה שניות להמתין שהאלמנט יופיע אם הוא לא במטמון (0 = בלי המתנה)
+        """
+        try:
+            return operation(self._resolve(method, selector, timeout))
+        except StaleElementReferenceException:
+            self.session.element_cache.pop((method, selector), None)
+            return operation(self._resolve(method, selector, timeout))
+    
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def invalidate_page_caches(session):
+    """
+    ניקוי מטמון האלמנטים אחרי מעבר דף
+    """
+    session.element_cache.clear()
+    session.pending_page = None
+
+
+# מטמון דפים מרונדרים (opt-in): navigate עם cache/max_age שומר HTML, טקסט, שדות ו-screenshot
+# לפי URL + פרופיל החסימה. פגיעה לא טוענת את הדף - get_html / extract_fields / screenshot
+# עונים מהמטמון, וכל פעולה אחרת טוענת את הדף באמת (materialize_page) לפני שהיא רצה.
+
+PAGE_CACHE_MB = int(os.environ.get('PAGE_CACHE_MB', 64))
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 600))
+
+# פעולות שמטפלות בעצמן בדף ממתין (השאר טוענות אותו קודם)
+PAGE_CACHE_ACTIONS = frozenset({'navigate', 'get_html', 'extract_fields', 'screenshot'})
+
+
+class PageCache:
+    """
+    LRU של דפים מרונדרים עם TTL ותקציב זיכרון
+    """
+    
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()  # (url, profile_hash) -> entry
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def key(url, blocked_urls):
+        profile_hash = hashlib.sha1(json.dumps(blocked_urls).encode('utf-8')).hexdigest()[:12]
+        return url, profile_hash
+    
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        self.size -= entry['bytes']
+    
+    def get(self, key, max_age):
+        """
+        ה-entry אם נשמר לפני max_age שניות לכל היותר (וגם בתוך ה-TTL), אחרת None
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry['stored_at'] > self.ttl:
+                self._drop(key)
+                entry = None
+            if entry is None or now - entry['stored_at'] > max_age:
+                self.misses += 1
+                PAGE_CACHE_REQUESTS.labels('miss').inc()
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        PAGE_CACHE_REQUESTS.labels('hit').inc()
+        return entry
+    
+    def put(self, key, entry):
+        entry['bytes'] = (len(entry['html']) + len(entry['text']) + len(json.dumps(entry['fields']))
+                          + len(entry['screenshot'][1] if entry['screenshot'] else b''))
+        if entry['bytes'] > self.max_bytes:
+            return False
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = entry
+            self.size += entry['bytes']
+            self.stores += 1
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+            PAGE_CACHE_BYTES.set(self.size)
+        return True
+    
+    def clear(self, url=None):
+        with self.lock:
+            keys = [key for key in self.entries if url is None or key[0] == url]
+            for key in keys:
+                self._drop(key)
+            PAGE_CACHE_BYTES.set(self.size)
+        return len(keys)
+    
+    def info(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "pages": [
+                    {"url": key[0], "profile": key[1], "age": round(time.time() - entry['stored_at'], 1),
+                     "bytes": entry['bytes'], "screenshot": entry['screenshot'] is not None}
+                    for key, entry in self.entries.items()
+                ]
+            }
+
+
+page_cache = PageCache(PAGE_CACHE_MB * 1024 * 1024, PAGE_CACHE_TTL)
+
+
+def capture_page(session, url, navigation, screenshot=None):
+    """
+    entry למטמון מהדף שנטען עכשיו (screenshot - אפשרויות צילום, או None בלי צילום)
+    """
+    driver = session.driver
+    fields = run_script(session, EXTRACT_FIELDS, [None])
+    session.fields_cache = fields  # extract_fields הבא על הדף החי לא יסרוק שוב
+    return {
+        "url": url,
+        "final_url": navigation['url'],
+        "title": navigation['title'],
+        "http_status": navigation['http_status'],
+        "html": driver.page_source,
+        "text": page_html(driver, {'mode': 'text'}),
+        "fields": fields,
+        "screenshot": (screenshot, capture_screenshot(driver, screenshot)) if screenshot else None,
+        "stored_at": time.time()
+    }
+
+
+def cached_page(session, usable=None):
+    """
+    ה-entry של דף ממתין אם אפשר לענות ממנו (usable(entry)), אחרת טעינת הדף האמיתי ו-None
+    """
+    pending = session.pending_page
+    if pending is None:
+        return None
+    if usable is None or usable(pending['entry']):
+        return pending['entry']
+    materialize_page(session)
+    return None
+
+
+def cached_screenshot(entry, options):
+    """
+    הצילום מה-entry אם צולם עם אותן אפשרויות, אחרת None
+    """
+    if entry['screenshot'] and entry['screenshot'][0] == options:
+        return entry['screenshot'][1]
+    return None
+
+
+def materialize_page(session):
+    """
+    טעינה אמיתית של דף שהוגש מהמטמון - לפני פעולה שצריכה את הדף החי
+    """
+    pending = session.pending_page
+    session.pending_page = None
+    driver = session.driver
+    logger.info(f"Loading cached page for real: {pending['url']}")
+    previous_url = driver.current_url
+    drain_cdp_events(session)
+    open_url(driver, pending['url'])
+    session.navigations += 1
+    wait_for_page(driver, pending['wait_until'], pending['timeout'], previous_url)
+    drain_cdp_events(session)
+
+
+@browser_action('navigate', 'Navigation', create=True)
+def do_navigate(session, data):
+    url = data.get('url')
+    
+    if not url:
+        raise ActionError("URL is required")
+    
+    wait_until, timeout = _wait_params(data, 'load')
+    driver = session.driver
+    
+    try:
+        max_age = float(data['max_age']) if data.get('max_age') is not None else None
+    except (TypeError, ValueError):
+        raise ActionError("max_age must be a number of seconds")
+    cache_screenshot = data.get('cache_screenshot')
+    use_cache = bool(data.get('cache') or max_age is not None or cache_screenshot)
+    
+    if data.get('profile') is not None:
+        try:
+            apply_resource_profile(session, data['profile'])
+        except ValueError as e:
+            raise ActionError(str(e))
+    
+    cache_key = page_cache.key(url, session.blocked_urls) if use_cache else None
+    if max_age is not None:
+        entry = page_cache.get(cache_key, max_age)
+        if entry is not None:
+            logger.info(f"Serving from page cache: {url}")
+            invalidate_page_caches(session)
+            session.pending_page = {"url": url, "wait_until": wait_until, "timeout": timeout, "entry": entry}
+            return {
+                "success": True,
+                "url": entry['final_url'],
+                "title": entry['title'],
+                "http_status": entry['http_status'],
+                "wait": {"wait_until": wait_until, "waited_ms": 0, "timed_out": False},
+                "resource_profile": session.resource_profile,
+                "network": network_stats([]),
+                "page_cache": {"hit": True, "age": round(time.time() - entry['stored_at'], 1)}
+            }
+    
+    logger.info(f"Navigating to: {url}")
+    previous_url = driver.current_url
+    invalidate_page_caches(session)
+    drain_cdp_events(session)  # אירועים מלפני הניווט לא נספרים
+    open_url(driver, url)
+    session.navigations += 1
+    wait = wait_for_page(driver, wait_until, timeout, previous_url)
+    events = drain_cdp_events(session)
+    
+    result = {
+        "success": True,
+        "url": driver.current_url,
+        "title": driver.title,
+        "http_status": document_status(events),
+        "wait": wait,
+        "resource_profile": session.resource_profile,
+        "network": network_stats(events)
+    }
+    
+    if use_cache:
+        # רק דפים שנטענו עד הסוף ובלי שגיאת HTTP
+        stored = False
+        if not wait['timed_out'] and (result['http_status'] or 200) < 400:
+            screenshot = None
+            if cache_screenshot:
+                screenshot = screenshot_options(cache_screenshot if isinstance(cache_screenshot, dict) else {})
+            stored = page_cache.put(cache_key, capture_page(session, url, result, screenshot))
+        result["page_cache"] = {"hit": False, "stored": stored}
+    
+    return result
+
+
+# פורמטים נתמכים לצילום מסך: format -> (Pillow, mimetype)
+SCREENSHOT_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp')
+}
+DEFAULT_SCREENSHOT_QUALITY = 80
+
+
+def _parse_clip(clip):
+    """
+    clip כ-"x,y,width,height", רשימה או {"x", "y", "width", "height"}
+    """
+    if clip is None or clip == '':
+        return None
+    try:
+        if isinstance(clip, str):
+            clip = clip.split(',')
+        if isinstance(clip, dict):
+            clip = [clip['x'], clip['y'], clip['width'], clip['height']]
+        x, y, width, height = (float(v) for v in clip)
+    except (KeyError, TypeError, ValueError):
+        raise ActionError("clip must be x,y,width,height")
+    if width <= 0 or height <= 0:
+        raise ActionError("clip width and height must be positive")
+    return x, y, width, height
+
+
+def screenshot_options(data):
+    """
+    קריאת אפשרויות צילום המסך מה-query או מגוף הבקשה
+    """
+    fmt = str(data.get('format') or 'png').lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in SCREENSHOT_FORMATS:
+        raise ActionError(f"Unknown format: {fmt} (expected png, jpeg or webp)")
+    
+    try:
+        quality = int(data.get('quality', DEFAULT_SCREENSHOT_QUALITY))
+        scale = float(data.get('scale', 1))
+        max_width = int(data['max_width']) if data.get('max_width') else None
+    except (TypeError, ValueError):
+        raise ActionError("quality, scale and max_width must be numbers")
+    
+    if not 1 <= quality <= 100:
+        raise ActionError("quality must be between 1 and 100")
+    if not 0 < scale <= 2:
+        raise ActionError("scale must be between 0 and 2")
+    
+    return {
+        "format": fmt,
+        "quality": quality,
+        "scale": scale,
+        "max_width": max_width,
+        "clip": _parse_clip(data.get('clip')),
+        "selector": data.get('selector'),
+        "method": data.get('method', 'css')
+    }
+
+
+def _encode_image(img, options):
+    """
+    קידוד תמונת Pillow לפי format ו-quality של האפשרויות
+    """
+    started = time.perf_counter()
+    pillow_format = SCREENSHOT_FORMATS[options['format']][0]
+    if pillow_format == 'JPEG':
+        img = img.convert('RGB')
+    buffer = BytesIO()
+    img.save(buffer, pillow_format, quality=options['quality'])
+    ENCODE_SECONDS.labels('image').observe(time.perf_counter() - started)
+    return buffer.getvalue()
+
+
+def capture_screenshot(driver, options):
+    """
+    צילום מסך לפי האפשרויות (format, quality, scale, max_width, clip, selector)
+    
+    Chrome מקודד בעצמו דרך Page.captureScreenshot; Pillow משמש כגיבוי
+    כש-CDP לא זמין (Remote WebDriver).
+    
+    Returns:
+        bytes של התמונה בפורמט המבוקש
+    """
+    fmt = options['format']
+    scale = options['scale']
+    clip = options['clip']
+    
+    if options['selector']:
+        rect = find_element(driver, options['method'], options['selector']).rect
+        clip = (rect['x'], rect['y'], rect['width'], rect['height'])
+    
+    # המקרה הפשוט - PNG מלא כמו שהדפדפן מחזיר, בלי קידוד נוסף
+    if fmt == 'png' and clip is None and scale == 1 and not options['max_width']:
+        return driver.get_screenshot_as_png()
+    
+    scroll_x, scroll_y, view_width, view_height = driver.execute_script(
+        'return [window.scrollX, window.scrollY, window.innerWidth, window.innerHeight]'
+    )
+    if clip is None:
+        clip = (scroll_x, scroll_y, view_width, view_height)
+    
+    if options['max_width'] and clip[2] * scale > options['max_width']:
+        scale = options['max_width'] / clip[2]
+    
+    if hasattr(driver, 'execute_cdp_cmd'):
+        params = {
+            "format": fmt,
+            "clip": {"x": clip[0], "y": clip[1], "width": clip[2], "height": clip[3], "scale": scale},
+            "captureBeyondViewport": True
+        }
+        if fmt != 'png':
+            params["quality"] = options['quality']
+        result = driver.execute_cdp_cmd('Page.captureScreenshot', params)
+        return base64.b64decode(result['data'])
+    
+    # גיבוי עם Pillow - חיתוך מתוך ה-viewport הנוכחי
+    img = Image.open(BytesIO(driver.get_screenshot_as_png()))
+    ratio = img.width / view_width  # devicePixelRatio
+    left = (clip[0] - scroll_x) * ratio
+    top = (clip[1] - scroll_y) * ratio
+    img = img.crop((round(left), round(top), round(left + clip[2] * ratio), round(top + clip[3] * ratio)))
+    
+    size = (max(round(clip[2] * scale), 1), max(round(clip[3] * scale), 1))
+    if img.size != size:
+        img = img.resize(size, Image.LANCZOS)
+    
+    return _encode_image(img, options)
+
+
+# screenshot delta - גודל tile וסף שמעליו שולחים תמונה מלאה
+DEFAULT_TILE_SIZE = 64
+KEYFRAME_RATIO = 0.6
+
+
+def encode_base64(data):
+    """
+    base64 למחרוזת, עם מדידת הזמן ב-/metrics
+    """
+    started = time.perf_counter()
+    encoded = base64.b64encode(data).decode('utf-8')
+    ENCODE_SECONDS.labels('base64').observe(time.perf_counter() - started)
+    return encoded
+
+
+def screenshot_delta(session, options, since=None, tile_size=DEFAULT_TILE_SIZE):
+    """
+    צילום מסך כהפרש מהצילום הקודם של ה-session
+    
+    התמונה מחולקת ל-tiles, ורק tiles שה-hash שלהם השתנה מאז frame מספר since
+    נשלחים. אם ה-client לא מחזיק את ה-frame האחרון (או שרוב המסך השתנה) -
+    נשלח keyframe מלא.
+    
+    Returns:
+        {"seq", "base_seq", "keyframe", "width", "height", "tile_size", "tiles": [{"x", "y", "data"}]}
+    """
+    img = Image.open(BytesIO(capture_screenshot(session.driver, options))).convert('RGB')
+    width, height = img.size
+    
+    boxes = [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in range(0, height, tile_size)
+        for x in range(0, width, tile_size)
+    ]
+    hashes = [hashlib.blake2b(img.crop(box).tobytes(), digest_size=8).digest() for box in boxes]
+    
+    previous = session.last_frame
+    session.frame_seq += 1
+    seq = session.frame_seq
+    session.last_frame = {"seq": seq, "size": img.size, "tile_size": tile_size, "hashes": hashes}
+    
+    can_diff = (
+        previous is not None
+        and since == previous['seq']
+        and previous['size'] == img.size
+        and previous['tile_size'] == tile_size
+    )
+    changed = [i for i, h in enumerate(hashes) if not can_diff or h != previous['hashes'][i]]
+    keyframe = not can_diff or len(changed) > len(boxes) * KEYFRAME_RATIO
+    
+    if keyframe:
+        tiles = [{"x": 0, "y": 0, "data": encode_base64(_encode_image(img, options))}]
+    else:
+        tiles = [
+            {"x": boxes[i][0], "y": boxes[i][1], "data": encode_base64(_encode_image(img.crop(boxes[i]), options))}
+            for i in changed
+        ]
+    
+    return {
+        "seq": seq,
+        "base_seq": None if keyframe else since,
+        "keyframe": keyframe,
+        "width": width,
+        "height": height,
+        "tile_size": tile_size,
+        "changed_tiles": len(boxes) if keyframe else len(changed),
+        "total_tiles": len(boxes),
+        "tiles": tiles
+    }
+
+
+@browser_action('screenshot', 'Screenshot')
+def do_screenshot(session, data):
+    options = screenshot_options(data)
+    delta = str(data.get('delta', '')).lower() in ('1', 'true')
+    
+    entry = cached_page(session, lambda entry: not delta and cached_screenshot(entry, options) is not None)
+    if entry is not None:
+        screenshot_data = cached_screenshot(entry, options)
+        return {
+            "success": True,
+            "screenshot": encode_base64(screenshot_data),
+            "url": entry['final_url'],
+            "format": options['format'],
+            "bytes": len(screenshot_data),
+            "page_cache": True
+        }
+    
+    driver = session.driver
+    
+    if delta:
+        try:
+            since = int(data['since']) if data.get('since') not in (None, '') else None
+            tile_size = int(data.get('tile', DEFAULT_TILE_SIZE))
+        except (TypeError, ValueError):
+            raise ActionError("since and tile must be integers")
+        if not 16 <= tile_size <= 512:
+            raise ActionError("tile must be between 16 and 512")
+        
+        return {
+            "success": True,
+            "url": driver.current_url,
+            "format": options['format'],
+            "delta": screenshot_delta(session, options, since, tile_size)
+        }
+    
+    # צלם מסך
+    screenshot_data = capture_screenshot(driver, options)
+    
+    # המר ל-base64
+    screenshot_b64 = encode_base64(screenshot_data)
+    
+    return {
+        "success": True,
+        "screenshot": screenshot_b64,
+        "url": driver.current_url,
+        "format": options['format'],
+        "bytes": len(screenshot_data)
+    }
+
+
+# סקריפטים רשומים ל-/execute_js: נשלחים פעם אחת ומופעלים לפי id (hash של התוכן) עם ארגומנטים.
+# בכל מסמך הסקריפט מוגדר כפונקציה ב-window.__embassyScripts בקריאה הראשונה, והקריאות הבאות
+# הן רק קריאה לפונקציה. inject מגדיר אותו מראש בכל מסמך חדש (Page.addScriptToEvaluateOnNewDocument).
+
+SCRIPT_MAX_BYTES = int(os.environ.get('SCRIPT_MAX_BYTES', 256 * 1024))
+SCRIPT_REGISTRY_MAX = int(os.environ.get('SCRIPT_REGISTRY_MAX', 500))
+
+# הגוף משתמש ב-arguments ו-return בדיוק כמו ב-execute_script
+SCRIPT_DEFINITION = """(window.__embassyScripts = window.__embassyScripts || {})[%s] = %sfunction () {
+%s
+};
+"""
+
+SCRIPT_CALL = """const fn = window.__embassyScripts && window.__embassyScripts[%s];
+if (!fn) return {__embassyMissing: true};
+return fn.apply(window, arguments);
+"""
+
+# execute_async_script: הארגומנט האחרון הוא ה-callback של Selenium
+ASYNC_SCRIPT_CALL = """const done = arguments[arguments.length - 1];
+const args = Array.prototype.slice.call(arguments, 0, -1);
+const fn = %s;
+if (!fn) { done({__embassyMissing: true}); return; }
+Promise.resolve()
+    .then(() => fn.apply(window, args))
+    .then((value) => done({value: value}), (error) => done({error: String(error && error.stack || error)}));
+"""
+
+
+class ScriptError(ValueError):
+    """
+    סקריפט לא תקין לרישום (status - כמו ב-ActionError)
+    """
+    
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class RegisteredScript:
+    """
+    סקריפט רשום - המזהה הוא hash של התוכן (אותו סקריפט = אותו id)
+    """
+    
+    def __init__(self, source, name=None, is_async=False, inject=False, builtin=False):
+        if not isinstance(source, str) or not source.strip():
+            raise ScriptError("source must be a non-empty string")
+        if len(source.encode('utf-8')) > SCRIPT_MAX_BYTES:
+            raise ScriptError(f"Script is larger than {SCRIPT_MAX_BYTES} bytes")
+        if name is not None and (not isinstance(name, str) or not re.fullmatch(r'[A-Za-z0-9_.-]+', name)):
+            raise ScriptError("name may contain only letters, digits, '_', '.' and '-'")
+        
+        self.source = source
+        self.name = name
+        self.is_async = bool(is_async)
+        self.inject = bool(inject)
+        self.builtin = builtin
+        self.id = hashlib.sha256(f"{int(self.is_async)}:{source}".encode('utf-8')).hexdigest()[:16]
+        self.calls = 0
+        
+        key = json.dumps(self.id)
+        self.definition = SCRIPT_DEFINITION % (key, 'async ' if self.is_async else '', source)
+        if self.is_async:
+            self.call = ASYNC_SCRIPT_CALL % f"window.__embassyScripts && window.__embassyScripts[{key}]"
+        else:
+            self.call = SCRIPT_CALL % key
+    
+    def info(self):
+        return {
+            "script_id": self.id,
+            "name": self.name,
+            "async": self.is_async,
+            "inject": self.inject,
+            "builtin": self.builtin,
+            "bytes": len(self.source.encode('utf-8')),
+            "calls": self.calls
+        }
+
+
+class ScriptRegistry:
+    """
+    סקריפטים לפי id או שם (built-in לא ניתנים למחיקה)
+    """
+    
+    def __init__(self):
+        self.scripts = {}
+        self.names = {}
+        self.lock = threading.Lock()
+    
+    def add(self, source, name=None, is_async=False, inject=False, builtin=False):
+        """
+        Returns:
+            (script, created) - רישום חוזר של אותו תוכן מחזיר את הקיים
+        """
+        script = RegisteredScript(source, name, is_async, inject, builtin)
+        with self.lock:
+            named = self.scripts.get(self.names.get(name))
+            if named is not None and named.builtin and named.id != script.id:
+                raise ScriptError(f"Script {name} is built in", 409)
+            existing = self.scripts.get(script.id)
+            if existing is None and len(self.scripts) >= SCRIPT_REGISTRY_MAX:
+                raise ScriptError(f"Script registry is full ({SCRIPT_REGISTRY_MAX} scripts)")
+            if existing is not None:
+                existing.inject = existing.inject or script.inject
+                script = existing
+            else:
+                self.scripts[script.id] = script
+            if name:
+                script.name = name
+                self.names[name] = script.id
+        return script, existing is None
+    
+    def get(self, key):
+        with self.lock:
+            return self.scripts.get(key) or self.scripts.get(self.names.get(key))
+    
+    def remove(self, key):
+        with self.lock:
+            script = self.scripts.get(key) or self.scripts.get(self.names.get(key))
+            if script is None or script.builtin:
+                return script
+            del self.scripts[script.id]
+            for name in [n for n, script_id in self.names.items() if script_id == script.id]:
+                del self.names[name]
+            return script
+    
+    def injected(self):
+        with self.lock:
+            return {script.id: script for script in self.scripts.values() if script.inject}
+    
+    def list(self):
+        with self.lock:
+            return [script.info() for script in self.scripts.values()]
+
+
+scripts = ScriptRegistry()
+
+
+def inject_scripts(session):
+    """
+    הזרקת סקריפטי inject שעוד לא הוזרקו לחלון של session, והסרת הזרקות של סקריפטים שנמחקו
+    """
+    wanted = scripts.injected()
+    injected = session.injected_scripts
+    if wanted.keys() == injected.keys():
+        return
+    
+    driver = session.driver
+    for script_id in [i for i in injected if i not in wanted]:
+        try:
+            driver.execute_cdp_cmd('Page.removeScriptToEvaluateOnNewDocument', {'identifier': injected.pop(script_id)})
+        except Exception as e:
+            logger.debug(f"Failed to remove injected script {script_id}: {e}")
+    for script_id, script in wanted.items():
+        if script_id not in injected:
+            result = driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': script.definition})
+            injected[script_id] = result['identifier']
+
+
+def async_script_result(result):
+    """
+    התוצאה של ASYNC_SCRIPT_CALL - זורק ActionError אם ה-Promise נדחה
+    """
+    if not isinstance(result, dict):
+        return result
+    if 'error' in result:
+        raise ActionError(f"Script failed: {result['error']}", 500)
+    return result.get('value')
+
+
+def run_script(session, script, args=()):
+    """
+    הפעלת סקריפט רשום: קריאה לפונקציה שכבר מוגדרת בדף, או הגדרה + קריאה בפעם הראשונה במסמך
+    """
+    driver = session.driver
+    inject_scripts(session)
+    execute = driver.execute_async_script if script.is_async else driver.execute_script
+    
+    result = execute(script.call, *args)
+    if isinstance(result, dict) and result.get('__embassyMissing'):
+        result = execute(script.definition + script.call, *args)
+    script.calls += 1
+    
+    return async_script_result(result) if script.is_async else result
+
+
+# JavaScript לחילוץ שדות - מעבר אחד על ה-DOM (כולל shadow DOM ו-iframes מאותו origin).
+# מונה גרסה (MutationObserver + אירועי input/change) מאפשר להחזיר "לא השתנה"
+# בלי לסרוק שוב כשה-token של הקריאה הקודמת עדיין תקף.
+EXTRACT_FIELDS_SCRIPT = """
+const knownToken = arguments[0];
+
+let state = window.__embassyDom;
+if (!state) {
+    state = window.__embassyDom = {
+        id: Math.random().toString(36).slice(2),
+        version: 0,
+        observed: new WeakSet()
+    };
+    state.bump = () => { state.version++; };
+    state.observer = new MutationObserver(state.bump);
+}
+const observe = (root) => {
+    if (state.observed.has(root)) return;
+    state.observed.add(root);
+    state.observer.observe(root, {subtree: true, childList: true, attributes: true, characterData: true});
+    root.addEventListener('input', state.bump, true);
+    root.addEventListener('change', state.bump, true);
+};
+observe(document);
+
+const token = state.id + ':' + state.version;
+if (knownToken === token) {
+    return {token: token, unchanged: true};
+}
+
+const columns = ['index', 'tag', 'type', 'name', 'id', 'placeholder', 'value', 'label', 'required', 'frame', 'shadow'];
+const rows = [];
+let total = 0;
+let frameCount = 0;
+
+const isVisible = (el) => el.checkVisibility ? el.checkVisibility() : el.getClientRects().length > 0;
+
+const index = (root, frame, shadow) => {
+    const controls = [];
+    const labels = new Map();
+    const nested = [];
+    
+    // מעבר יחיד: שדות, labels עם for, shadow roots ו-iframes
+    const walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT);
+    for (let el = walker.currentNode; el; el = walker.nextNode()) {
+        switch (el.tagName) {
+            case 'INPUT': case 'SELECT': case 'TEXTAREA': case 'BUTTON':
+                controls.push(el);
+                break;
+            case 'LABEL':
+                if (el.htmlFor && !labels.has(el.htmlFor)) labels.set(el.htmlFor, el);
+                break;
+            case 'IFRAME': case 'FRAME':
+                try {
+                    if (el.contentDocument) nested.push([el.contentDocument, ++frameCount, shadow]);
+                    el.addEventListener('load', state.bump);
+                } catch (e) {}  // iframe מ-origin אחר
+                break;
+        }
+        if (el.shadowRoot) nested.push([el.shadowRoot, frame, true]);
+    }
+    
+    for (const el of controls) {
+        const position = total++;
+        if (!isVisible(el)) continue;
+        
+        let label = el.id && labels.get(el.id);
+        if (!label) label = el.closest('label');
+        
+        rows.push([
+            position,
+            el.tagName.toLowerCase(),
+            el.type || 'text',
+            el.name || '',
+            el.id || '',
+            el.placeholder || '',
+            el.value || '',
+            label ? label.textContent.trim() : '',
+            el.required || false,
+            frame,
+            shadow
+        ]);
+    }
+    
+    for (const [child, childFrame, childShadow] of nested) {
+        observe(child);
+        index(child, childFrame, childShadow);
+    }
+};
+
+index(document, 0, false);
+return {token: token, columns: columns, rows: rows, total: total};
+"""
+
+# מוזרק לכל מסמך חדש - כל קריאה ל-extract_fields שולחת רק את ה-token
+EXTRACT_FIELDS, _ = scripts.add(EXTRACT_FIELDS_SCRIPT, name='extract_fields', inject=True, builtin=True)
+
+
+@browser_action('extract_fields', 'Extract fields')
+def do_extract_fields(session, data):
+    """
+    חילוץ השדות הנראים - מהמטמון של ה-session אם ה-DOM לא השתנה מאז
+    
+    format=columnar מחזיר columns/rows במקום רשימת אובייקטים
+    """
+    entry = cached_page(session)
+    if entry is not None:
+        result, hit = entry['fields'], True
+    else:
+        cached = session.fields_cache
+        result = run_script(session, EXTRACT_FIELDS, [cached['token'] if cached else None])
+        
+        hit = bool(result.get('unchanged'))
+        if hit:
+            result = cached
+        else:
+            session.fields_cache = result
+    
+    response = {
+        "success": True,
+        "total": result['total'],
+        "visible": len(result['rows']),
+        "cached": hit,
+        "dom_version": result['token']
+    }
+    if entry is not None:
+        response["page_cache"] = True
+    
+    if data.get('format') == 'columnar':
+        response["columns"] = result['columns']
+        response["rows"] = result['rows']
+    else:
+        columns = result['columns']
+        response["fields"] = [dict(zip(columns, row), visible=True) for row in result['rows']]
+    
+    return response
+
+
+@browser_action('fill_field', 'Fill field')
+def do_fill_field(session, data):
+    selector = data.get('selector')
+    value = data.get('value')
+    method = data.get('method', 'css')  # ברירת מחדל: CSS selector
+    
+    if not selector or value is None:
+        raise ActionError("selector and value are required")
+    
+    # מצא את האלמנט (מהמטמון אם אפשר), נקה ומלא
+    def fill(element):
+        element.clear()
+        element.send_keys(value)
+    
+    lookup = ElementLookup(session)
+    lookup.run(method, selector, fill)
+    
+    logger.info(f"Filled field {selector} with value")
+    
+    return {
+        "success": True,
+        "selector": selector,
+        "filled": True,
+        "element_cache": lookup.stats()
+    }
+
+
+@browser_action('click', 'Click')
+def do_click(session, data):
+    selector = data.get('selector')
+    method = data.get('method', 'css')
+    
+    if not selector:
+        raise ActionError("selector is required")
+    
+    wait_until, timeout = _wait_params(data, 'networkidle')
+    driver = session.driver
+    
+    # מצא את האלמנט (מהמטמון אם אפשר) ולחץ
+    previous_url = driver.current_url
+    lookup = ElementLookup(session)
+    lookup.run(method, selector, lambda element: element.click())
+    wait = wait_for_page(driver, wait_until, timeout, previous_url)
+    
+    current_url = driver.current_url
+    if current_url != previous_url:
+        invalidate_page_caches(session)
+    
+    logger.info(f"Clicked on {selector}")
+    
+    return {
+        "success": True,
+        "selector": selector,
+        "clicked": True,
+        "current_url": current_url,
+        "wait": wait,
+        "element_cache": lookup.stats()
+    }
+
+
+# HTML חלקי / טקסט בלבד / בלי scripts ו-styles - נבנה בדפדפן על עותק של ה-DOM
+SCOPED_HTML_SCRIPT = """
+const [selector, mode, strip] = arguments;
+const root = selector ? document.querySelector(selector) : document.documentElement;
+if (!root) return null;
+if (mode === 'text') return root.innerText;
+
+const copy = root.cloneNode(true);
+if (strip.length) {
+    const selectors = [];
+    if (strip.includes('scripts')) selectors.push('script', 'noscript', 'template');
+    if (strip.includes('styles')) selectors.push('style', 'link[rel="stylesheet"]');
+    if (strip.includes('comments')) {
+        const walker = document.createTreeWalker(copy, NodeFilter.SHOW_COMMENT);
+        const comments = [];
+        while (walker.nextNode()) comments.push(walker.currentNode);
+        comments.forEach((node) => node.remove());
+    }
+    if (selectors.length) copy.querySelectorAll(selectors.join(',')).forEach((node) => node.remove());
+}
+return copy.outerHTML;
+"""
+
+HTML_STRIP_OPTIONS = ('scripts', 'styles', 'comments')
+
+
+def page_html(driver, data):
+    """
+    ה-HTML של הדף לפי האפשרויות: selector, mode (html|text), strip
+    """
+    selector = data.get('selector')
+    mode = data.get('mode', 'html')
+    strip = data.get('strip') or []
+    if isinstance(strip, str):
+        strip = [part for part in strip.split(',') if part]
+    
+    if mode not in ('html', 'text'):
+        raise ActionError("mode must be 'html' or 'text'")
+    unknown = [part for part in strip if part not in HTML_STRIP_OPTIONS]
+    if unknown:
+        raise ActionError(f"Unknown strip options: {', '.join(unknown)} (expected {', '.join(HTML_STRIP_OPTIONS)})")
+    
+    if not selector and mode == 'html' and not strip:
+        return driver.page_source
+    
+    html = driver.execute_script(SCOPED_HTML_SCRIPT, selector, mode, strip)
+    if html is None:
+        raise ActionError(f"No element matches selector: {selector}", 404)
+    return html
+
+
+def html_delta(session, html, since):
+    """
+    השוואה ל-HTML הקודם של ה-session (לפי שורות)
+    
+    Returns:
+        {"hash", "unchanged"} / {"hash", "base_hash", "diff": [[op, start, end, lines], ...]} / {"hash", "html"}
+    """
+    html_hash = hashlib.blake2b(html.encode('utf-8'), digest_size=16).hexdigest()
+    previous = session.html_snapshot
+    lines = html.splitlines(keepends=True)
+    session.html_snapshot = {"hash": html_hash, "lines": lines}
+    
+    if since == html_hash:
+        return {"hash": html_hash, "unchanged": True}
+    
+    if previous is None or since != previous['hash']:
+        return {"hash": html_hash, "html": html}
+    
+    # פעולות על השורות הישנות - להחיל מהסוף להתחלה
+    matcher = difflib.SequenceMatcher(None, previous['lines'], lines, autojunk=False)
+    diff = [
+        [tag, i1, i2, lines[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != 'equal'
+    ]
+    return {"hash": html_hash, "base_hash": since, "diff": diff}
+
+
+@browser_action('get_html', 'Get HTML')
+def do_get_html(session, data):
+    entry = cached_page(session, lambda entry: not data.get('selector') and not data.get('strip'))
+    if entry is not None:
+        mode = data.get('mode', 'html')
+        if mode not in ('html', 'text'):
+            raise ActionError("mode must be 'html' or 'text'")
+        html = entry[mode]
+        result = {
+            "success": True,
+            "url": entry['final_url'],
+            "title": entry['title'],
+            "page_cache": True
+        }
+    else:
+        driver = session.driver
+        html = page_html(driver, data)
+        result = {
+            "success": True,
+            "url": driver.current_url,
+            "title": driver.title
+        }
+    
+    if 'since' in data:
+        result.update(html_delta(session, html, data['since'] or None))
+    else:
+        result["html"] = html
+    
+    return result
+
+
+@browser_action('execute_js', 'Execute JS')
+def do_execute_js(session, data):
+    """
+    script (async: true - גוף של async function) או script_id של סקריפט רשום, עם args
+    """
+    args = data.get('args', [])
+    if not isinstance(args, list):
+        args = [args]
+    
+    if data.get('script_id'):
+        script = scripts.get(data['script_id'])
+        if script is None:
+            raise ActionError(f"Unknown script: {data['script_id']}", 404)
+        return {
+            "success": True,
+            "result": run_script(session, script, args),
+            "script_id": script.id
+        }
+    
+    script = data.get('script')
+    
+    if not script:
+        raise ActionError("script or script_id is required")
+    
+    if data.get('async'):
+        wrapped = ASYNC_SCRIPT_CALL % f"async function () {{\n{script}\n}}"
+        result = async_script_result(session.driver.execute_async_script(wrapped, *args))
+    else:
+        result = session.driver.execute_script(script, *args)
+    
+    return {
+        "success": True,
+        "result": result
+    }
+
+
+# snapshots של התחברות: אחרי login מוצלח שומרים cookies + localStorage/sessionStorage
+# לכל זהות, ו-session הבא משחזר אותם במקום לעבור שוב את דף ה-Sign In
+
+AUTH_SNAPSHOT_TTL = int(os.environ.get('AUTH_SNAPSHOT_TTL', 1800))
+# מפתח ה-HMAC של טביעת הסיסמה ב-snapshot (ברירת מחדל: אקראי לכל תהליך - ה-snapshots בזיכרון ממילא)
+AUTH_SNAPSHOT_SECRET = os.environ.get('AUTH_SNAPSHOT_SECRET', '').encode('utf-8') or secrets.token_bytes(32)
+
+# שדות שאפשר להחזיר ל-Network.setCookies מתוך Network.getCookies
+COOKIE_PARAM_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires')
+
+CAPTURE_STORAGE_SCRIPT = """
+return {
+    origin: location.origin,
+    local: Object.assign({}, localStorage),
+    session: Object.assign({}, sessionStorage)
+};
+"""
+
+# רץ לפני כל סקריפט של הדף (Page.addScriptToEvaluateOnNewDocument) - רק ב-origin של ה-snapshot
+RESTORE_STORAGE_SCRIPT = """
+(function (snapshot) {
+    if (location.origin !== snapshot.origin) return;
+    try {
+        for (const [key, value] of Object.entries(snapshot.local)) localStorage.setItem(key, value);
+        for (const [key, value] of Object.entries(snapshot.session)) sessionStorage.setItem(key, value);
+    } catch (e) {}
+})(%s);
+"""
+
+
+def credential_fingerprint(secret):
+    """
+    HMAC של הסיסמה עם מפתח השרת - snapshot מוגש רק למי שיודע את אותה סיסמה
+    """
+    return hmac.new(AUTH_SNAPSHOT_SECRET, str(secret).encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+class AuthSnapshotCache:
+    """
+    snapshots של sessions מחוברים לפי זהות (למשל oracle:Default:user@example.com) + טביעת הסיסמה, עם TTL
+    """
+    
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}  # (identity, fingerprint) -> snapshot
+        self.lock = threading.Lock()
+    
+    def get(self, identity, fingerprint):
+        key = (identity, fingerprint)
+        with self.lock:
+            snapshot = self.entries.get(key)
+            if snapshot is not None and time.time() - snapshot['created_at'] > self.ttl:
+                del self.entries[key]
+                snapshot = None
+            return snapshot
+    
+    def put(self, identity, fingerprint, snapshot):
+        now = time.time()
+        with self.lock:
+            # snapshot אחד לכל זהות - התחברות עם סיסמה חדשה מחליפה את הקודם
+            self.entries = {k: v for k, v in self.entries.items()
+                            if now - v['created_at'] <= self.ttl and k[0] != identity}
+            self.entries[(identity, fingerprint)] = snapshot
+    
+    def discard(self, identity):
+        with self.lock:
+            keys = [key for key in self.entries if key[0] == identity]
+            for key in keys:
+                del self.entries[key]
+            return bool(keys)
+    
+    def clear(self):
+        with self.lock:
+            count = len(self.entries)
+            self.entries.clear()
+            return count
+    
+    def info(self):
+        now = time.time()
+        with self.lock:
+            entries = list(self.entries.items())
+        return [
+            {
+                "identity": identity,
+                "url": snapshot['url'],
+                "cookies": len(snapshot['cookies']),
+                "age": round(now - snapshot['created_at'], 1),
+                "expires_in": round(self.ttl - (now - snapshot['created_at']), 1)
+            }
+            for (identity, _), snapshot in entries
+        ]
+
+
+auth_snapshots = AuthSnapshotCache(AUTH_SNAPSHOT_TTL)
+
+
+def capture_auth_snapshot(driver, urls):
+    """
+    cookies של הכתובות של ההתחברות בלבד (urls + הדף הנוכחי) + storage של ה-origin הנוכחי
+    """
+    urls = list(dict.fromkeys([*urls, driver.current_url]))
+    cookies = driver.execute_cdp_cmd('Network.getCookies', {'urls': urls}).get('cookies', [])
+    storage = driver.execute_script(CAPTURE_STORAGE_SCRIPT)
+    return {
+        "url": driver.current_url,
+        "origin": storage['origin'],
+        "cookies": [
+            {k: cookie[k] for k in COOKIE_PARAM_FIELDS if k in cookie and not (k == 'expires' and cookie.get('session'))}
+            for cookie in cookies
+        ],
+        "local": storage['local'],
+        "session": storage['session'],
+        "created_at": time.time()
+    }
+
+
+def restore_auth_snapshot(session, snapshot, timeout=DEFAULT_WAIT_TIMEOUT):
+    """
+    החזרת cookies + storage וניווט לדף שאחרי ההתחברות (ניווט אחד)
+    
+    Returns:
+        True אם הדף נשאר ב-origin של ה-snapshot (הפניה לדף התחברות במקום אחר = לא מחובר)
+    """
+    driver = session.driver
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setCookies', {'cookies': snapshot['cookies']})
+    storage = {key: snapshot[key] for key in ('origin', 'local', 'session')}
+    script = driver.execute_cdp_cmd(
+        'Page.addScriptToEvaluateOnNewDocument',
+        {'source': RESTORE_STORAGE_SCRIPT % json.dumps(storage)}
+    )
+    try:
+        invalidate_page_caches(session)
+        open_url(driver, snapshot['url'])
+        wait_for_page(driver, 'load', timeout)
+        return driver.execute_script("return location.origin;") == snapshot['origin']
+    finally:
+        driver.execute_cdp_cmd('Page.removeScriptToEvaluateOnNewDocument', {'identifier': script['identifier']})
+
+
+# ==================== Recipes ====================
+#
+# recipe = מסמך JSON/YAML של צעדים (navigate, wait_for, fill, click, assert, capture).
+# נבדק ומקומפל פעם אחת כשנרשם, נשמר לפי שם, ורץ בצד השרת עם המתנות אמיתיות.
+# ערכים יכולים להכיל {{param}}; ערך שכולו {{param}} מקבל את הפרמטר כמו שהוא (לא כמחרוזת).
+
+RECIPES_DIR = os.environ.get('RECIPES_DIR')
+
+RECIPE_COMMON_FIELDS = ('action', 'label', 'optional', 'if')
+ELEMENT_METHODS = ('css', 'id', 'name', 'xpath')
+ASSERT_CONDITIONS = ('url_contains', 'url_not_contains', 'title_contains', 'selector_present', 'selector_absent')
+CAPTURE_KINDS = ('screenshot', 'url', 'title', 'html', 'text', 'fields')
+TEMPLATE_PATTERN = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+RecipeStep = namedtuple('RecipeStep', ['func', 'required', 'optional'])
+RECIPE_STEPS = {}
+
+
+def recipe_step(name, required=(), optional=()):
+    """
+    רישום סוג צעד: func(session, step, context) מקבל את הצעד אחרי הצבת הפרמטרים
+    """
+    def register(func):
+        RECIPE_STEPS[name] = RecipeStep(func, required, optional)
+        return func
+    return register
+
+
+class RecipeError(ValueError):
+    """
+    recipe לא תקין (נזרק בזמן הקומפילציה)
+    """
+
+
+def _compile_value(value, params, where):
+    """
+    ערך קבוע או template - מחזיר (func(params) -> value, templated)
+    """
+    if not isinstance(value, str):
+        return (lambda bound: value), False
+    
+    names = TEMPLATE_PATTERN.findall(value)
+    unknown = [name for name in names if name not in params]
+    if unknown:
+        raise RecipeError(f"{where}: unknown parameter {', '.join(unknown)}")
+    if not names:
+        return (lambda bound: value), False
+    
+    whole = TEMPLATE_PATTERN.fullmatch(value)
+    if whole:
+        name = whole.group(1)
+        return (lambda bound: bound[name]), True
+    return (lambda bound: TEMPLATE_PATTERN.sub(lambda m: str(bound[m.group(1)]), value)), True
+
+
+def check_conditions(driver, conditions):
+    """
+    בדיקת תנאי assert על הדף הנוכחי
+    
+    Returns:
+        הודעת כישלון או None
+    """
+    for condition, expected in conditions.items():
+        if condition == 'url_contains' and expected not in driver.current_url:
+            return f"URL {driver.current_url} does not contain {expected}"
+        if condition == 'url_not_contains' and expected in driver.current_url:
+            return f"URL {driver.current_url} contains {expected}"
+        if condition == 'title_contains' and expected not in driver.title:
+            return f"Title {driver.title!r} does not contain {expected}"
+        if condition == 'selector_present' and not driver.find_elements(By.CSS_SELECTOR, expected):
+            return f"No element matches {expected}"
+        if condition == 'selector_absent' and driver.find_elements(By.CSS_SELECTOR, expected):
+            return f"Element {expected} is present"
+    return None
+
+
+def _check_static_step(action, step, where):
+    """
+    בדיקות שאפשר לעשות כבר בקומפילציה (לערכים שאינם template)
+    """
+    try:
+        for key in ('wait_until', 'until'):
+            if isinstance(step.get(key), str) and not TEMPLATE_PATTERN.search(step[key]):
+                check_wait_until(step[key])
+    except ValueError as e:
+        raise RecipeError(f"{where}: {e}")
+    if step.get('method', 'css') not in ELEMENT_METHODS:
+        raise RecipeError(f"{where}: method must be one of {', '.join(ELEMENT_METHODS)}")
+    if action == 'assert' and not any(key in step for key in ASSERT_CONDITIONS):
+        raise RecipeError(f"{where}: assert needs one of {', '.join(ASSERT_CONDITIONS)}")
+    if action == 'capture':
+        if step['what'] not in CAPTURE_KINDS:
+            raise RecipeError(f"{where}: what must be one of {', '.join(CAPTURE_KINDS)}")
+
+
+def _compile_steps(steps, params, section):
+    if not isinstance(steps, list):
+        raise RecipeError(f"{section} must be a list")
+    
+    compiled = []
+    for index, step in enumerate(steps):
+        where = f"{section}[{index}]"
+        if not isinstance(step, dict) or step.get('action') not in RECIPE_STEPS:
+            raise RecipeError(f"{where}: action must be one of {', '.join(RECIPE_STEPS)}")
+        action = step['action']
+        spec = RECIPE_STEPS[action]
+        missing = [key for key in spec.required if key not in step]
+        if missing:
+            raise RecipeError(f"{where}: {action} requires {', '.join(missing)}")
+        unknown = [key for key in step if key not in RECIPE_COMMON_FIELDS + spec.required + spec.optional]
+        if unknown:
+            raise RecipeError(f"{where}: unknown fields {', '.join(unknown)}")
+        if 'if' in step and step['if'] not in params:
+            raise RecipeError(f"{where}: unknown parameter {step['if']}")
+        _check_static_step(action, step, where)
+        
+        values = {
+            key: _compile_value(value, params, where)[0]
+            for key, value in step.items() if key not in RECIPE_COMMON_FIELDS
+        }
+        compiled.append({
+            "action": action,
+            "label": step.get('label', action),
+            "optional": bool(step.get('optional')),
+            "if": step.get('if'),
+            "values": values
+        })
+    return compiled
+
+
+class Recipe:
+    """
+    recipe מקומפל: פרמטרים, צעדים, צעדי finally (רצים תמיד) ו-auth אופציונלי
+    """
+    
+    def __init__(self, source, builtin=False):
+        if not isinstance(source, dict):
+            raise RecipeError("recipe must be an object")
+        name = source.get('name')
+        if not isinstance(name, str) or not re.fullmatch(r'[\w.-]+', name):
+            raise RecipeError("name is required (letters, digits, _ . -)")
+        
+        params = source.get('params', {})
+        if not isinstance(params, dict) or not all(isinstance(p, dict) for p in params.values()):
+            raise RecipeError("params must map names to {\"required\": bool, \"default\": ...}")
+        
+        self.name = name
+        self.source = source
+        self.builtin = builtin
+        self.description = source.get('description', '')
+        self.params = params
+        self.steps = _compile_steps(source.get('steps', []), params, 'steps')
+        self.finally_steps = _compile_steps(source.get('finally', []), params, 'finally')
+        if not self.steps:
+            raise RecipeError("steps must be a non-empty list")
+        
+        # auth: {"identity": "site:{{user}}", "secret": "{{password}}", "check": {<תנאי assert שמעידים על התחברות>}}
+        # snapshot נשמר לפי identity + HMAC של secret - בלי הסיסמה הנכונה אין שחזור
+        auth = source.get('auth')
+        self.identity = None
+        if auth is not None:
+            if (not isinstance(auth, dict) or 'identity' not in auth or 'secret' not in auth
+                    or not isinstance(auth.get('check'), dict)):
+                raise RecipeError("auth needs identity, secret and check")
+            unknown = [key for key in auth['check'] if key not in ASSERT_CONDITIONS]
+            if unknown:
+                raise RecipeError(f"auth.check: unknown conditions {', '.join(unknown)}")
+            self.identity = _compile_value(auth['identity'], params, 'auth.identity')[0]
+            self.secret = _compile_value(auth['secret'], params, 'auth.secret')[0]
+            self.auth_check = auth['check']
+    
+    def bind(self, values):
+        """
+        פרמטרים להרצה: ערכים שנשלחו + ברירות מחדל (ActionError אם חסר חובה)
+        """
+        values = values or {}
+        unknown = [key for key in values if key not in self.params]
+        if unknown:
+            raise ActionError(f"Unknown parameters for recipe {self.name}: {', '.join(unknown)}")
+        
+        bound = {}
+        for name, spec in self.params.items():
+            if name in values:
+                bound[name] = values[name]
+            elif 'default' in spec:
+                bound[name] = spec['default']
+            elif spec.get('required'):
+                raise ActionError(f"Recipe {self.name}: parameter {name} is required")
+            else:
+                bound[name] = None
+        return bound
+    
+    def info(self):
+        return {
+            "name": self.name,
+            "description": self.description,
+            "builtin": self.builtin,
+            "params": self.params,
+            "steps": len(self.steps),
+            "finally": len(self.finally_steps),
+            "auth": self.identity is not None
+        }
+    
+    def _run_steps(self, session, steps, bound, context, results):
+        for step in steps:
+            index = len(results)
+            if step['if'] and bound.get(step['if']) in (None, False):
+                results.append({"index": index, "action": step['action'], "label": step['label'], "status": "skipped"})
+                continue
+            
+            started = time.monotonic()
+            record = {"index": index, "action": step['action'], "label": step['label']}
+            try:
+                values = {key: value(bound) for key, value in step['values'].items()}
+                detail = RECIPE_STEPS[step['action']].func(session, values, context)
+                record["status"] = "ok"
+                if detail:
+                    record.update(detail)
+            except Exception as e:
+                record["status"] = "failed"
+                record["error"] = str(e) or type(e).__name__
+            record["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+            results.append(record)
+            
+            if record["status"] == "failed" and not step['optional']:
+                return index
+        return None
+    
+    def run(self, session, values, reuse_auth=True):
+        """
+        הרצת ה-recipe על session שכבר מושכר
+        
+        Returns:
+            {"success", "recipe", "auth", "failed_step", "steps", "outputs", "elapsed_ms", ...}
+        """
+        bound = self.bind(values)
+        driver = session.driver
+        started = time.monotonic()
+        context = {"lookup": ElementLookup(session), "outputs": {}, "previous_url": driver.current_url, "visited": []}
+        results = []
+        failed_step = None
+        auth = None
+        identity = self.identity(bound) if self.identity else None
+        fingerprint = credential_fingerprint(self.secret(bound)) if identity else None
+        
+        # snapshot של התחברות קודמת (עם אותה סיסמה) חוסך את כל הצעדים
+        snapshot = auth_snapshots.get(identity, fingerprint) if identity and reuse_auth else None
+        if snapshot is not None:
+            restore_started = time.monotonic()
+            try:
+                if (restore_auth_snapshot(session, snapshot)
+                        and check_conditions(session.driver, self.auth_check) is None):
+                    auth = {"source": "snapshot", "age": round(time.time() - snapshot['created_at'], 1)}
+                    logger.info(f"✅ Restored auth snapshot for {identity}")
+            except Exception as e:
+                logger.warning(f"Auth snapshot restore failed: {e}")
+            results.append({
+                "index": 0,
+                "action": "restore_auth",
+                "label": "restore_auth",
+                "status": "ok" if auth else "failed",
+                "elapsed_ms": round((time.monotonic() - restore_started) * 1000)
+            })
+            if auth is None:
+                results[-1]["error"] = "Restored session is not authenticated"
+                auth_snapshots.discard(identity)
+                logger.info(f"Auth snapshot for {identity} is no longer valid, running {self.name}")
+        
+        if auth is None:
+            failed_step = self._run_steps(session, self.steps, bound, context, results)
+            if identity:
+                auth = {"source": "login", "age": 0, "cached": False}
+                if failed_step is None and check_conditions(session.driver, self.auth_check) is None:
+                    auth_snapshots.put(identity, fingerprint, capture_auth_snapshot(session.driver, context["visited"]))
+                    auth["cached"] = True
+        
+        finally_failed = self._run_steps(session, self.finally_steps, bound, context, results)
+        if failed_step is None:
+            failed_step = finally_failed
+        
+        return {
+            "success": failed_step is None,
+            "recipe": self.name,
+            "session_id": session.id,
+            "current_url": session.driver.current_url,
+            "page_title": session.driver.title,
+            "auth": auth,
+            "failed_step": failed_step,
+            "steps": results,
+            "outputs": context["outputs"],
+            "element_cache": context["lookup"].stats(),
+            "elapsed_ms": round((time.monotonic() - started) * 1000)
+        }
+
+
+class RecipeRegistry:
+    """
+    recipes מקומפלים לפי שם (built-in לא ניתנים להחלפה)
+    """
+    
+    def __init__(self):
+        self.recipes = {}
+        self.lock = threading.Lock()
+    
+    def add(self, source, builtin=False):
+        recipe = Recipe(source, builtin)
+        with self.lock:
+            existing = self.recipes.get(recipe.name)
+            if existing is not None and existing.builtin:
+                raise RecipeError(f"Recipe {recipe.name} is built in")
+            self.recipes[recipe.name] = recipe
+        return recipe
+    
+    def get(self, name):
+        with self.lock:
+            return self.recipes.get(name)
+    
+    def remove(self, name):
+        with self.lock:
+            recipe = self.recipes.get(name)
+            if recipe is None or recipe.builtin:
+                return recipe
+            del self.recipes[name]
+            return recipe
+    
+    def list(self):
+        with self.lock:
+            return [recipe.info() for recipe in self.recipes.values()]
+    
+    def load_dir(self, path):
+        """
+        טעינת כל קבצי ה-JSON/YAML מתיקייה (RECIPES_DIR)
+        """
+        for filename in sorted(os.listdir(path)):
+            extension = os.path.splitext(filename)[1].lower()
+            if extension not in ('.json', '.yaml', '.yml'):
+                continue
+            try:
+                with open(os.path.join(path, filename), encoding='utf-8') as f:
+                    if extension == '.json':
+                        source = json.load(f)
+                    elif yaml is not None:
+                        source = yaml.safe_load(f)
+                    else:
+                        logger.warning(f"Skipping {filename}: PyYAML is not installed")
+                        continue
+                recipe = self.add(source)
+                logger.info(f"Loaded recipe {recipe.name} from {filename}")
+            except Exception as e:
+                logger.error(f"Failed to load recipe {filename}: {e}")
+
+
+@recipe_step('navigate', required=('url',), optional=('wait_until', 'timeout'))
+def _step_navigate(session, step, context):
+    driver = session.driver
+    context["previous_url"] = driver.current_url
+    invalidate_page_caches(session)
+    open_url(driver, step['url'])
+    session.navigations += 1
+    context["visited"].append(step['url'])  # ה-cookies של ה-snapshot - רק מהכתובות האלה
+    wait = wait_for_page(driver, step.get('wait_until', 'load'), float(step.get('timeout', DEFAULT_WAIT_TIMEOUT)),
+                         context["previous_url"])
+    return {"wait": wait}
+
+
+@recipe_step('wait_for', required=('until',), optional=('timeout',))
+def _step_wait_for(session, step, context):
+    wait = wait_for_page(session.driver, step['until'], float(step.get('timeout', DEFAULT_WAIT_TIMEOUT)),
+                         context["previous_url"])
+    if wait['timed_out']:
+        raise ActionError(f"Timed out waiting for {step['until']}")
+    return {"wait": wait}
+
+
+@recipe_step('fill', required=('selector', 'value'), optional=('method', 'timeout'))
+def _step_fill(session, step, context):
+    def fill(element):
+        element.clear()
+        element.send_keys(str(step['value']))
+    
+    try:
+        context["lookup"].run(step.get('method', 'css'), step['selector'], fill,
+                              timeout=float(step.get('timeout', DEFAULT_WAIT_TIMEOUT)))
+    except TimeoutException:
+        raise ActionError(f"Element not found: {step['selector']}", 404)
+
+
+@recipe_step('click', required=('selector',), optional=('method', 'wait_until', 'timeout'))
+def _step_click(session, step, context):
+    driver = session.driver
+    timeout = float(step.get('timeout', DEFAULT_WAIT_TIMEOUT))
+    previous_url = driver.current_url
+    try:
+        context["lookup"].run(step.get('method', 'css'), step['selector'], lambda element: element.click(),
+                              timeout=timeout)
+    except TimeoutException:
+        raise ActionError(f"Element not found: {step['selector']}", 404)
+    context["previous_url"] = previous_url
+    wait = wait_for_page(driver, step.get('wait_until', 'networkidle'), timeout, previous_url)
+    if driver.current_url != previous_url:
+        invalidate_page_caches(session)
+    return {"wait": wait}
+
+
+@recipe_step('assert', optional=ASSERT_CONDITIONS)
+def _step_assert(session, step, context):
+    failure = check_conditions(session.driver, step)
+    if failure:
+        raise ActionError(f"Assertion failed: {failure}")
+
+
+@recipe_step('capture', required=('what',), optional=('as', 'selector', 'options'))
+def _step_capture(session, step, context):
+    driver = session.driver
+    what = step['what']
+    if what == 'screenshot':
+        options = step.get('options')
+        value = encode_base64(capture_screenshot(driver, screenshot_options(options if isinstance(options, dict) else {})))
+    elif what == 'url':
+        value = driver.current_url
+    elif what == 'title':
+        value = driver.title
+    elif what == 'fields':
+        value = do_extract_fields(session, {})['fields']
+    else:
+        value = page_html(driver, {'selector': step.get('selector'), 'mode': 'text' if what == 'text' else 'html'})
+    context["outputs"][step.get('as', what)] = value
+
+
+recipes = RecipeRegistry()
+
+
+@browser_action('recipe', 'Recipe', create=True)
+def do_recipe(session, data):
+    recipe = recipes.get(data.get('name'))
+    if recipe is None:
+        raise ActionError(f"Unknown recipe: {data.get('name')}", 404)
+    return recipe.run(session, data.get('params'), reuse_auth=data.get('reuse_auth', True))
+
+
+ORACLE_SIGNIN_URL = "https://idcs-86c9de635d0e4016b64bfef436100f1e.identity.oraclecloud.com/ui/v1/signin"
+ORACLE_USERNAME_SELECTOR = 'input[type="text"], input[type="email"], input[name*="user"], input[id*="user"]'
+ORACLE_PASSWORD_SELECTOR = 'input[type="password"]'
+ORACLE_SUBMIT_SELECTOR = 'button[type="submit"], input[type="submit"]'
+
+ORACLE_LOGIN_RECIPE = {
+    "name": "oracle_login",
+    "description": "Oracle Cloud (IDCS) sign-in",
+    "params": {
+        "username": {"required": True},
+        "password": {"required": True},
+        "domain": {"default": "Default"},
+        "wait_until": {"default": "url-change"},
+        "timeout": {"default": DEFAULT_WAIT_TIMEOUT},
+        "screenshot": {"default": {}}
+    },
+    "auth": {
+        "identity": "oracle:{{domain}}:{{username}}",
+        "secret": "{{password}}",
+        "check": {"url_not_contains": ORACLE_SIGNIN_URL, "selector_absent": ORACLE_PASSWORD_SELECTOR}
+    },
+    "steps": [
+        {"action": "navigate", "url": ORACLE_SIGNIN_URL, "wait_until": "domcontentloaded", "timeout": "{{timeout}}"},
+        {"action": "fill", "selector": ORACLE_USERNAME_SELECTOR, "value": "{{username}}", "timeout": "{{timeout}}", "optional": True},
+        {"action": "fill", "selector": ORACLE_PASSWORD_SELECTOR, "value": "{{password}}", "timeout": "{{timeout}}", "optional": True},
+        {"action": "click", "selector": ORACLE_SUBMIT_SELECTOR, "wait_until": "{{wait_until}}", "timeout": "{{timeout}}", "optional": True}
+    ],
+    "finally": [
+        {"action": "capture", "what": "screenshot", "as": "screenshot", "options": "{{screenshot}}", "if": "screenshot"}
+    ]
+}
+
+recipes.add(ORACLE_LOGIN_RECIPE, builtin=True)
+if RECIPES_DIR and os.path.isdir(RECIPES_DIR):
+    recipes.load_dir(RECIPES_DIR)
+
+
+@browser_action('oracle_login', 'Oracle login', create=True)
+def do_oracle_login(session, data):
+    if not data.get('username') or not data.get('password'):
+        raise ActionError("username and password are required")
+    
+    wait_until, timeout = _wait_params(data, 'url-change')
+    screenshot_request = data.get('screenshot')
+    screenshot_opts = screenshot_options(screenshot_request if isinstance(screenshot_request, dict) else {})
+    
+    # ה-recipe המובנה oracle_login - כאן רק התאמה לפורמט התשובה הקיים
+    result = recipes.get('oracle_login').run(session, {
+        'username': data['username'],
+        'password': data['password'],
+        'domain': data.get('domain', 'Default'),
+        'wait_until': wait_until,
+        'timeout': timeout,
+        'screenshot': False if screenshot_request is False else screenshot_opts
+    }, reuse_auth=data.get('reuse_auth', True))
+    
+    for step in result['steps']:
+        if step['status'] == 'failed':
+            logger.warning(f"Oracle login step {step['label']} failed: {step.get('error')}")
+    click = [step for step in result['steps'] if step['action'] == 'click']
+    
+    response = {
+        "success": result['success'],
+        "failed_step": result['failed_step'],
+        "current_url": result['current_url'],
+        "page_title": result['page_title'],
+        "screenshot": result['outputs'].get('screenshot'),
+        "screenshot_format": screenshot_opts['format'],
+        "wait": click[0].get('wait') if click else None,
+        "auth": result['auth'],
+        "steps": result['steps'],
+        "element_cache": result['element_cache']
+    }
+    if not result['success']:
+        step = result['steps'][result['failed_step']]
+        raise ActionError(f"Oracle login failed at step {step['label']}: {step.get('error')}", 500, response)
+    return response
+
+
+# ==================== Endpoints ====================
+
+@app.route('/navigate', methods=['POST'])
+def navigate():
+    """
+    ניווט לכתובת URL
+    
+    Body:
+        {
+            "url": "https://example.com",
+            "wait_until": "load",  // אופציונלי - domcontentloaded|load|networkidle|selector:<css>|url-change|none
+            "timeout": 10,  // אופציונלי - שניות
+            "profile": "lite",  // אופציונלי - פרופיל חסימת משאבים (נשאר ל-session)
+            "max_age": 300,  // אופציונלי - דף שנשמר ב-page_cache בשניות האחרונות מוגש בלי טעינה
+            "cache": true,  // אופציונלי - שמירת הדף ב-page_cache (max_age גורר שמירה)
+            "cache_screenshot": {"format": "jpeg"}  // אופציונלי - גם צילום במטמון (true = ברירת המחדל)
+        }
+    
+    page_cache משותף לכל ה-sessions (המפתח: URL + פרופיל החסימה) - רק לדפים שלא תלויים בהתחברות
+    """
+    return _action_response('navigate', request.json)
+
+
+@app.route('/screenshot', methods=['GET'])
+def screenshot():
+    """
+    צילום מסך של הדף הנוכחי
+    
+    Query:
+        format: png|jpeg|webp (ברירת מחדל png)
+        quality: 1-100 (jpeg/webp)
+        scale / max_width: הקטנה
+        clip: x,y,width,height
+        selector (+ method): צילום אלמנט בודד
+        raw: 1 - תמונה בינארית (image/*) במקום JSON
+        delta: 1 - רק ה-tiles שהשתנו מאז frame מספר since (tile = גודל tile)
+    
+    Returns:
+        תמונה (base64 encoded in JSON, או בינארית עם raw=1)
+    """
+    data = request.args.to_dict()
+    raw = data.pop('raw', '') in ('1', 'true')
+    
+    if not raw or data.get('delta'):
+        return _action_response('screenshot', data)
+    
+    session, error = _get_session()
+    if error:
+        return error
+    
+    try:
+        options = screenshot_options(data)
+        with session.lease(cached=True) as driver:
+            entry = cached_page(session, lambda entry: cached_screenshot(entry, options) is not None)
+            if entry is not None:
+                screenshot_data, current_url = cached_screenshot(entry, options), entry['final_url']
+            else:
+                screenshot_data = capture_screenshot(driver, options)
+                current_url = driver.current_url
+    except ActionError as e:
+        return jsonify({"error": str(e)}), e.status
+    except AdmissionError:
+        raise
+    except Exception as e:
+        logger.error(f"Screenshot error: {e}")
+        ERRORS.labels('screenshot', type(e).__name__).inc()
+        return jsonify({"error": str(e)}), 500
+    
+    return Response(
+        screenshot_data,
+        mimetype=SCREENSHOT_FORMATS[options['format']][1],
+        headers={"X-Page-Url": current_url}
+    )
+
+
+class Screencast:
+    """
+    Page.startScreencast של חלון אחד (session או טאב) - משותף לכל מי שצופה בו
+    
+    Chrome שולח frame (JPEG) רק כשהדף מצטייר מחדש, והבא נשלח רק אחרי ack על הקודם.
+    אין thread ברקע: כל צופה שואב את ה-performance log בקצב ה-fps שלו.
+    """
+    
+    def __init__(self, session, options):
+        self.session = session  # BrowserSession או BrowserTab
+        self.driver = session.driver
+        self.key = webview_id(session.handle)
+        self.options = options
+        self.viewers = 0
+        self.frame = None  # (seq, base64 jpeg)
+        self.seq = 0
+        self.acks = []
+        self.lock = threading.Lock()
+    
+    def push(self, params):
+        with self.lock:
+            self.seq += 1
+            self.frame = (self.seq, params.get('data'))
+            if 'sessionId' in params:
+                self.acks.append(params['sessionId'])
+    
+    def start(self):
+        params = {'format': 'jpeg', 'quality': self.options['quality'], 'everyNthFrame': 1}
+        if self.options['max_width']:
+            params['maxWidth'] = self.options['max_width']
+        if self.options['max_height']:
+            params['maxHeight'] = self.options['max_height']
+        with on_window(self.session.handle):
+            self.driver.execute_cdp_cmd('Page.startScreencast', params)
+    
+    def stop(self):
+        try:
+            with on_window(self.session.handle):
+                self.driver.execute_cdp_cmd('Page.stopScreencast', {})
+        except Exception as e:
+            logger.debug(f"stopScreencast failed: {e}")
+    
+    def active(self):
+        """
+        הדפדפן עדיין אותו דפדפן, ה-session במאגר והטאב (אם זה טאב) פתוח
+        """
+        root = self.session.root
+        if root.driver is not self.driver or pool.get(root.id) is not root:
+            return False
+        return self.session is root or root.tabs.get(self.session.tab_id) is self.session
+    
+    def pump(self):
+        """
+        שאיבת ה-log (אירועים אחרים נשמרים לפעולות) ו-ack על ה-frames שהגיעו - כדי ש-Chrome ישלח את הבאים
+        """
+        root = self.session.root
+        drain_cdp_events(self.session, stash=True)
+        root.last_used = time.time()  # צפייה היא שימוש - ה-reaper לא סוגר session שצופים בו
+        for cast in list(root.screencasts.values()):
+            with cast.lock:
+                acks, cast.acks = cast.acks, []
+            for frame_session in acks:
+                try:
+                    with on_window(cast.session.handle):
+                        self.driver.execute_cdp_cmd('Page.screencastFrameAck', {'sessionId': frame_session})
+                except Exception as e:
+                    logger.debug(f"screencastFrameAck failed: {e}")
+    
+    def mjpeg(self, fps, max_seconds):
+        """
+        multipart/x-mixed-replace - frame רק כשהדף השתנה (או keepalive), לכל היותר fps בשנייה
+        """
+        interval = 1.0 / fps
+        deadline = time.time() + max_seconds if max_seconds else None
+        sent_seq = 0
+        sent_at = 0
+        while self.active():
+            started = time.time()
+            self.pump()
+            with self.lock:
+                frame = self.frame
+            if frame and (frame[0] != sent_seq or started - sent_at >= SCREENCAST_KEEPALIVE):
+                jpeg = encode_frame(frame[1])
+                yield (b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+                       + str(len(jpeg)).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+                sent_seq, sent_at = frame[0], started
+            if deadline and time.time() >= deadline:
+                return
+            time.sleep(max(0.0, interval - (time.time() - started)))
+
+
+def encode_frame(data):
+    """
+    frame של screencast (base64 מ-CDP) ל-JPEG
+    """
+    started = time.perf_counter()
+    jpeg = base64.b64decode(data)
+    ENCODE_SECONDS.labels('screencast').observe(time.perf_counter() - started)
+    return jpeg
+
+
+def screencast_options(args):
+    """
+    פרמטרי /screencast - זורק ValueError על ערך לא חוקי
+    """
+    options = {
+        "quality": int(args.get('quality', SCREENCAST_QUALITY)),
+        "max_width": int(args.get('max_width', SCREENCAST_MAX_WIDTH)),
+        "max_height": int(args.get('max_height', 0)),
+        "fps": float(args.get('fps', SCREENCAST_FPS)),
+        "max_seconds": float(args.get('max_seconds', 0))
+    }
+    if not 1 <= options['quality'] <= 100:
+        raise ValueError("quality must be 1-100")
+    if not 0 < options['fps'] <= SCREENCAST_MAX_FPS:
+        raise ValueError(f"fps must be between 0 and {SCREENCAST_MAX_FPS}")
+    if options['max_width'] < 0 or options['max_height'] < 0 or options['max_seconds'] < 0:
+        raise ValueError("max_width, max_height and max_seconds must not be negative")
+    return options
+
+
+screencast_viewers = threading.BoundedSemaphore(SCREENCAST_MAX_VIEWERS)
+
+
+def open_screencast(session, options):
+    """
+    הצטרפות ל-screencast של החלון (מתחיל אותו אם זה הצופה הראשון)
+    """
+    root = session.root
+    with root.screencast_lock:
+        key = webview_id(session.handle)
+        cast = root.screencasts.get(key)
+        if cast is None or not cast.active():
+            cast = Screencast(session, options)
+            cast.start()
+            with root.cdp_lock:
+                root.screencasts[key] = cast
+            logger.info(f"Screencast started for session {root.id}"
+                        + (f" tab {session.tab_id}" if session is not root else ''))
+        cast.viewers += 1
+    SCREENCAST_VIEWERS.inc()
+    return cast
+
+
+def close_screencast(cast):
+    """
+    יציאת צופה - הצופה האחרון עוצר את ה-screencast
+    """
+    root = cast.session.root
+    SCREENCAST_VIEWERS.dec()
+    with root.screencast_lock:
+        cast.viewers -= 1
+        if cast.viewers > 0:
+            return
+        with root.cdp_lock:
+            if root.screencasts.get(cast.key) is cast:
+                del root.screencasts[cast.key]
+        if cast.active():
+            cast.stop()
+    logger.info(f"Screencast stopped for session {root.id}")
+
+
+@app.route('/screencast', methods=['GET'])
+def screencast():
+    """
+    שידור חי של הדף כ-MJPEG (Page.startScreencast) - לצפייה בלבד, בלי Xvfb/VNC
+    
+    אפשר לפתוח ישר בדפדפן או ב-<img src="/screencast?session_id=...">.
+    צופים באותו חלון חולקים screencast אחד (ההגדרות של הצופה הראשון).
+    
+    Query:
+        quality: 1-100 (JPEG, ברירת מחדל SCREENCAST_QUALITY)
+        max_width / max_height: גודל מקסימלי בפיקסלים (0 = ללא הגבלה)
+        fps: מקסימום frames בשנייה (ברירת מחדל SCREENCAST_FPS)
+        max_seconds: סגירת השידור אחרי X שניות (0 = עד שהצופה מתנתק)
+    """
+    try:
+        options = screencast_options(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    session, error = _get_session()
+    if error:
+        return error
+    
+    if not screencast_viewers.acquire(blocking=False):
+        return jsonify({"error": f"Too many screencast viewers (max {SCREENCAST_MAX_VIEWERS})"}), 503
+    try:
+        if session.pending_page is not None:
+            with session.lease():
+                pass  # lease טוען את הדף הממתין - צפייה צריכה את הדף החי
+        cast = open_screencast(session, options)
+    except AdmissionError:
+        screencast_viewers.release()
+        raise
+    except Exception as e:
+        screencast_viewers.release()
+        logger.error(f"Screencast error: {e}")
+        ERRORS.labels('screencast', type(e).__name__).inc()
+        if browser_crashed(e):
+            pool.recycle(session.root, 'crash')
+            return jsonify({"error": str(e), "recycled": True}), 503
+        return jsonify({"error": str(e)}), 500
+    
+    def finish():
+        close_screencast(cast)
+        screencast_viewers.release()
+    
+    response = Response(
+        cast.mjpeg(options['fps'], options['max_seconds']),
+        mimetype='multipart/x-mixed-replace; boundary=frame',
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    )
+    # call_on_close רץ גם כשהשרת סוגר את התשובה לפני ה-frame הראשון (finally של generator לא)
+    response.call_on_close(finish)
+    return response
+
+
+@app.route('/extract_fields', methods=['GET'])
+def extract_fields():
+    """
+    חילוץ כל שדות הטופס מהדף הנוכחי
+    
+    Query:
+        format: columnar - columns/rows במקום רשימת אובייקטים
+    """
+    return _action_response('extract_fields', request.args.to_dict())
+
+
+@app.route('/fill_field', methods=['POST'])
+def fill_field():
+    """
+    מילוי שדה טופס
+    
+    Body:
+        {
+            "selector": "#username",  // CSS selector או ID או name
+            "value": "myusername",
+            "method": "id|name|css|xpath"  // אופציונלי
+        }
+    """
+    return _action_response('fill_field', request.json)
+
+
+@app.route('/click', methods=['POST'])
+def click():
+    """
+    לחיצה על אלמנט
+    
+    Body:
+        {
+            "selector": "#submit-button",
+            "method": "id|name|css|xpath",
+            "wait_until": "networkidle",  // אופציונלי - כמו ב-/navigate
+            "timeout": 10  // אופציונלי - שניות
+        }
+    """
+    return _action_response('click', request.json)
+
+
+def _accepted_encoding():
+    """
+    הקידוד הטוב ביותר שה-client מקבל: br (אם brotli מותקן), gzip או כלום
+    """
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def _encode_chunks(chunks, encoding):
+    """
+    דחיסה בזרימה של רצף bytes
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        compress, flush = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 = gzip
+        compress, flush = compressor.compress, compressor.flush
+    
+    spent = 0.0
+    for chunk in chunks:
+        started = time.perf_counter()
+        out = compress(chunk)
+        spent += time.perf_counter() - started
+        if out:
+            yield out
+    yield flush()
+    ENCODE_SECONDS.labels(encoding).observe(spent)
+
+
+def compressed_response(chunks, mimetype, status=200, headers=None):
+    """
+    תשובה דחוסה לפי Accept-Encoding (או כמו שהיא אם ה-client לא מבקש דחיסה)
+    """
+    headers = dict(headers or {})
+    headers['Vary'] = 'Accept-Encoding'
+    encoding = _accepted_encoding()
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        chunks = _encode_chunks(chunks, encoding)
+    return Response(chunks, status=status, mimetype=mimetype, headers=headers)
+
+
+HTML_CHUNK_SIZE = 64 * 1024
+
+
+@app.route('/get_html', methods=['GET'])
+def get_html():
+    """
+    קבלת HTML של הדף הנוכחי
+    
+    Query:
+        selector: outerHTML של אלמנט אחד במקום כל הדף
+        mode: html (ברירת מחדל) או text - טקסט נראה בלבד
+        strip: scripts,styles,comments - להסיר מה-HTML
+        since: hash מהקריאה הקודמת - מחזיר unchanged או diff במקום הכל
+        raw: 1 - text/html ישירות (streaming) במקום JSON
+    
+    התשובה נדחסת (gzip/br) לפי Accept-Encoding.
+    """
+    data = request.args.to_dict()
+    raw = data.pop('raw', '') in ('1', 'true')
+    
+    session, error = _get_session()
+    if error:
+        return error
+    
+    with session.lease(cached=not raw):
+        if raw:
+            try:
+                html = page_html(session.driver, data)
+            except ActionError as e:
+                return jsonify({"error": str(e)}), e.status
+            except Exception as e:
+                logger.error(f"Get HTML error: {e}")
+                ERRORS.labels('get_html', type(e).__name__).inc()
+                return jsonify({"error": str(e)}), 500
+        else:
+            result, status = run_action(session, 'get_html', data)
+    
+    if raw:
+        body = html.encode('utf-8')
+        chunks = (body[i:i + HTML_CHUNK_SIZE] for i in range(0, len(body), HTML_CHUNK_SIZE))
+        mimetype = 'text/plain' if data.get('mode') == 'text' else 'text/html'
+        return compressed_response(chunks, mimetype)
+    
+    return compressed_response([json.dumps(result).encode('utf-8')], 'application/json', status)
+
+
+@app.route('/execute_js', methods=['POST'])
+def execute_js():
+    """
+    הרצת JavaScript בדף
+    
+    Body:
+        {
+            "script": "return document.title;",
+            "args": ["..."],     // אופציונלי - arguments[0], arguments[1]...
+            "async": false       // true - הגוף הוא async function (await / Promise)
+        }
+        או סקריפט רשום: {"script_id": "<id או שם>", "args": [...]}
+    """
+    return _action_response('execute_js', request.json)
+
+
+@app.route('/scripts', methods=['POST'])
+def register_script():
+    """
+    רישום סקריפט - מחזיר script_id (hash של התוכן) להפעלה ב-/execute_js או ב-/scripts/<id>/run
+    
+    Body:
+        {
+            "source": "return document.querySelectorAll(arguments[0]).length;",
+            "name": "count",     // אופציונלי
+            "async": false,      // true - הגוף הוא async function
+            "inject": false      // true - מוגדר מראש בכל מסמך חדש
+        }
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        script, created = scripts.add(data.get('source'), data.get('name'), data.get('async', False),
+                                      data.get('inject', False))
+    except ScriptError as e:
+        return jsonify({"error": str(e)}), e.status
+    
+    return jsonify({"success": True, "script": script.info()}), 201 if created else 200
+
+
+@app.route('/scripts', methods=['GET'])
+def list_scripts():
+    """
+    רשימת הסקריפטים הרשומים (בלי התוכן)
+    """
+    return jsonify({"scripts": scripts.list()})
+
+
+@app.route('/scripts/<key>', methods=['GET'])
+def get_script(key):
+    """
+    סקריפט רשום לפי id או שם, כולל התוכן
+    """
+    script = scripts.get(key)
+    if script is None:
+        return jsonify({"error": f"Unknown script: {key}"}), 404
+    return jsonify({**script.info(), "source": script.source})
+
+
+@app.route('/scripts/<key>', methods=['DELETE'])
+def delete_script(key):
+    """
+    מחיקת סקריפט (לא built-in) - ההזרקה שלו מוסרת מכל חלון בקריאה הבאה לסקריפט שם
+    """
+    script = scripts.remove(key)
+    if script is None:
+        return jsonify({"error": f"Unknown script: {key}"}), 404
+    if script.builtin:
+        return jsonify({"error": f"Script {key} is built in"}), 409
+    return jsonify({"success": True, "script_id": script.id, "deleted": True})
+
+
+@app.route('/scripts/<key>/run', methods=['POST'])
+def run_registered_script(key):
+    """
+    הפעלת סקריפט רשום
+    
+    Body:
+        {"args": [...]}
+    """
+    data = request.get_json(silent=True) or {}
+    return _action_response('execute_js', {'args': data.get('args', []), 'script_id': key})
+
+
+@app.route('/oracle_login', methods=['POST'])
+def oracle_login():
+    """
+    התחברות אוטומטית ל-Oracle Cloud
+    
+    Body:
+        {
+            "username": "email@example.com",
+            "password": "password123",
+            "domain": "Default",
+            "wait_until": "url-change",  // אופציונלי - המתנה אחרי Sign In
+            "timeout": 10,  // אופציונלי - שניות
+            "screenshot": {"format": "jpeg", "quality": 70},  // אופציונלי - או false
+            "reuse_auth": true  // אופציונלי - false מדלג על ה-snapshot ומתחבר מחדש
+        }
+    """
+    return _action_response('oracle_login', request.json)
+
+
+@app.route('/auth_snapshots', methods=['GET'])
+def list_auth_snapshots():
+    """
+    הזהויות שיש להן snapshot (בלי ה-cookies עצמם)
+    """
+    return jsonify({"ttl": AUTH_SNAPSHOT_TTL, "snapshots": auth_snapshots.info()})
+
+
+@app.route('/auth_snapshots', methods=['DELETE'])
+def clear_auth_snapshots():
+    """
+    מחיקת snapshots - כולם, או של זהות אחת (?identity=...)
+    """
+    identity = request.args.get('identity')
+    if identity:
+        if not auth_snapshots.discard(identity):
+            return jsonify({"error": f"Unknown identity: {identity}"}), 404
+        return jsonify({"success": True, "cleared": 1})
+    return jsonify({"success": True, "cleared": auth_snapshots.clear()})
+
+
+@app.route('/page_cache', methods=['GET'])
+def page_cache_info():
+    """
+    מצב מטמון הדפים: hit rate, זיכרון, והדפים השמורים
+    """
+    return jsonify(page_cache.info())
 
 
-@app.route('/status')
-def status():
+@app.route('/page_cache', methods=['DELETE'])
+def clear_page_cache():
     """
-    בדיקת סטטוס הדפדפן
+    ריקון מטמון הדפים - כולו, או URL אחד (?url=...)
     """
-    global driver
-    
-    if driver is None:
-        return jsonify({
-            "browser": "not_initialized",
-            "ready": False
-        })
-    
-    try:
-        current_url = driver.current_url
-        title = driver.title
-        
-        return jsonify({
-            "browser": "ready",
-            "ready": True,
-            "current_url": current_url,
-            "page_title": title
-        })
-    except Exception as e:
-        return jsonify({
-            "browser": "error",
-            "ready": False,
-            "error": str(e)
-        })
+    return jsonify({"success": True, "cleared": page_cache.clear(request.args.get('url'))})
 
 
-@app.route('/navigate', methods=['POST'])
-def navigate():
+@app.route('/recipes', methods=['POST'])
+def register_recipe():
     """
-    ניווט לכתובת URL
+    רישום recipe (JSON, או YAML עם Content-Type: application/yaml) - נבדק ומקומפל מיד
     
     Body:
         {
-            "url": "https://example.com"
+            "name": "example_login",
+            "params": {"user": {"required": true}, "password": {"required": true}},
+            "auth": {"identity": "example:{{user}}", "secret": "{{password}}",
+                     "check": {"selector_absent": "#password"}},  // אופציונלי
+            "steps": [
+                {"action": "navigate", "url": "https://example.com/login"},
+                {"action": "fill", "selector": "#user", "value": "{{user}}"},
+                {"action": "fill", "selector": "#password", "value": "{{password}}"},
+                {"action": "click", "selector": "button[type=submit]", "wait_until": "url-change"},
+                {"action": "assert", "url_not_contains": "/login"},
+                {"action": "capture", "what": "title", "as": "title"}
+            ],
+            "finally": [{"action": "capture", "what": "screenshot"}]  // רץ תמיד
         }
     """
-    global driver
-    
-    if driver is None:
-        driver = init_browser()
-    
-    data = request.json
-    url = data.get('url')
+    if request.mimetype in ('application/yaml', 'application/x-yaml', 'text/yaml'):
+        if yaml is None:
+            return jsonify({"error": "YAML recipes need PyYAML (pip install pyyaml)"}), 415
+        try:
+            source = yaml.safe_load(request.get_data())
+        except yaml.YAMLError as e:
+            return jsonify({"error": f"Invalid YAML: {e}"}), 400
+    else:
+        source = request.get_json(silent=True)
     
-    if not url:
-        return jsonify({"error": "URL is required"}), 400
+    existing = recipes.get(source.get('name')) if isinstance(source, dict) else None
+    if existing is not None and existing.builtin:
+        return jsonify({"error": f"Recipe {existing.name} is built in"}), 409
     
     try:
-        logger.info(f"Navigating to: {url}")
-        driver.get(url)
-        time.sleep(3)  # המתן לטעינה
-        
-        return jsonify({
-            "success": True,
-            "url": driver.current_url,
-            "title": driver.title
-        })
-    except Exception as e:
-        logger.error(f"Navigation error: {e}")
-        return jsonify({"error": str(e)}), 500
+        recipe = recipes.add(source)
+    except RecipeError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({"success": True, "recipe": recipe.info()}), 201
 
 
-@app.route('/screenshot', methods=['GET'])
-def screenshot():
+@app.route('/recipes', methods=['GET'])
+def list_recipes():
     """
-    צילום מסך של הדף הנוכחי
+    רשימת ה-recipes הרשומים
+    """
+    return jsonify({"recipes": recipes.list(), "steps": sorted(RECIPE_STEPS)})
+
+
+@app.route('/recipes/<name>', methods=['GET'])
+def get_recipe(name):
+    """
+    המסמך המקורי של recipe
+    """
+    recipe = recipes.get(name)
+    if recipe is None:
+        return jsonify({"error": f"Unknown recipe: {name}"}), 404
+    return jsonify({**recipe.info(), "source": recipe.source})
+
+
+@app.route('/recipes/<name>', methods=['DELETE'])
+def delete_recipe(name):
+    """
+    מחיקת recipe (לא built-in)
+    """
+    recipe = recipes.remove(name)
+    if recipe is None:
+        return jsonify({"error": f"Unknown recipe: {name}"}), 404
+    if recipe.builtin:
+        return jsonify({"error": f"Recipe {name} is built in"}), 409
+    return jsonify({"success": True, "name": name, "deleted": True})
+
+
+@app.route('/recipes/<name>/run', methods=['POST'])
+def run_recipe(name):
+    """
+    הרצת recipe על ה-session
+    
+    Body:
+        {
+            "params": {"user": "me", "password": "..."},
+            "reuse_auth": true  // אופציונלי - false מדלג על snapshot של התחברות קודמת
+        }
     
     Returns:
-        PNG image (base64 encoded in JSON)
+        success, failed_step, outputs ותוצאה + elapsed_ms לכל צעד
     """
-    global driver
-    
-    if driver is None:
-        return jsonify({"error": "Browser not initialized"}), 400
+    data = request.get_json(silent=True) or {}
+    return _action_response('recipe', {**data, 'name': name})
+
+
+def validate_steps(steps, default_on_error='stop'):
+    """
+    בדיקת רשימת צעדים ל-batch - זורק ActionError אם לא תקינה
+    """
+    if default_on_error not in ('stop', 'continue'):
+        raise ActionError("on_error must be 'stop' or 'continue'")
+    if not isinstance(steps, list) or not steps:
+        raise ActionError("steps must be a non-empty list")
     
-    try:
-        # צלם מסך
-        screenshot_png = driver.get_screenshot_as_png()
-        
-        # המר ל-base64
-        screenshot_b64 = base64.b64encode(screenshot_png).decode('utf-8')
-        
-        return jsonify({
-            "success": True,
-            "screenshot": screenshot_b64,
-            "url": driver.current_url,
-            "format": "png"
-        })
-    except Exception as e:
-        logger.error(f"Screenshot error: {e}")
-        return jsonify({"error": str(e)}), 500
+    for index, step in enumerate(steps):
+        action = step.get('action') if isinstance(step, dict) else None
+        if action not in ACTIONS:
+            raise ActionError(f"Step {index}: unknown action {action} (expected one of {', '.join(sorted(ACTIONS))})")
+        if step.get('on_error', default_on_error) not in ('stop', 'continue'):
+            raise ActionError(f"Step {index}: on_error must be 'stop' or 'continue'")
 
 
-@app.route('/extract_fields', methods=['GET'])
-def extract_fields():
+def run_steps(session, steps, default_on_error='stop'):
     """
-    חילוץ כל שדות הטופס מהדף הנוכחי
+    הרצת צעדים לפי הסדר על session שכבר מושכר
+    
+    Returns:
+        {"success", "session_id", "completed", "total", "stopped_at", "results"}
     """
-    global driver
-    
-    if driver is None:
-        return jsonify({"error": "Browser not initialized"}), 400
-    
-    try:
-        # JavaScript לחילוץ שדות
-        script = """
-        const fields = [];
-        const inputs = document.querySelectorAll('input, select, textarea, button');
-        
-        inputs.forEach((element, index) => {
-            const field = {
-                index: index,
-                tag: element.tagName.toLowerCase(),
-                type: element.type || 'text',
-                name: element.name || '',
-                id: element.id || '',
-                placeholder: element.placeholder || '',
-                value: element.value || '',
-                label: '',
-                visible: element.offsetParent !== null,
-                required: element.required || false
-            };
-            
-            // חפש label
-            if (element.id) {
-                const label = document.querySelector(`label[for="${element.id}"]`);
-                if (label) field.label = label.textContent.trim();
-            }
-            
-            if (!field.label) {
-                const parentLabel = element.closest('label');
-                if (parentLabel) field.label = parentLabel.textContent.trim();
-            }
-            
-            fields.push(field);
-        });
-        
-        return fields;
-        """
-        
-        fields = driver.execute_script(script)
-        
-        # סנן רק שדות נראים
-        visible_fields = [f for f in fields if f['visible']]
-        
-        return jsonify({
-            "success": True,
-            "fields": visible_fields,
-            "total": len(fields),
-            "visible": len(visible_fields)
+    results = []
+    stopped_at = None
+    
+    for index, step in enumerate(steps):
+        params = {k: v for k, v in step.items() if k not in ('action', 'on_error')}
+        started = time.monotonic()
+        result, status = run_action(session, step['action'], params)
+        results.append({
+            "index": index,
+            "action": step['action'],
+            "status": status,
+            "elapsed_ms": round((time.monotonic() - started) * 1000),
+            "result": result
         })
-    except Exception as e:
-        logger.error(f"Extract fields error: {e}")
-        return jsonify({"error": str(e)}), 500
+        
+        if status != 200 and step.get('on_error', default_on_error) == 'stop':
+            stopped_at = index
+            break
+    
+    return {
+        "success": all(r['status'] == 200 for r in results) and stopped_at is None,
+        "session_id": session.id,
+        "completed": len(results),
+        "total": len(steps),
+        "stopped_at": stopped_at,
+        "results": results
+    }
 
 
-@app.route('/fill_field', methods=['POST'])
-def fill_field():
+@app.route('/batch', methods=['POST'])
+def batch():
     """
-    מילוי שדה טופס
+    הרצת רצף פעולות בקריאת HTTP אחת (הדפדפן נעול לכל אורך הרצף)
     
     Body:
         {
-            "selector": "#username",  // CSS selector או ID או name
-            "value": "myusername",
-            "method": "id|name|css"  // אופציונלי
+            "steps": [
+                {"action": "navigate", "url": "https://example.com"},
+                {"action": "fill_field", "selector": "#user", "value": "me", "on_error": "continue"},
+                {"action": "click", "selector": "#submit"},
+                {"action": "screenshot"}
+            ],
+            "on_error": "stop|continue"  // ברירת מחדל לכל הצעדים: stop
         }
+    
+    Returns:
+        תוצאות כל הצעדים לפי הסדר
     """
-    global driver
+    data = request.json or {}
+    steps = data.get('steps')
+    default_on_error = data.get('on_error', 'stop')
     
-    if driver is None:
-        return jsonify({"error": "Browser not initialized"}), 400
+    try:
+        validate_steps(steps, default_on_error)
+    except ActionError as e:
+        return jsonify({"error": str(e)}), e.status
     
-    data = request.json
-    selector = data.get('selector')
-    value = data.get('value')
-    method = data.get('method', 'css')  # ברירת מחדל: CSS selector
+    session, error = _get_session(create=any(ACTIONS[step['action']].create for step in steps))
+    if error:
+        return error
     
-    if not selector or value is None:
-        return jsonify({"error": "selector and value are required"}), 400
+    with session.lease(cached=True):
+        result = run_steps(session, steps, default_on_error)
+    result["queue_wait_ms"] = round(g.queue_wait * 1000)
+    return jsonify(result)
+
+
+# ==================== Fetch many ====================
+#
+# הרבה URLs במקביל: כל worker מחזיק session משלו (זמני מהמאגר) ומושך URLs מתור משותף.
+# כל תוצאה נשלחת כשורת JSON (NDJSON) ברגע שהיא מוכנה.
+
+FETCH_MANY_MAX_URLS = int(os.environ.get('FETCH_MANY_MAX_URLS', 1000))
+FETCH_INCLUDE_OPTIONS = ('html', 'text', 'screenshot', 'fields')
+FETCH_POLL_INTERVAL = 1  # כל כמה שניות ה-stream בודק שעוד יש workers חיים
+
+
+def fetch_one(session, url, options):
+    """
+    ניווט ל-URL אחד ואיסוף מה שביקשו (include)
+    """
+    started = time.monotonic()
+    record = {"url": url}
+    
+    # page_cache רק לדף שלם - selector דורש את הדף החי
+    use_cache = (options['max_age'] is not None or options['cache']) and not options['selector']
+    cache_key = page_cache.key(url, session.blocked_urls) if use_cache else None
+    if use_cache and options['max_age'] is not None:
+        entry = page_cache.get(cache_key, options['max_age'])
+        if entry is not None and ('screenshot' not in options['include']
+                                  or cached_screenshot(entry, options['screenshot']) is not None):
+            record.update(page_cache_record(entry, options))
+            record["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+            return record
+    
+    result, status = run_action(session, 'navigate', {
+        'url': url,
+        'wait_until': options['wait_until'],
+        'timeout': options['timeout']
+    })
+    if status != 200:
+        record.update(status="error", error=result.get('error'))
+    elif use_cache and not result['wait']['timed_out'] and (result['http_status'] or 200) < 400:
+        try:
+            screenshot = options['screenshot'] if 'screenshot' in options['include'] else None
+            entry = capture_page(session, url, result, screenshot)
+            page_cache.put(cache_key, entry)
+            record.update(page_cache_record(entry, options), wait=result['wait'], network=result['network'])
+            record["page_cache"] = {"hit": False}
+        except Exception as e:
+            record.update(status="error", error=str(e))
+    else:
+        record.update(
+            status="ok",
+            final_url=result['url'],
+            title=result['title'],
+            http_status=result['http_status'],
+            wait=result['wait'],
+            network=result['network']
+        )
+        driver = session.driver
+        try:
+            for part in options['include']:
+                if part in ('html', 'text'):
+                    record[part] = page_html(driver, {'mode': part, 'selector': options['selector']})
+                elif part == 'screenshot':
+                    record[part] = encode_base64(capture_screenshot(driver, options['screenshot']))
+                elif part == 'fields':
+                    record[part] = do_extract_fields(session, {})['fields']
+        except Exception as e:
+            record.update(status="error", error=str(e))
+    record["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+    return record
+
+
+def page_cache_record(entry, options):
+    """
+    שורת תוצאה של fetch_many מ-entry של page_cache
+    """
+    record = {
+        "status": "ok",
+        "final_url": entry['final_url'],
+        "title": entry['title'],
+        "http_status": entry['http_status'],
+        "page_cache": {"hit": True, "age": round(time.time() - entry['stored_at'], 1)}
+    }
+    for part in options['include']:
+        if part in ('html', 'text'):
+            record[part] = entry[part]
+        elif part == 'screenshot':
+            record[part] = encode_base64(cached_screenshot(entry, options['screenshot']))
+        elif part == 'fields':
+            columns = entry['fields']['columns']
+            record[part] = [dict(zip(columns, row), visible=True) for row in entry['fields']['rows']]
+    return record
+
+
+def _fetch_worker(session, work, results, stop, options, opener=None):
+    if session is None:
+        # Chrome נוסף עולה במקביל ל-workers שכבר עובדים
+        try:
+            session = opener()
+        except PoolExhausted:
+            return
+        except Exception as e:
+            logger.error(f"fetch_many could not open a session: {e}")
+            return
     
     try:
-        # מצא את האלמנט
-        if method == 'id':
-            element = driver.find_element(By.ID, selector)
-        elif method == 'name':
-            element = driver.find_element(By.NAME, selector)
-        else:  # css
-            element = driver.find_element(By.CSS_SELECTOR, selector)
-        
-        # נקה ומלא
-        element.clear()
-        element.send_keys(value)
-        
-        logger.info(f"Filled field {selector} with value")
-        
-        return jsonify({
-            "success": True,
-            "selector": selector,
-            "filled": True
-        })
+        with session.lease():
+            while not stop.is_set():
+                try:
+                    index, url = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    record = fetch_one(session, url, options)
+                except Exception as e:
+                    record = {"url": url, "status": "error", "error": str(e)}
+                record["index"] = index
+                record["session_id"] = session.id
+                results.put(record)
     except Exception as e:
-        logger.error(f"Fill field error: {e}")
-        return jsonify({"error": str(e)}), 500
+        # ה-session נסגר (QueueClosed) או שהדפדפן לא זמין - ה-URLs שנשארו לא יחכו לנצח
+        logger.error(f"fetch_many worker on session {session.id} failed: {e}")
+        _fail_remaining(work, results, str(e))
 
 
-@app.route('/click', methods=['POST'])
-def click():
+def _fail_remaining(work, results, error):
     """
-    לחיצה על אלמנט
+    רשומת שגיאה לכל URL שעוד לא נלקח מהתור
+    """
+    while True:
+        try:
+            index, url = work.get_nowait()
+        except queue.Empty:
+            return
+        results.put({"url": url, "status": "error", "error": error, "index": index})
+
+
+def _finish_fetch(workers, temporary, restore=None):
+    for worker in workers:
+        worker.join()
+    if restore is not None:
+        session, name, patterns = restore
+        try:
+            with session.lease():
+                if session.blocked_urls != patterns:
+                    block_urls(session.driver, patterns)
+                session.resource_profile, session.blocked_urls = name, patterns
+        except Exception as e:
+            logger.error(f"fetch_many could not restore profile of session {session.id}: {e}")
+    for session in temporary:
+        if isinstance(session, BrowserTab):
+            session.session.close_tab(session.tab_id)
+        else:
+            pool.release(session.id)
+
+
+@app.route('/fetch_many', methods=['POST'])
+def fetch_many():
+    """
+    טעינת רשימת URLs במקביל על כמה דפדפנים, עם תוצאות בזרם NDJSON
     
     Body:
         {
-            "selector": "#submit-button",
-            "method": "id|name|css|xpath"
+            "urls": ["https://a.com", "https://b.com", ...],
+            "concurrency": 4,  // כמה דפדפנים במקביל (sessions זמניים מהמאגר)
+            "include": ["html", "screenshot", "fields"],  // אופציונלי - גם "text"
+            "selector": "main",  // אופציונלי - html/text של אלמנט אחד
+            "screenshot": {"format": "jpeg", "quality": 60},  // אופציונלי
+            "wait_until": "load",
+            "timeout": 10,
+            "profile": "lite",  // אופציונלי - פרופיל חסימת משאבים ל-sessions הזמניים (או ל-session של הבקשה, לזמן ה-fetch)
+            "tabs": true,  // אופציונלי - טאבים זמניים בדפדפן של ה-session במקום sessions נפרדים
+            "max_age": 300,  // אופציונלי - דפים שנשמרו ב-page_cache בשניות האחרונות לא נטענים שוב
+            "cache": true  // אופציונלי - שמירת הדפים שנטענו ב-page_cache (max_age גורר שמירה)
         }
+    
+    Returns:
+        application/x-ndjson - שורה לכל URL לפי סדר הסיום
+        {"index", "url", "status": "ok|error", "final_url", "title", "http_status", "elapsed_ms", ...}
+        ובסוף שורת סיכום {"done": true, "total", "ok", "errors", "elapsed_ms"}
     """
-    global driver
+    data = request.get_json(silent=True) or {}
+    urls = data.get('urls')
+    include = data.get('include') or []
     
-    if driver is None:
-        return jsonify({"error": "Browser not initialized"}), 400
+    if not isinstance(urls, list) or not urls or not all(isinstance(u, str) and u for u in urls):
+        return jsonify({"error": "urls must be a non-empty list of strings"}), 400
+    if len(urls) > FETCH_MANY_MAX_URLS:
+        return jsonify({"error": f"At most {FETCH_MANY_MAX_URLS} urls per request"}), 400
+    unknown = [part for part in include if part not in FETCH_INCLUDE_OPTIONS]
+    if unknown:
+        return jsonify({"error": f"Unknown include options: {', '.join(unknown)} (expected {', '.join(FETCH_INCLUDE_OPTIONS)})"}), 400
     
-    data = request.json
-    selector = data.get('selector')
-    method = data.get('method', 'css')
+    try:
+        wait_until, timeout = _wait_params(data, 'load')
+        use_tabs = bool(data.get('tabs'))
+        limit = MAX_TABS_PER_SESSION if use_tabs else POOL_SIZE
+        concurrency = max(1, min(int(data.get('concurrency', 4)), len(urls), limit))
+        options = {
+            'wait_until': wait_until,
+            'timeout': timeout,
+            'include': include,
+            'selector': data.get('selector'),
+            'screenshot': screenshot_options(data.get('screenshot') or {}),
+            'max_age': float(data['max_age']) if data.get('max_age') is not None else None,
+            'cache': bool(data.get('cache'))
+        }
+        profile = data.get('profile')
+        if profile is not None:
+            resolve_resource_profile(profile)
+    except ActionError as e:
+        return jsonify({"error": str(e)}), e.status
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
     
-    if not selector:
-        return jsonify({"error": "selector is required"}), 400
+    # sessions זמניים מהמאגר (כמה שיש מקום) או טאבים זמניים. הראשון נפתח כאן - אם אין מקום
+    # בכלל, עובדים על ה-session של הבקשה לבד; השאר נפתחים בתוך ה-workers
+    temporary = []
+    if use_tabs:
+        root, error = _get_browser_session(create=True)
+        if error:
+            return error
+    
+    def open_session():
+        session = pool.open(profile=profile)
+        temporary.append(session)
+        return session
     
+    def open_tab():
+        tab = root.open_tab()
+        temporary.append(tab)
+        if profile is not None:
+            with tab.lease():
+                apply_resource_profile(tab, profile)
+        return tab
+    
+    opener = open_tab if use_tabs else open_session
+    
+    restore = None  # (session, name, patterns) - הפרופיל שהיה על ה-session של הבקשה
     try:
-        # מצא את האלמנט
-        if method == 'id':
-            element = driver.find_element(By.ID, selector)
-        elif method == 'name':
-            element = driver.find_element(By.NAME, selector)
-        elif method == 'xpath':
-            element = driver.find_element(By.XPATH, selector)
-        else:  # css
-            element = driver.find_element(By.CSS_SELECTOR, selector)
-        
-        # לחץ
-        element.click()
-        time.sleep(2)  # המתן אחרי לחיצה
-        
-        logger.info(f"Clicked on {selector}")
-        
-        return jsonify({
-            "success": True,
-            "selector": selector,
-            "clicked": True,
-            "current_url": driver.current_url
-        })
+        first = opener()
+    except PoolExhausted:
+        first, error = _get_session(create=True)
+        if error:
+            return error
+        concurrency = 1
+        if profile is not None:
+            # הפרופיל המבוקש חל גם כאן - רק לזמן ה-fetch
+            restore = (first, first.resource_profile, first.blocked_urls)
+            try:
+                with first.lease():
+                    apply_resource_profile(first, profile)
+            except AdmissionError:
+                raise
+            except Exception as e:
+                logger.error(f"fetch_many could not apply profile: {e}")
+                return jsonify({"error": str(e)}), 500
+    except AdmissionError:
+        raise
     except Exception as e:
-        logger.error(f"Click error: {e}")
+        logger.error(f"fetch_many could not open a session: {e}")
         return jsonify({"error": str(e)}), 500
+    
+    work = queue.Queue()
+    for index, url in enumerate(urls):
+        work.put((index, url))
+    results = queue.Queue()
+    stop = threading.Event()
+    workers = [
+        threading.Thread(
+            target=_fetch_worker,
+            args=(first if i == 0 else None, work, results, stop, options, opener),
+            name='fetch-many',
+            daemon=True
+        )
+        for i in range(concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    
+    def generate():
+        started = time.monotonic()
+        ok = 0
+        pending = set(range(len(urls)))
+        try:
+            while pending:
+                try:
+                    record = results.get(timeout=FETCH_POLL_INTERVAL)
+                except queue.Empty:
+                    if any(worker.is_alive() for worker in workers) or not results.empty():
+                        continue
+                    # כל ה-workers יצאו בלי לענות על הכל - השאר נכשלים במקום לתקוע את ה-stream
+                    for index in sorted(pending):
+                        yield json.dumps({"url": urls[index], "status": "error",
+                                          "error": "No browser was available for this URL", "index": index}) + '\n'
+                    break
+                pending.discard(record['index'])
+                ok += record['status'] == 'ok'
+                yield json.dumps(record) + '\n'
+            yield json.dumps({
+                "done": True,
+                "total": len(urls),
+                "ok": ok,
+                "errors": len(urls) - ok,
+                "sessions": max(len(temporary), 1),
+                "elapsed_ms": round((time.monotonic() - started) * 1000)
+            }) + '\n'
+        finally:
+            # גם אם ה-client התנתק באמצע: עוצרים את ה-workers ומשחררים את ה-sessions ברקע
+            stop.set()
+            threading.Thread(target=_finish_fetch, args=(workers, temporary, restore), name='fetch-many-cleanup',
+                             daemon=True).start()
+    
+    return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
 
 
-@app.route('/get_html', methods=['GET'])
-def get_html():
+# ==================== Async jobs ====================
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', POOL_SIZE))
+JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 600))
+MAX_JOB_WAIT = 60
+
+
+class Job:
     """
-    קבלת HTML של הדף הנוכחי
+    פעולה שרצה ברקע - התוצאה נשמרת עד JOB_RETENTION שניות אחרי הסיום
     """
-    global driver
     
-    if driver is None:
-        return jsonify({"error": "Browser not initialized"}), 400
+    def __init__(self, action, params, session_id):
+        self.id = uuid.uuid4().hex[:12]
+        self.action = action
+        self.params = params
+        self.session_id = session_id
+        self.status = 'queued'
+        self.result = None
+        self.http_status = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        self.future = None
     
-    try:
-        html = driver.page_source
-        
-        return jsonify({
-            "success": True,
-            "html": html,
-            "url": driver.current_url,
-            "title": driver.title
-        })
-    except Exception as e:
-        logger.error(f"Get HTML error: {e}")
-        return jsonify({"error": str(e)}), 500
+    def finish(self, result, http_status):
+        self.result = result
+        self.http_status = http_status
+        self.status = 'done' if http_status == 200 else 'failed'
+        self.finished_at = time.time()
+        self.done.set()
+    
+    def to_dict(self, include_result=True):
+        job = {
+            "job_id": self.id,
+            "action": self.action,
+            "session_id": self.session_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "queued_ms": round(((self.started_at or time.time()) - self.created_at) * 1000),
+            "elapsed_ms": round(((self.finished_at or time.time()) - self.started_at) * 1000) if self.started_at else None
+        }
+        if include_result and self.done.is_set():
+            job["http_status"] = self.http_status
+            job["result"] = self.result
+        return job
 
 
-@app.route('/execute_js', methods=['POST'])
-def execute_js():
+class JobManager:
     """
-    הרצת JavaScript בדף
-    
-    Body:
-        {
-            "script": "return document.title;"
-        }
+    הרצת פעולות דפדפן ברקע על executor, כדי שבקשות HTTP לא יחכו לניווט איטי
     """
-    global driver
     
-    if driver is None:
-        return jsonify({"error": "Browser not initialized"}), 400
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.jobs = {}
+        self.lock = threading.Lock()
     
-    data = request.json
-    script = data.get('script')
+    def submit(self, action, params, session_id):
+        self._prune()
+        job = Job(action, params, session_id)
+        with self.lock:
+            self.jobs[job.id] = job
+        job.future = self.executor.submit(self._run, job)
+        return job
     
-    if not script:
-        return jsonify({"error": "script is required"}), 400
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
     
-    try:
-        result = driver.execute_script(script)
+    def cancel(self, job_id):
+        """
+        ביטול job שעוד לא התחיל לרוץ
+        """
+        job = self.get(job_id)
+        if job is None or not job.future.cancel():
+            return False
+        job.status = 'cancelled'
+        job.finished_at = time.time()
+        job.done.set()
+        return True
+    
+    def list(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict(include_result=False) for job in jobs]
+    
+    def _run(self, job):
+        job.started_at = time.time()
+        job.status = 'running'
         
-        return jsonify({
-            "success": True,
-            "result": result
-        })
-    except Exception as e:
-        logger.error(f"Execute JS error: {e}")
-        return jsonify({"error": str(e)}), 500
+        try:
+            create = job.action == 'batch' and any(ACTIONS[s['action']].create for s in job.params['steps'])
+            create = create or (job.action in ACTIONS and ACTIONS[job.action].create)
+            
+            session = pool.get(job.session_id)
+            if session is None and job.session_id == DEFAULT_SESSION_ID and create:
+                session = pool.open(DEFAULT_SESSION_ID)
+            if session is None:
+                job.finish({"error": f"Unknown session: {job.session_id}"}, 404)
+                return
+            
+            with session.lease(cached=True):
+                if job.action == 'batch':
+                    job.finish(run_steps(session, job.params['steps'], job.params.get('on_error', 'stop')), 200)
+                else:
+                    job.finish(*run_action(session, job.action, job.params))
+        except Exception as e:
+            logger.error(f"Job {job.id} error: {e}")
+            job.finish({"error": str(e)}, 500)
+    
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.finished_at and job.finished_at < cutoff]
+            for job_id in expired:
+                del self.jobs[job_id]
 
 
-@app.route('/oracle_login', methods=['POST'])
-def oracle_login():
+jobs = JobManager(JOB_WORKERS)
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
     """
-    התחברות אוטומטית ל-Oracle Cloud
+    הרצת פעולה ברקע - מחזיר job_id מיד
     
     Body:
         {
-            "username": "email@example.com",
-            "password": "password123",
-            "domain": "Default"
+            "action": "navigate",  // כל פעולה מ-/batch, או "batch" עם steps
+            "url": "https://example.com",  // שאר השדות כמו ב-endpoint של הפעולה
+            "session_id": "..."  // אופציונלי
         }
     """
-    global driver
+    data = request.json or {}
+    action = data.get('action')
+    params = {k: v for k, v in data.items() if k not in ('action', 'session_id')}
+    
+    try:
+        if action == 'batch':
+            validate_steps(params.get('steps'), params.get('on_error', 'stop'))
+        elif action not in ACTIONS:
+            raise ActionError(f"Unknown action: {action} (expected batch or one of {', '.join(sorted(ACTIONS))})")
+    except ActionError as e:
+        return jsonify({"error": str(e)}), e.status
     
-    if driver is None:
-        driver = init_browser()
+    session_id = _requested_session_id() or DEFAULT_SESSION_ID
+    if session_id != DEFAULT_SESSION_ID and pool.get(session_id) is None:
+        return jsonify({"error": f"Unknown session: {session_id}"}), 404
     
-    data = request.json
-    username = data.get('username')
-    password = data.get('password')
-    domain = data.get('domain', 'Default')
+    job = jobs.submit(action, params, session_id)
+    return jsonify({"success": True, **job.to_dict()}), 202
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """
+    רשימת ה-jobs (בלי התוצאות)
+    """
+    return jsonify({"jobs": jobs.list()})
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    מצב ותוצאת job
     
-    if not username or not password:
-        return jsonify({"error": "username and password are required"}), 400
+    Query:
+        wait: שניות להמתין לסיום (long-poll, עד MAX_JOB_WAIT)
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
     
     try:
-        # נווט לדף Oracle
-        oracle_url = "https://idcs-86c9de635d0e4016b64bfef436100f1e.identity.oraclecloud.com/ui/v1/signin"
-        logger.info(f"Navigating to Oracle: {oracle_url}")
-        driver.get(oracle_url)
-        time.sleep(5)
-        
-        # מלא username
-        try:
-            username_field = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, 'input[type="text"], input[type="email"], input[name*="user"], input[id*="user"]'))
-            )
-            username_field.clear()
-            username_field.send_keys(username)
-            logger.info("✅ Username filled")
-        except Exception as e:
-            logger.warning(f"Username field not found: {e}")
-        
-        # מלא password
-        try:
-            password_field = driver.find_element(By.CSS_SELECTOR, 'input[type="password"]')
-            password_field.clear()
-            password_field.send_keys(password)
-            logger.info("✅ Password filled")
-        except Exception as e:
-            logger.warning(f"Password field not found: {e}")
-        
-        # לחץ Sign In
-        try:
-            submit_button = driver.find_element(By.CSS_SELECTOR, 'button[type="submit"], input[type="submit"]')
-            submit_button.click()
-            logger.info("✅ Clicked Sign In")
-            time.sleep(5)
-        except Exception as e:
-            logger.warning(f"Submit button not found: {e}")
-        
-        # צלם מסך
-        screenshot_png = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot_png).decode('utf-8')
-        
-        return jsonify({
-            "success": True,
-            "current_url": driver.current_url,
-            "page_title": driver.title,
-            "screenshot": screenshot_b64
-        })
-    except Exception as e:
-        logger.error(f"Oracle login error: {e}")
-        return jsonify({"error": str(e)}), 500
+        wait = min(float(request.args.get('wait', 0)), MAX_JOB_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number"}), 400
+    
+    if wait > 0:
+        job.done.wait(wait)
+    
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """
+    ביטול job שעוד ממתין בתור
+    """
+    if jobs.get(job_id) is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    if not jobs.cancel(job_id):
+        return jsonify({"error": "Job already started"}), 409
+    
+    return jsonify({"success": True, "job_id": job_id, "cancelled": True})
 
 
 if __name__ == '__main__':
-    # אתחל דפדפן בהתחלה
-    init_browser()
+    # אתחל דפדפן בהתחלה (תחת gunicorn זה קורה ב-post_fork, ראה gunicorn.conf.py)
+    warmup.start(background=False)
     
     # הרץ Flask server
     port = int(os.environ.get('PORT', 7860))
@@ -0,0 +1,673 @@
+"""
+⚡ Browser Embassy Async Client - שליטה בהרבה דפדפנים מתהליך אחד
+===================================================================
+
+אותן מתודות כמו BrowserEmbassyClient, עם await - בלי thread לכל דפדפן.
+דורש aiohttp (pip install aiohttp).
+
+    async with AsyncBrowserEmbassyClient() as client:     # session משלו במאגר
+        await client.navigate("https://example.com")
+        img = await client.screenshot()
+    
+    # הרבה sessions במקביל על אותו מאגר חיבורים
+    async def title(client, url):
+        await client.navigate(url)
+        return (await client.execute_js("return document.title"))['result']
+    
+    titles = await AsyncBrowserEmbassyClient().map_sessions(title, urls, concurrency=4)
+"""
+
+import asyncio
+import base64
+import json
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+from client import (BatchBuilder, EmbassyClientBase, Screenshot, DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT,
+                    DEFAULT_RETRIES, DEFAULT_BACKOFF, CONNECT_TIMEOUT, RETRY_STATUSES, IDEMPOTENT_METHODS,
+                    BUSY_STATUS, IMAGE_EXTENSIONS, STREAM_CHUNK, request_timeout, retry_after, screenshot_params)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+_PENDING = object()
+
+
+class AsyncBrowserEmbassyClient(EmbassyClientBase):
+    """
+    Client אסינכרוני לשליטה בדפדפן מרחוק
+    """
+    
+    def __init__(self, base_url="https://kuperberg-browser-embassy.hf.space", session_id=None,
+                 pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, http=None):
+        """
+        אתחול Client
+        
+        Args:
+            base_url: כתובת ה-Space ב-HuggingFace
+            session_id: session קיים במאגר הדפדפנים (אופציונלי)
+            pool_size: מקסימום חיבורים פתוחים לשרת (משותף לכל ה-clients שנוצרו מ-clone/tab)
+            timeout: שניות לקריאה (navigate/click עם timeout מאריכים אותו אוטומטית)
+            retries: ניסיונות חוזרים על כשל חיבור, על 429 (תור מלא - לפי Retry-After),
+                ועל 502/504 בקריאות idempotent בלבד
+            backoff: בסיס ההמתנה בין ניסיונות (מוכפל בכל ניסיון)
+            http: aiohttp.ClientSession קיים לשימוש משותף (לא ייסגר ב-close)
+        """
+        if aiohttp is None:
+            raise ImportError("AsyncBrowserEmbassyClient requires aiohttp (pip install aiohttp)")
+        
+        super().__init__(base_url, pool_size, timeout, retries, backoff)
+        self.http = http
+        self._owns_http = http is None
+        self.headers = {}
+        if session_id:
+            self.use_session(session_id)
+    
+    def _http(self):
+        """
+        ה-aiohttp.ClientSession (נוצר בקריאה הראשונה - חייב event loop רץ)
+        """
+        if self.http is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            self.http = aiohttp.ClientSession(connector=connector)
+        return self.http
+    
+    async def close(self):
+        """
+        סגירת מאגר החיבורים (רק אם ה-client יצר אותו)
+        """
+        if self._owns_http and self.http is not None:
+            await self.http.close()
+            self.http = None
+    
+    def _headers(self, overrides=None):
+        headers = dict(self.headers)
+        for name, value in (overrides or {}).items():
+            if value is None:
+                headers.pop(name, None)
+            else:
+                headers[name] = value
+        return headers
+    
+    @staticmethod
+    async def _json(response):
+        """
+        גוף התשובה כ-dict (דף שגיאה של ה-proxy הופך ל-error במקום חריגת JSON)
+        """
+        if response.content_type == 'application/json':
+            return await response.json()
+        text = await response.text()
+        return {"success": False, "error": f"HTTP {response.status}: {text[:200]}"}
+    
+    async def _request(self, method, path, json=None, params=None, headers=None, wait=None):
+        """
+        קריאה לשרת עם timeout ו-retries
+        
+        כשל בפתיחת חיבור (הבקשה לא נשלחה) או 429 (התור של הדפדפן מלא) - ניסיון חוזר תמיד.
+        502/504 וניתוק באמצע - ניסיון חוזר רק ל-GET/DELETE (POST עלול לרוץ פעמיים).
+        
+        Args:
+            wait: כמה שניות השרת עשוי להמתין בקריאה הזו (מאריך את ה-timeout)
+        """
+        http = self._http()
+        timeout = aiohttp.ClientTimeout(total=request_timeout(self.timeout, wait), connect=CONNECT_TIMEOUT)
+        idempotent = method in IDEMPOTENT_METHODS
+        
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            delay = self.backoff * 2 ** attempt
+            try:
+                async with http.request(method, f'{self.base_url}{path}', json=json, params=params,
+                                        headers=self._headers(headers), timeout=timeout) as response:
+                    if response.status == BUSY_STATUS and not last:
+                        delay = retry_after(response.headers, delay)
+                    elif last or not idempotent or response.status not in RETRY_STATUSES:
+                        return await self._json(response)
+            except aiohttp.ClientConnectorError:
+                if last:
+                    raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if last or not idempotent:
+                    raise
+            await asyncio.sleep(delay)
+    
+    def use_session(self, session_id):
+        """
+        שליחת כל הקריאות הבאות ל-session מסוים (None = ה-session ברירת המחדל)
+        """
+        self.session_id = session_id
+        self.use_tab(None)
+        if session_id:
+            self.headers['X-Session-Id'] = session_id
+        else:
+            self.headers.pop('X-Session-Id', None)
+    
+    def use_tab(self, tab_id):
+        """
+        שליחת כל הקריאות הבאות לטאב מסוים ב-session (None = החלון הראשי)
+        """
+        self.tab_id = tab_id
+        self._frame = None
+        self._html = None
+        if tab_id:
+            self.headers['X-Tab-Id'] = tab_id
+        else:
+            self.headers.pop('X-Tab-Id', None)
+    
+    def use_priority(self, priority):
+        """
+        העדיפות של הקריאות הבאות בתור של הדפדפן: 'interactive' או 'bulk' (None = ברירת המחדל)
+        """
+        self.priority = priority
+        if priority:
+            self.headers['X-Priority'] = priority
+        else:
+            self.headers.pop('X-Priority', None)
+    
+    def clone(self, session_id=None):
+        """
+        client נוסף על אותו מאגר חיבורים (למשל ל-session אחר)
+        """
+        client = AsyncBrowserEmbassyClient(self.base_url, session_id, self.pool_size, self.timeout,
+                                           self.retries, self.backoff, http=self._http())
+        client.use_priority(self.priority)
+        return client
+    
+    def tab(self, tab_id):
+        """
+        client נפרד שעובד מול טאב אחד - על אותו מאגר חיבורים
+        """
+        client = self.clone(self.session_id)
+        client.use_tab(tab_id)
+        return client
+    
+    async def open_tab(self, url=None, wait_until=None):
+        """
+        פתיחת טאב חדש בדפדפן של ה-session (לא עובר אליו - ראו use_tab / tab)
+        
+        Returns:
+            tab_id
+        """
+        payload = {}
+        if url:
+            payload['url'] = url
+        if wait_until:
+            payload['wait_until'] = wait_until
+        
+        data = await self._request('POST', '/tabs', json=payload)
+        
+        if not data.get('success'):
+            raise Exception(f"Open tab failed: {data.get('error')}")
+        
+        return data['tab_id']
+    
+    async def close_tab(self, tab_id=None):
+        """
+        סגירת טאב (ברירת מחדל: הטאב הנוכחי)
+        """
+        tab_id = tab_id or self.tab_id
+        if not tab_id:
+            return None
+        
+        result = await self._request('DELETE', f'/tabs/{tab_id}', headers={'X-Tab-Id': None})
+        if tab_id == self.tab_id:
+            self.use_tab(None)
+        return result
+    
+    async def tabs(self):
+        """
+        הטאבים הפתוחים ב-session
+        """
+        data = await self._request('GET', '/tabs', headers={'X-Tab-Id': None})
+        return data['tabs']
+    
+    async def open_session(self, profile=None):
+        """
+        פתיחת דפדפן משלנו במאגר - כל הקריאות הבאות ילכו אליו
+        
+        Returns:
+            session_id
+        """
+        data = await self._request('POST', '/sessions', json={'profile': profile} if profile else {})
+        
+        if not data.get('success'):
+            raise Exception(f"Open session failed: {data.get('error')}")
+        
+        self.use_session(data['session_id'])
+        return self.session_id
+    
+    async def release_session(self):
+        """
+        שחרור ה-session הנוכחי בחזרה למאגר
+        """
+        if not self.session_id:
+            return None
+        
+        result = await self._request('DELETE', f'/sessions/{self.session_id}')
+        self.use_session(None)
+        return result
+    
+    async def set_profile(self, profile):
+        """
+        החלפת פרופיל חסימת המשאבים של ה-session הנוכחי
+        """
+        if not self.session_id:
+            raise Exception("set_profile requires an open session")
+        
+        return await self._request('POST', f'/sessions/{self.session_id}/profile', json={'profile': profile})
+    
+    async def sessions(self):
+        """
+        מצב מאגר הדפדפנים
+        """
+        return await self._request('GET', '/sessions')
+    
+    async def __aenter__(self):
+        await self.open_session()
+        return self
+    
+    async def __aexit__(self, *exc):
+        try:
+            await self.release_session()
+        finally:
+            await self.close()
+    
+    async def map_sessions(self, func, items, concurrency=4, profile=None):
+        """
+        הרצת await func(client, item) לכל item, על עד concurrency sessions מהמאגר במקביל
+        
+        כל worker פותח session משלו, מעבד items עד שנגמרים ומשחרר אותו.
+        
+        Returns:
+            התוצאות לפי סדר items (חריגה במקום התוצאה של item שנכשל)
+        """
+        items = list(items)
+        results = [_PENDING] * len(items)
+        queue = asyncio.Queue()
+        for index, item in enumerate(items):
+            queue.put_nowait((index, item))
+        
+        async def worker():
+            client = self.clone()
+            await client.open_session(profile)
+            try:
+                while not queue.empty():
+                    index, item = queue.get_nowait()
+                    try:
+                        results[index] = await func(client, item)
+                    except Exception as e:
+                        results[index] = e
+            finally:
+                await client.release_session()
+        
+        workers = min(concurrency, len(items))
+        errors = [r for r in await asyncio.gather(*(worker() for _ in range(workers)), return_exceptions=True)
+                  if isinstance(r, BaseException)]
+        
+        # items שאף worker לא הגיע אליהם (למשל כל ה-sessions נכשלו בפתיחה)
+        return [errors[0] if r is _PENDING else r for r in results]
+    
+    async def status(self):
+        """
+        בדיקת סטטוס הדפדפן
+        """
+        return await self._request('GET', '/status')
+    
+    async def navigate(self, url, wait_until=None, timeout=None, profile=None,
+                       max_age=None, cache=False, cache_screenshot=None):
+        """
+        ניווט לכתובת
+        
+        Args:
+            url: הכתובת
+            wait_until: domcontentloaded, load, networkidle, selector:<css>, url-change או none
+            timeout: מקסימום שניות להמתנה
+            profile: פרופיל חסימת משאבים מהניווט הזה והלאה
+            max_age: דף שנשמר ב-page_cache בשניות האחרונות מוגש בלי טעינה (גורר cache)
+            cache: שמירת הדף ב-page_cache של השרת (רק לדפים שלא תלויים בהתחברות)
+            cache_screenshot: גם צילום במטמון - True או אפשרויות צילום (dict)
+        """
+        payload = {'url': url}
+        if wait_until:
+            payload['wait_until'] = wait_until
+        if timeout is not None:
+            payload['timeout'] = timeout
+        if profile:
+            payload['profile'] = profile
+        if max_age is not None:
+            payload['max_age'] = max_age
+        if cache:
+            payload['cache'] = True
+        if cache_screenshot:
+            payload['cache_screenshot'] = cache_screenshot
+        
+        return await self._request('POST', '/navigate', json=payload, wait=timeout)
+    
+    async def screenshot(self, save_path=None, format=None, quality=None, scale=None,
+                         max_width=None, clip=None, selector=None, delta=False):
+        """
+        צילום מסך (אותם פרמטרים כמו BrowserEmbassyClient.screenshot)
+        
+        Returns:
+            PIL Image object
+        """
+        params = screenshot_params(format, quality, scale, max_width, clip, selector)
+        if delta:
+            params['delta'] = 1
+            if self._frame:
+                params['since'] = self._frame[0]
+        
+        data = await self._request('GET', '/screenshot', params=params)
+        
+        if not data.get('success'):
+            raise Exception(f"Screenshot failed: {data.get('error')}")
+        
+        if delta:
+            img = self._apply_delta(data['delta'])
+            if save_path:
+                img.save(save_path)
+        else:
+            img_data = base64.b64decode(data['screenshot'])
+            if save_path:
+                Path(save_path).write_bytes(img_data)
+            img = Image.open(BytesIO(img_data))
+        
+        if save_path:
+            print(f"📸 Screenshot saved to: {save_path}")
+        
+        return img
+    
+    async def screenshot_raw(self, save_path=None, format=None, quality=None, scale=None,
+                             max_width=None, clip=None, selector=None, headers=None):
+        """
+        צילום מסך בינארי (/screenshot?raw=1) - בלי base64 ובלי PIL
+        
+        Returns:
+            Screenshot (עם save_path - הקובץ נכתב תוך כדי הורדה)
+        """
+        params = screenshot_params(format, quality, scale, max_width, clip, selector)
+        params['raw'] = 1
+        timeout = aiohttp.ClientTimeout(total=self.timeout, connect=CONNECT_TIMEOUT)
+        
+        async with self._http().get(f'{self.base_url}/screenshot', params=params, headers=self._headers(headers),
+                                    timeout=timeout) as response:
+            if not response.content_type.startswith('image/'):
+                raise Exception(f"Screenshot failed: {(await self._json(response)).get('error')}")
+            mimetype = response.content_type
+            url = response.headers.get('X-Page-Url')
+            
+            if not save_path:
+                return Screenshot(await response.read(), mimetype, url)
+            
+            with open(save_path, 'wb') as f:
+                async for chunk in response.content.iter_chunked(STREAM_CHUNK):
+                    f.write(chunk)
+        
+        return Screenshot(mimetype=mimetype, url=url, path=save_path)
+    
+    async def capture_sessions(self, directory, session_ids=None, concurrency=None, **options):
+        """
+        צילום כמה sessions ישר לתיקייה (<session_id>.<ext>), במקביל
+        
+        Returns:
+            {session_id: Screenshot או Exception}
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        if session_ids is None:
+            session_ids = [s['session_id'] for s in (await self.sessions())['sessions']]
+        ext = IMAGE_EXTENSIONS.get(f"image/{options.get('format') or 'png'}", options.get('format'))
+        limit = asyncio.Semaphore(concurrency or self.pool_size)
+        
+        async def capture(session_id):
+            async with limit:
+                return await self.screenshot_raw(directory / f'{session_id}.{ext}',
+                                                 headers={'X-Session-Id': session_id, 'X-Tab-Id': None}, **options)
+        
+        results = await asyncio.gather(*(capture(session_id) for session_id in session_ids), return_exceptions=True)
+        return dict(zip(session_ids, results))
+    
+    async def extract_fields(self, columnar=False):
+        """
+        חילוץ שדות טופס
+        """
+        params = {'format': 'columnar'} if columnar else None
+        return await self._request('GET', '/extract_fields', params=params)
+    
+    async def fill_field(self, selector, value, method='css'):
+        """
+        מילוי שדה
+        """
+        return await self._request('POST', '/fill_field',
+                                   json={'selector': selector, 'value': value, 'method': method})
+    
+    async def click(self, selector, method='css', wait_until=None, timeout=None):
+        """
+        לחיצה על אלמנט
+        """
+        payload = {
+            'selector': selector,
+            'method': method
+        }
+        if wait_until:
+            payload['wait_until'] = wait_until
+        if timeout is not None:
+            payload['timeout'] = timeout
+        
+        return await self._request('POST', '/click', json=payload, wait=timeout)
+    
+    async def get_html(self, selector=None, mode=None, strip=None, diff=False):
+        """
+        קבלת HTML של הדף
+        """
+        params = {}
+        if selector:
+            params['selector'] = selector
+        if mode:
+            params['mode'] = mode
+        if strip:
+            params['strip'] = ','.join(strip)
+        if diff:
+            params['since'] = self._html[0] if self._html else ''
+        
+        data = await self._request('GET', '/get_html', params=params)
+        
+        if diff and data.get('success'):
+            data['html'] = self._apply_html_delta(data)
+        
+        return data
+    
+    async def execute_js(self, script, args=None, is_async=False):
+        """
+        הרצת JavaScript
+        """
+        payload = {'script': script}
+        if args:
+            payload['args'] = list(args)
+        if is_async:
+            payload['async'] = True
+        
+        return await self._request('POST', '/execute_js', json=payload)
+    
+    async def register_script(self, source, name=None, is_async=False, inject=False):
+        """
+        רישום סקריפט בשרת
+        
+        Returns:
+            script_id
+        """
+        payload = {'source': source, 'async': is_async, 'inject': inject}
+        if name:
+            payload['name'] = name
+        
+        data = await self._request('POST', '/scripts', json=payload)
+        
+        if not data.get('success'):
+            raise Exception(f"Register script failed: {data.get('error')}")
+        
+        return data['script']['script_id']
+    
+    async def run_script(self, script_id, *args):
+        """
+        הפעלת סקריפט רשום (id או שם) עם ארגומנטים
+        """
+        data = await self._request('POST', f'/scripts/{script_id}/run', json={'args': list(args)})
+        
+        if not data.get('success'):
+            raise Exception(f"Script {script_id} failed: {data.get('error')}")
+        
+        return data['result']
+    
+    async def scripts(self):
+        """
+        הסקריפטים הרשומים בשרת
+        """
+        return (await self._request('GET', '/scripts'))['scripts']
+    
+    async def page_cache(self):
+        """
+        מצב מטמון הדפים בשרת (hit_rate, bytes, הדפים השמורים)
+        """
+        return await self._request('GET', '/page_cache')
+    
+    async def clear_page_cache(self, url=None):
+        """
+        ריקון מטמון הדפים - כולו או URL אחד
+        """
+        params = {'url': url} if url else None
+        return await self._request('DELETE', '/page_cache', params=params)
+    
+    def batch(self, on_error='stop'):
+        """
+        רצף פעולות שנשלח לשרת בקריאה אחת
+        
+        Returns:
+            BatchBuilder - להוסיף צעדים ו-await builder.run()
+        """
+        return BatchBuilder(self, on_error)
+    
+    async def _run_batch(self, steps, on_error):
+        return await self._request('POST', '/batch', json={'steps': steps, 'on_error': on_error})
+    
+    async def fetch_many(self, urls, concurrency=4, include=None, wait_until=None, timeout=None, profile=None,
+                         tabs=False, **options):
+        """
+        טעינת הרבה URLs במקביל בשרת - async generator של תוצאות לפי סדר הסיום
+        
+        Yields:
+            {"index", "url", "status", "final_url", "title", "http_status", ...}
+            (שורת הסיכום נשמרת ב-self.last_fetch)
+        """
+        payload = {'urls': list(urls), 'concurrency': concurrency, **options}
+        if include:
+            payload['include'] = list(include)
+        if wait_until:
+            payload['wait_until'] = wait_until
+        if timeout is not None:
+            payload['timeout'] = timeout
+        if profile is not None:
+            payload['profile'] = profile
+        if tabs:
+            payload['tabs'] = True
+        
+        # בלי timeout כולל - רק בין שורה לשורה
+        stream_timeout = aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT,
+                                               sock_read=request_timeout(self.timeout, timeout))
+        async with self._http().post(f'{self.base_url}/fetch_many', json=payload, headers=self._headers(),
+                                     timeout=stream_timeout) as response:
+            if response.content_type == 'application/json':
+                raise Exception(f"fetch_many failed: {(await response.json()).get('error')}")
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get('done'):
+                    self.last_fetch = record
+                    continue
+                yield record
+    
+    async def register_recipe(self, recipe):
+        """
+        רישום recipe בשרת (dict בפורמט של POST /recipes)
+        """
+        data = await self._request('POST', '/recipes', json=recipe)
+        
+        if not data.get('success'):
+            raise Exception(f"Register recipe failed: {data.get('error')}")
+        
+        return data['recipe']
+    
+    async def recipes(self):
+        """
+        רשימת ה-recipes הרשומים בשרת
+        """
+        return (await self._request('GET', '/recipes'))['recipes']
+    
+    async def run_recipe(self, name, reuse_auth=True, **params):
+        """
+        הרצת recipe בשרת
+        """
+        payload = {'params': params}
+        if not reuse_auth:
+            payload['reuse_auth'] = False
+        
+        result = await self._request('POST', f'/recipes/{name}/run', json=payload)
+        
+        if 'error' in result:
+            raise Exception(f"Recipe {name} failed: {result['error']}")
+        
+        return result
+    
+    async def submit_job(self, action, **params):
+        """
+        הרצת פעולה ברקע בשרת
+        
+        Returns:
+            job_id
+        """
+        data = await self._request('POST', '/jobs', json={'action': action, **params})
+        
+        if not data.get('success'):
+            raise Exception(f"Submit job failed: {data.get('error')}")
+        
+        return data['job_id']
+    
+    async def job(self, job_id, wait=0):
+        """
+        מצב job (long-poll עד wait שניות)
+        """
+        return await self._request('GET', f'/jobs/{job_id}', params={'wait': wait}, wait=wait)
+    
+    async def wait_job(self, job_id, timeout=300, poll=30):
+        """
+        המתנה לסיום job והחזרת התוצאה
+        """
+        deadline = time.time() + timeout
+        while True:
+            job = await self.job(job_id, wait=min(poll, max(deadline - time.time(), 0)))
+            if job.get('status') not in ('queued', 'running'):
+                return job
+            if time.time() >= deadline:
+                raise TimeoutError(f"Job {job_id} did not finish in {timeout}s")
+    
+    async def oracle_login(self, username, password, domain='Default', wait_until=None, reuse_auth=True):
+        """
+        התחברות אוטומטית ל-Oracle Cloud
+        """
+        payload = {
+            'username': username,
+            'password': password,
+            'domain': domain
+        }
+        if wait_until:
+            payload['wait_until'] = wait_until
+        if not reuse_auth:
+            payload['reuse_auth'] = False
+        
+        return await self._request('POST', '/oracle_login', json=payload)
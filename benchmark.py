@@ -0,0 +1,372 @@
+"""
+📊 Browser Embassy Benchmark - מדידת ביצועים בלי אינטרנט
+=========================================================
+
+מריץ את ה-API מול אתר מקומי (דף קטן, DOM גדול, טופס גדול) דרך BrowserEmbassyClient,
+בכמה רמות מקביליות, ושומר p50/p95/p99, throughput, גודל תשובות ו-RSS של השרת לקובץ JSON.
+
+    python benchmark.py                                # מפעיל את app.py בתהליך הזה (צריך Chrome מקומי)
+    python benchmark.py --base-url http://localhost:7860 --fixture-host 172.17.0.1
+    python benchmark.py --compare benchmark-baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from client import BrowserEmbassyClient
+
+
+# ==================== Fixture site ====================
+
+def _small_page():
+    return """<!doctype html>
+<html><head><title>Small page</title></head>
+<body>
+  <h1>Benchmark</h1>
+  <p id="text">A small static page.</p>
+  <input id="q" name="q" type="text">
+  <button id="go" onclick="document.getElementById('text').textContent = 'clicked'">Go</button>
+</body></html>"""
+
+
+def _large_dom_page(sections=200, items=25):
+    parts = ['<!doctype html><html><head><title>Large DOM</title></head><body>']
+    for s in range(sections):
+        parts.append(f'<section id="s{s}"><h2>Section {s}</h2><ul>')
+        parts.extend(f'<li class="item"><span>Item {s}.{i}</span> <a href="#s{s}">link</a></li>' for i in range(items))
+        parts.append('</ul></section>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def _big_form_page(fields=300):
+    types = ('text', 'email', 'number', 'password', 'checkbox', 'date')
+    parts = ['<!doctype html><html><head><title>Big form</title></head><body><form id="form" onsubmit="return false">']
+    for i in range(fields):
+        parts.append(f'<label for="f{i}">Field {i}</label><input id="f{i}" name="field{i}" type="{types[i % len(types)]}">')
+        if i % 50 == 0:
+            parts.append(f'<select id="sel{i}" name="select{i}"><option>a</option><option>b</option></select>')
+    parts.append('<textarea id="notes" name="notes"></textarea>')
+    parts.append('<button id="submit" type="submit">Submit</button></form></body></html>')
+    return ''.join(parts)
+
+
+FIXTURE_PAGES = {
+    '/small': _small_page(),
+    '/large-dom': _large_dom_page(),
+    '/big-form': _big_form_page()
+}
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = FIXTURE_PAGES.get(self.path.split('?')[0])
+        if body is None:
+            self.send_error(404)
+            return
+        data = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fixture_site(port=0):
+    """
+    שרת HTTP מקומי לדפי ה-fixture (ב-thread ברקע)
+
+    Returns:
+        (server, port)
+    """
+    server = ThreadingHTTPServer(('0.0.0.0', port), _FixtureHandler)
+    threading.Thread(target=server.serve_forever, name='fixture-site', daemon=True).start()
+    return server, server.server_address[1]
+
+
+def start_embassy(port, pool_size):
+    """
+    הפעלת app.py בתהליך הזה (werkzeug עם threads) - כמו gunicorn עם worker אחד
+    """
+    os.environ.setdefault('POOL_SIZE', str(pool_size))
+    os.environ.setdefault('WARM_STANDBY', '0')
+    from werkzeug.serving import make_server
+    import app as embassy
+
+    server = make_server('127.0.0.1', port, embassy.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='embassy', daemon=True).start()
+    embassy.warmup.start(background=False)
+    return server
+
+
+# ==================== Measurement ====================
+
+def percentile(values, pct):
+    """
+    percentile לפי nearest-rank (values ממוין)
+    """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def server_rss(base_url):
+    """
+    RSS של השרת + כל הדפדפנים (מ-/metrics), ב-bytes
+    """
+    try:
+        text = requests.get(f'{base_url}/metrics', timeout=10).text
+    except requests.RequestException:
+        return None
+    total = 0
+    for line in text.splitlines():
+        match = re.match(r'^(process_resident_memory_bytes|embassy_browser_rss_bytes)(\{[^}]*\})? ([0-9.e+]+)$', line)
+        if match:
+            total += float(match.group(3))
+    return int(total) or None
+
+
+class Recorder:
+    """
+    איסוף זמני קריאות וגודל תשובות לכל endpoint
+    """
+
+    def __init__(self):
+        self.samples = {}  # endpoint -> [(seconds, bytes, ok)]
+        self.lock = threading.Lock()
+
+    def attach(self, client):
+        """
+        hook על ה-requests.Session של ה-client: גודל כל תשובה
+        """
+        state = threading.local()
+
+        def on_response(response, *args, **kwargs):
+            state.bytes = getattr(state, 'bytes', 0) + len(response.content)
+
+        client.session.hooks['response'].append(on_response)
+        return state
+
+    def call(self, endpoint, state, func, *args, **kwargs):
+        state.bytes = 0
+        started = time.perf_counter()
+        ok = True
+        try:
+            result = func(*args, **kwargs)
+            if isinstance(result, dict) and (result.get('error') or result.get('success') is False):
+                ok = False
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((elapsed, state.bytes, ok))
+
+    def summary(self, wall_seconds):
+        results = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(s[0] for s in samples)
+            sizes = [s[1] for s in samples]
+            results[endpoint] = {
+                "calls": len(samples),
+                "errors": sum(1 for s in samples if not s[2]),
+                "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+                "throughput_per_s": round(len(samples) / wall_seconds, 2) if wall_seconds else None,
+                "bytes_mean": round(sum(sizes) / len(sizes)),
+                "bytes_total": sum(sizes)
+            }
+        return results
+
+
+def run_scenario(client, recorder, state, fixture, iterations):
+    """
+    סבב אחד על כל ה-endpoints - כל worker מריץ אותו על ה-session שלו
+    """
+    for _ in range(iterations):
+        recorder.call('status', state, client.status)
+        recorder.call('navigate', state, client.navigate, f'{fixture}/small')
+        recorder.call('screenshot', state, client.screenshot)
+        recorder.call('screenshot_jpeg', state, client.screenshot, format='jpeg', quality=60)
+        recorder.call('fill_field', state, client.fill_field, '#q', 'benchmark')
+        recorder.call('click', state, client.click, '#go', wait_until='none')
+        recorder.call('navigate_big_form', state, client.navigate, f'{fixture}/big-form')
+        recorder.call('extract_fields', state, client.extract_fields)
+        recorder.call('extract_fields_cached', state, client.extract_fields)
+        recorder.call('navigate_large_dom', state, client.navigate, f'{fixture}/large-dom')
+        recorder.call('get_html', state, client.get_html)
+        recorder.call('get_html_text', state, client.get_html, mode='text')
+        recorder.call('execute_js', state, client.execute_js, 'return document.querySelectorAll("li").length')
+        recorder.call('batch', state, lambda: (client.batch()
+                                               .navigate(f'{fixture}/small')
+                                               .fill_field('#q', 'batch')
+                                               .execute_js('return document.title')
+                                               .run()))
+
+
+def run_level(base_url, fixture, concurrency, iterations, fetch_urls):
+    """
+    רמת מקביליות אחת: concurrency workers, כל אחד עם session משלו - הראשון על ה-session
+    ברירת המחדל (שה-warm-up כבר פתח), השאר על sessions מהמאגר
+    """
+    recorder = Recorder()
+    clients = [BrowserEmbassyClient(base_url)]
+    rss_before = server_rss(base_url)
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(concurrency - 1):
+                client = BrowserEmbassyClient(base_url)
+                client.open_session()
+                clients.append(client)
+
+            workers = []
+            for client in clients:
+                state = recorder.attach(client)
+                worker = threading.Thread(target=run_scenario, args=(client, recorder, state, fixture, iterations))
+                workers.append(worker)
+                worker.start()
+            for worker in workers:
+                worker.join()
+            # fetch_many צריך מקום במאגר ל-sessions הזמניים שלו
+            for client in clients[1:]:
+                client.release_session()
+
+            if fetch_urls:
+                pages = list(FIXTURE_PAGES)
+                urls = [f'{fixture}{pages[i % len(pages)]}' for i in range(fetch_urls)]
+                state = recorder.attach(clients[0])
+                recorder.call('fetch_many', state, lambda: list(clients[0].fetch_many(urls, concurrency=concurrency)))
+    finally:
+        for client in clients:
+            if client.session_id:
+                client.release_session()
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "iterations": iterations,
+        "wall_seconds": round(wall, 2),
+        "rss_before": rss_before,
+        "rss_after": server_rss(base_url),
+        "endpoints": recorder.summary(wall)
+    }
+
+
+def compare(current, baseline_path, threshold):
+    """
+    השוואת p50/p95 לקובץ תוצאות קודם - מחזיר רשימת רגרסיות
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    old_levels = {level['concurrency']: level for level in baseline.get('levels', [])}
+
+    regressions = []
+    for level in current['levels']:
+        old = old_levels.get(level['concurrency'])
+        if old is None:
+            continue
+        for endpoint, stats in level['endpoints'].items():
+            before = old['endpoints'].get(endpoint)
+            if not before:
+                continue
+            for metric in ('p50_ms', 'p95_ms'):
+                if before[metric] and stats[metric] > before[metric] * (1 + threshold):
+                    regressions.append(
+                        f"c={level['concurrency']} {endpoint} {metric}: "
+                        f"{before[metric]} -> {stats[metric]} (+{round((stats[metric] / before[metric] - 1) * 100)}%)"
+                    )
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Browser Embassy offline benchmark')
+    parser.add_argument('--base-url', help='Running embassy to benchmark (default: start app.py in-process)')
+    parser.add_argument('--port', type=int, default=7870, help='Port for the in-process embassy')
+    parser.add_argument('--fixture-host', default='127.0.0.1', help='Host the browser uses to reach the fixture site')
+    parser.add_argument('--fixture-port', type=int, default=0)
+    parser.add_argument('--concurrency', default='1,2,4', help='Comma-separated concurrency levels')
+    parser.add_argument('--iterations', type=int, default=5, help='Scenario rounds per worker')
+    parser.add_argument('--fetch-urls', type=int, default=12, help='URLs per /fetch_many call (0 to skip)')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Regression threshold for --compare (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.concurrency.split(',') if level]
+    fixture_server, fixture_port = start_fixture_site(args.fixture_port)
+    fixture = f'http://{args.fixture_host}:{fixture_port}'
+
+    base_url = args.base_url
+    embassy_server = None
+    if not base_url:
+        print(f"🚀 Starting embassy on port {args.port}...")
+        embassy_server = start_embassy(args.port, max(levels))
+        base_url = f'http://127.0.0.1:{args.port}'
+    base_url = base_url.rstrip('/')
+
+    results = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "base_url": base_url,
+        "fixture": {path: len(body) for path, body in FIXTURE_PAGES.items()},
+        "levels": []
+    }
+
+    try:
+        for concurrency in levels:
+            print(f"⏱️  Concurrency {concurrency} x {args.iterations} iterations...")
+            level = run_level(base_url, fixture, concurrency, args.iterations, args.fetch_urls)
+            results["levels"].append(level)
+            for endpoint, stats in level['endpoints'].items():
+                print(f"   {endpoint:24} p50 {stats['p50_ms']:>8}ms  p95 {stats['p95_ms']:>8}ms  "
+                      f"p99 {stats['p99_ms']:>8}ms  {stats['throughput_per_s']:>7}/s  "
+                      f"{stats['bytes_mean']:>9}B  errors {stats['errors']}")
+    finally:
+        fixture_server.shutdown()
+        if embassy_server is not None:
+            embassy_server.shutdown()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Results written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regressions vs {args.compare}:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"✅ No regressions vs {args.compare}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,27 +6,468 @@ Client לשליטה בדפדפן על HuggingFace Spaces
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import base64
 import json
 from pathlib import Path
 from PIL import Image
 from io import BytesIO
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-class BrowserEmbassyClient:
+# ==================== HTTP ====================
+
+DEFAULT_POOL_SIZE = 10  # חיבורים פתוחים לשרת (כמה קריאות במקביל מאותו client)
+DEFAULT_TIMEOUT = 120  # שניות לקריאה רגילה
+CONNECT_TIMEOUT = 10
+TIMEOUT_MARGIN = 30  # מעבר ל-timeout שהשרת ממתין (navigate/click/jobs)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5  # 0.5, 1, 2 שניות בין ניסיונות
+RETRY_STATUSES = (502, 504)  # ה-proxy של ה-Space לפני שהשרת עונה
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+BUSY_STATUS = 429  # התור של הדפדפן מלא - הבקשה לא רצה, אז גם POST בטוח לנסות שוב
+MAX_RETRY_AFTER = 60
+
+
+class EmbassyRetry(Retry):
+    """
+    Retry שמנסה שוב גם POST על 429 (ההמתנה לפי Retry-After של השרת)
+    """
+    
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == BUSY_STATUS and self.total:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def retry_after(headers, default):
+    """
+    ההמתנה (שניות) שהשרת ביקש ב-Retry-After, או default
+    """
+    try:
+        return min(float(headers.get('Retry-After')), MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return default
+
+
+class EmbassyHTTPSession(requests.Session):
+    """
+    requests.Session עם timeout ברירת מחדל לכל קריאה
+    """
+    
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+    
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', (CONNECT_TIMEOUT, self.timeout))
+        return super().request(method, url, **kwargs)
+
+
+def request_timeout(default, wait=None):
+    """
+    timeout לקריאה שהשרת ממתין בה עד wait שניות - לא לחתוך אותה לפני השרת
+    """
+    if wait is None:
+        return default
+    return max(default, wait + TIMEOUT_MARGIN)
+
+
+# ==================== Screenshots ====================
+
+STREAM_CHUNK = 64 * 1024
+IMAGE_EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/webp': 'webp'}
+
+
+class Screenshot:
+    """
+    צילום מסך כמו שהשרת שלח אותו (png/jpeg/webp מקודד) - בלי פענוח ובלי העתקות
+
+    הפענוח ל-PIL קורה רק בגישה ל-image. bytes(shot) / shot.view() נותנים את הנתונים עצמם,
+    ו-save() כותב אותם כמו שהם (בלי img.save ובלי קידוד מחדש).
+    """
+    
+    def __init__(self, data=None, mimetype='image/png', url=None, path=None):
+        self._data = data
+        self.mimetype = mimetype
+        self.url = url  # הדף שצולם (X-Page-Url)
+        self.path = path  # אם נשמר ישר לדיסק
+        self._image = None
+    
+    @property
+    def format(self):
+        return self.mimetype.split('/')[-1]
+    
+    @property
+    def extension(self):
+        return IMAGE_EXTENSIONS.get(self.mimetype, self.format)
+    
+    @property
+    def data(self):
+        if self._data is None and self.path:
+            self._data = Path(self.path).read_bytes()
+        return self._data
+    
+    def __bytes__(self):
+        return self.data
+    
+    def __len__(self):
+        return len(self.data)
+    
+    def __repr__(self):
+        where = self.path or f'{len(self._data)} bytes'
+        return f'<Screenshot {self.mimetype} {where}>'
+    
+    def view(self):
+        """
+        memoryview על ה-bytes (בלי העתקה)
+        """
+        return memoryview(self.data)
+    
+    @property
+    def image(self):
+        """
+        PIL Image - מפוענח בגישה הראשונה
+        """
+        if self._image is None:
+            self._image = Image.open(BytesIO(self.data))
+        return self._image
+    
+    def save(self, path):
+        Path(path).write_bytes(self.data)
+        return path
+
+
+def screenshot_params(format=None, quality=None, scale=None, max_width=None, clip=None, selector=None):
+    """
+    query של /screenshot מהפרמטרים של screenshot()
+    """
+    params = {}
+    if format:
+        params['format'] = format
+    if quality is not None:
+        params['quality'] = quality
+    if scale is not None:
+        params['scale'] = scale
+    if max_width is not None:
+        params['max_width'] = max_width
+    if clip:
+        params['clip'] = ','.join(str(v) for v in clip)
+    if selector:
+        params['selector'] = selector
+    return params
+
+
+class BatchBuilder:
+    """
+    בניית רצף פעולות לשליחה ב-/batch אחד
+    
+    Example:
+        result = (client.batch()
+                  .navigate("https://example.com")
+                  .fill_field("#user", "me")
+                  .click("#submit")
+                  .screenshot()
+                  .run())
+    """
+    
+    def __init__(self, client, on_error='stop'):
+        self.client = client
+        self.on_error = on_error
+        self.steps = []
+    
+    def add(self, action, on_error=None, **params):
+        """
+        הוספת צעד כללי (כל פעולה שהשרת מכיר)
+        """
+        step = {'action': action, **params}
+        if on_error:
+            step['on_error'] = on_error
+        self.steps.append(step)
+        return self
+    
+    def navigate(self, url, wait_until=None, timeout=None, on_error=None):
+        params = {'url': url}
+        if wait_until:
+            params['wait_until'] = wait_until
+        if timeout is not None:
+            params['timeout'] = timeout
+        return self.add('navigate', on_error, **params)
+    
+    def fill_field(self, selector, value, method='css', on_error=None):
+        return self.add('fill_field', on_error, selector=selector, value=value, method=method)
+    
+    def click(self, selector, method='css', wait_until=None, timeout=None, on_error=None):
+        params = {'selector': selector, 'method': method}
+        if wait_until:
+            params['wait_until'] = wait_until
+        if timeout is not None:
+            params['timeout'] = timeout
+        return self.add('click', on_error, **params)
+    
+    def extract_fields(self, on_error=None):
+        return self.add('extract_fields', on_error)
+    
+    def get_html(self, on_error=None):
+        return self.add('get_html', on_error)
+    
+    def execute_js(self, script, on_error=None):
+        return self.add('execute_js', on_error, script=script)
+    
+    def run_script(self, script_id, args=None, on_error=None):
+        return self.add('execute_js', on_error, script_id=script_id, args=list(args or []))
+    
+    def screenshot(self, on_error=None):
+        return self.add('screenshot', on_error)
+    
+    def recipe(self, name, on_error=None, **params):
+        return self.add('recipe', on_error, name=name, params=params)
+    
+    def run(self):
+        """
+        שליחת כל הצעדים בקריאה אחת (ב-AsyncBrowserEmbassyClient: await builder.run())
+        
+        Returns:
+            {"success", "completed", "stopped_at", "results": [...]}
+        """
+        return self.client._run_batch(self.steps, self.on_error)
+
+
+class EmbassyClientBase:
+    """
+    המצב המשותף ל-BrowserEmbassyClient ול-AsyncBrowserEmbassyClient
+    (session/טאב נוכחיים, הבסיס ל-delta של screenshot ו-get_html)
+    """
+    
+    def __init__(self, base_url, pool_size, timeout, retries, backoff):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session_id = None
+        self.tab_id = None
+        self._frame = None  # (seq, Image) - הבסיס ל-screenshot(delta=True)
+        self._html = None  # (hash, html) - הבסיס ל-get_html(diff=True)
+        self.last_fetch = None  # שורת הסיכום של fetch_many האחרון
+        self.priority = None  # X-Priority: interactive (ברירת המחדל בשרת) או bulk
+    
+    def _apply_delta(self, delta):
+        """
+        הרכבת התמונה המלאה מ-tiles שהשתנו על גבי ה-frame הקודם
+        """
+        if delta['keyframe']:
+            img = Image.open(BytesIO(base64.b64decode(delta['tiles'][0]['data']))).convert('RGB')
+        else:
+            img = self._frame[1].copy()
+            for tile in delta['tiles']:
+                patch = Image.open(BytesIO(base64.b64decode(tile['data'])))
+                img.paste(patch, (tile['x'], tile['y']))
+        
+        self._frame = (delta['seq'], img)
+        return img
+    
+    def _apply_html_delta(self, data):
+        """
+        הרכבת ה-HTML מתשובת diff על גבי הגרסה הקודמת
+        """
+        if data.get('unchanged'):
+            html = self._html[1]
+        elif 'diff' in data:
+            lines = self._html[1].splitlines(keepends=True)
+            for op, start, end, new_lines in reversed(data['diff']):
+                lines[start:end] = new_lines
+            html = ''.join(lines)
+        else:
+            html = data['html']
+        
+        self._html = (data['hash'], html)
+        return html
+
+
+class BrowserEmbassyClient(EmbassyClientBase):
     """
     Client לשליטה בדפדפן מרחוק
     """
     
-    def __init__(self, base_url="https://kuperberg-browser-embassy.hf.space"):
+    def __init__(self, base_url="https://kuperberg-browser-embassy.hf.space", session_id=None,
+                 pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF):
         """
         אתחול Client
         
         Args:
             base_url: כתובת ה-Space ב-HuggingFace
+            session_id: session קיים במאגר הדפדפנים (אופציונלי)
+            pool_size: חיבורים פתוחים לשרת (למשל כמספר ה-threads שמשתמשים ב-client)
+            timeout: שניות לקריאה (navigate/click עם timeout מאריכים אותו אוטומטית)
+            retries: ניסיונות חוזרים על כשל חיבור, על 429 (תור מלא - לפי Retry-After),
+                ועל 502/504 בקריאות idempotent בלבד
+            backoff: בסיס ההמתנה בין ניסיונות (מוכפל בכל ניסיון)
         """
-        self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
+        super().__init__(base_url, pool_size, timeout, retries, backoff)
+        self.session = EmbassyHTTPSession(timeout)
+        retry = EmbassyRetry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if session_id:
+            self.use_session(session_id)
+    
+    def use_session(self, session_id):
+        """
+        שליחת כל הקריאות הבאות ל-session מסוים (None = ה-session ברירת המחדל)
+        """
+        self.session_id = session_id
+        self.use_tab(None)
+        if session_id:
+            self.session.headers['X-Session-Id'] = session_id
+        else:
+            self.session.headers.pop('X-Session-Id', None)
+    
+    def use_tab(self, tab_id):
+        """
+        שליחת כל הקריאות הבאות לטאב מסוים ב-session (None = החלון הראשי)
+        """
+        self.tab_id = tab_id
+        self._frame = None
+        self._html = None
+        if tab_id:
+            self.session.headers['X-Tab-Id'] = tab_id
+        else:
+            self.session.headers.pop('X-Tab-Id', None)
+    
+    def use_priority(self, priority):
+        """
+        העדיפות של הקריאות הבאות בתור של הדפדפן: 'interactive' או 'bulk' (None = ברירת המחדל)
+        
+        כשהתור מלא השרת עונה 429 עם Retry-After (ה-client מנסה שוב לבד). bulk נדחית
+        קודם, ו-interactive עוקפת את ה-bulk שממתינות.
+        """
+        self.priority = priority
+        if priority:
+            self.session.headers['X-Priority'] = priority
+        else:
+            self.session.headers.pop('X-Priority', None)
+    
+    def open_tab(self, url=None, wait_until=None):
+        """
+        פתיחת טאב חדש בדפדפן של ה-session (לא עובר אליו - ראו use_tab / tab)
+        
+        Returns:
+            tab_id
+        """
+        payload = {}
+        if url:
+            payload['url'] = url
+        if wait_until:
+            payload['wait_until'] = wait_until
+        
+        response = self.session.post(f'{self.base_url}/tabs', json=payload)
+        data = response.json()
+        
+        if not data.get('success'):
+            raise Exception(f"Open tab failed: {data.get('error')}")
+        
+        return data['tab_id']
+    
+    def close_tab(self, tab_id=None):
+        """
+        סגירת טאב (ברירת מחדל: הטאב הנוכחי)
+        """
+        tab_id = tab_id or self.tab_id
+        if not tab_id:
+            return None
+        
+        headers = {'X-Tab-Id': None}  # ה-DELETE הולך ל-session, לא לטאב
+        response = self.session.delete(f'{self.base_url}/tabs/{tab_id}', headers=headers)
+        if tab_id == self.tab_id:
+            self.use_tab(None)
+        return response.json()
+    
+    def tabs(self):
+        """
+        הטאבים הפתוחים ב-session
+        """
+        response = self.session.get(f'{self.base_url}/tabs', headers={'X-Tab-Id': None})
+        return response.json()['tabs']
+    
+    def tab(self, tab_id):
+        """
+        client נפרד שעובד מול טאב אחד - לשימוש מ-thread משלו
+        """
+        client = BrowserEmbassyClient(self.base_url, self.session_id, self.pool_size, self.timeout,
+                                      self.retries, self.backoff)
+        client.use_priority(self.priority)
+        client.use_tab(tab_id)
+        return client
+    
+    def open_session(self, profile=None):
+        """
+        פתיחת דפדפן משלנו במאגר - כל הקריאות הבאות ילכו אליו
+        
+        Args:
+            profile: פרופיל חסימת משאבים (full, no-trackers, lite, text או dict)
+        
+        Returns:
+            session_id
+        """
+        response = self.session.post(
+            f'{self.base_url}/sessions',
+            json={'profile': profile} if profile else {}
+        )
+        data = response.json()
+        
+        if not data.get('success'):
+            raise Exception(f"Open session failed: {data.get('error')}")
+        
+        self.use_session(data['session_id'])
+        return self.session_id
+    
+    def release_session(self):
+        """
+        שחרור ה-session הנוכחי בחזרה למאגר
+        """
+        if not self.session_id:
+            return None
+        
+        response = self.session.delete(f'{self.base_url}/sessions/{self.session_id}')
+        self.use_session(None)
+        return response.json()
+    
+    def set_profile(self, profile):
+        """
+        החלפת פרופיל חסימת המשאבים של ה-session הנוכחי
+        """
+        if not self.session_id:
+            raise Exception("set_profile requires an open session")
+        
+        response = self.session.post(
+            f'{self.base_url}/sessions/{self.session_id}/profile',
+            json={'profile': profile}
+        )
+        return response.json()
+    
+    def sessions(self):
+        """
+        מצב מאגר הדפדפנים
+        """
+        response = self.session.get(f'{self.base_url}/sessions')
+        return response.json()
+    
+    def __enter__(self):
+        self.open_session()
+        return self
+    
+    def __exit__(self, *exc):
+        self.release_session()
     
     def status(self):
         """
@@ -35,48 +476,156 @@ class BrowserEmbassyClient:
         response = self.session.get(f'{self.base_url}/status')
         return response.json()
     
-    def navigate(self, url):
+    def navigate(self, url, wait_until=None, timeout=None, profile=None,
+                 max_age=None, cache=False, cache_screenshot=None):
         """
         ניווט לכתובת
+        
+        Args:
+            url: הכתובת
+            wait_until: domcontentloaded, load, networkidle, selector:<css>, url-change או none
+            timeout: מקסימום שניות להמתנה
+            profile: פרופיל חסימת משאבים מהניווט הזה והלאה
+            max_age: דף שנשמר ב-page_cache בשניות האחרונות מוגש בלי טעינה (גורר cache)
+            cache: שמירת הדף ב-page_cache של השרת (רק לדפים שלא תלויים בהתחברות)
+            cache_screenshot: גם צילום במטמון - True או אפשרויות צילום (dict)
         """
+        payload = {'url': url}
+        if wait_until:
+            payload['wait_until'] = wait_until
+        if timeout is not None:
+            payload['timeout'] = timeout
+        if profile:
+            payload['profile'] = profile
+        if max_age is not None:
+            payload['max_age'] = max_age
+        if cache:
+            payload['cache'] = True
+        if cache_screenshot:
+            payload['cache_screenshot'] = cache_screenshot
+        
         response = self.session.post(
             f'{self.base_url}/navigate',
-            json={'url': url}
+            json=payload,
+            timeout=(CONNECT_TIMEOUT, request_timeout(self.timeout, timeout))
         )
         return response.json()
     
-    def screenshot(self, save_path=None):
+    def screenshot(self, save_path=None, format=None, quality=None, scale=None,
+                   max_width=None, clip=None, selector=None, delta=False):
         """
         צילום מסך
         
         Args:
             save_path: נתיב לשמירת הקובץ (אופציונלי)
+            format: 'png', 'jpeg' או 'webp'
+            quality: 1-100 (jpeg/webp)
+            scale: הקטנה (למשל 0.5)
+            max_width: רוחב מקסימלי בפיקסלים
+            clip: (x, y, width, height)
+            selector: CSS selector - צילום אלמנט בודד
+            delta: לקבל רק את ה-tiles שהשתנו מאז הצילום הקודם ולהרכיב את התמונה מקומית
         
         Returns:
-            PIL Image object
+            PIL Image object (בלי פענוח - ראו screenshot_raw)
         """
-        response = self.session.get(f'{self.base_url}/screenshot')
+        params = screenshot_params(format, quality, scale, max_width, clip, selector)
+        if delta:
+            params['delta'] = 1
+            if self._frame:
+                params['since'] = self._frame[0]
+        
+        response = self.session.get(f'{self.base_url}/screenshot', params=params)
         data = response.json()
         
         if not data.get('success'):
             raise Exception(f"Screenshot failed: {data.get('error')}")
         
-        # המר מ-base64 לתמונה
-        img_data = base64.b64decode(data['screenshot'])
-        img = Image.open(BytesIO(img_data))
+        if delta:
+            img = self._apply_delta(data['delta'])
+            if save_path:
+                img.save(save_path)
+        else:
+            # הקובץ נכתב כמו שהגיע - PIL מפענח רק אם משתמשים בתמונה
+            img_data = base64.b64decode(data['screenshot'])
+            if save_path:
+                Path(save_path).write_bytes(img_data)
+            img = Image.open(BytesIO(img_data))
         
-        # שמור אם נדרש
         if save_path:
-            img.save(save_path)
             print(f"📸 Screenshot saved to: {save_path}")
         
         return img
     
-    def extract_fields(self):
+    def screenshot_raw(self, save_path=None, format=None, quality=None, scale=None,
+                       max_width=None, clip=None, selector=None, headers=None):
+        """
+        צילום מסך בינארי (/screenshot?raw=1) - בלי base64 ובלי PIL
+        
+        Args:
+            save_path: לכתוב את התשובה ישר לקובץ תוך כדי הורדה (בלי להחזיק אותה בזיכרון)
+            (שאר הפרמטרים כמו ב-screenshot)
+        
+        Returns:
+            Screenshot - bytes(shot), shot.view() (memoryview), shot.image (PIL, מפוענח רק כשנדרש)
+        """
+        params = screenshot_params(format, quality, scale, max_width, clip, selector)
+        params['raw'] = 1
+        
+        with self.session.get(f'{self.base_url}/screenshot', params=params, headers=headers,
+                              stream=True) as response:
+            mimetype = response.headers.get('Content-Type', '')
+            if not mimetype.startswith('image/'):
+                raise Exception(f"Screenshot failed: {response.json().get('error')}")
+            url = response.headers.get('X-Page-Url')
+            
+            if not save_path:
+                return Screenshot(response.content, mimetype, url)
+            
+            with open(save_path, 'wb') as f:
+                for chunk in response.iter_content(STREAM_CHUNK):
+                    f.write(chunk)
+        
+        return Screenshot(mimetype=mimetype, url=url, path=save_path)
+    
+    def capture_sessions(self, directory, session_ids=None, concurrency=None, **options):
+        """
+        צילום כמה sessions ישר לתיקייה (<session_id>.<ext>), במקביל
+        
+        Args:
+            directory: תיקיית היעד (נוצרת אם צריך)
+            session_ids: ברירת מחדל - כל ה-sessions במאגר
+            concurrency: כמה צילומים במקביל (ברירת מחדל pool_size)
+            **options: format, quality, scale, max_width, clip, selector
+        
+        Returns:
+            {session_id: Screenshot או Exception}
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        if session_ids is None:
+            session_ids = [s['session_id'] for s in self.sessions()['sessions']]
+        ext = IMAGE_EXTENSIONS.get(f"image/{options.get('format') or 'png'}", options.get('format'))
+        
+        def capture(session_id):
+            try:
+                return self.screenshot_raw(directory / f'{session_id}.{ext}',
+                                           headers={'X-Session-Id': session_id, 'X-Tab-Id': None}, **options)
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=concurrency or self.pool_size) as executor:
+            return dict(zip(session_ids, executor.map(capture, session_ids)))
+    
+    def extract_fields(self, columnar=False):
         """
         חילוץ שדות טופס
+        
+        Args:
+            columnar: להחזיר columns/rows (קומפקטי) במקום רשימת אובייקטים
         """
-        response = self.session.get(f'{self.base_url}/extract_fields')
+        params = {'format': 'columnar'} if columnar else None
+        response = self.session.get(f'{self.base_url}/extract_fields', params=params)
         return response.json()
     
     def fill_field(self, selector, value, method='css'):
@@ -98,44 +647,294 @@ class BrowserEmbassyClient:
         )
         return response.json()
     
-    def click(self, selector, method='css'):
+    def click(self, selector, method='css', wait_until=None, timeout=None):
         """
         לחיצה על אלמנט
         
         Args:
             selector: CSS selector, ID, name, or XPath
             method: 'css', 'id', 'name', or 'xpath'
+            wait_until: המתנה אחרי הלחיצה (כמו ב-navigate)
+            timeout: מקסימום שניות להמתנה
         """
+        payload = {
+            'selector': selector,
+            'method': method
+        }
+        if wait_until:
+            payload['wait_until'] = wait_until
+        if timeout is not None:
+            payload['timeout'] = timeout
+        
         response = self.session.post(
             f'{self.base_url}/click',
-            json={
-                'selector': selector,
-                'method': method
-            }
+            json=payload,
+            timeout=(CONNECT_TIMEOUT, request_timeout(self.timeout, timeout))
         )
         return response.json()
     
-    def get_html(self):
+    def get_html(self, selector=None, mode=None, strip=None, diff=False):
         """
         קבלת HTML של הדף
+        
+        Args:
+            selector: רק outerHTML של האלמנט הזה
+            mode: 'html' או 'text' (טקסט נראה בלבד)
+            strip: למשל ['scripts', 'styles'] - להסיר מה-HTML
+            diff: לקבל רק שינויים מאז הקריאה הקודמת ולהרכיב את ה-HTML מקומית
         """
-        response = self.session.get(f'{self.base_url}/get_html')
-        return response.json()
+        params = {}
+        if selector:
+            params['selector'] = selector
+        if mode:
+            params['mode'] = mode
+        if strip:
+            params['strip'] = ','.join(strip)
+        if diff:
+            params['since'] = self._html[0] if self._html else ''
+        
+        response = self.session.get(f'{self.base_url}/get_html', params=params)
+        data = response.json()
+        
+        if diff and data.get('success'):
+            data['html'] = self._apply_html_delta(data)
+        
+        return data
     
-    def execute_js(self, script):
+    def execute_js(self, script, args=None, is_async=False):
         """
         הרצת JavaScript
         
         Args:
             script: קוד JavaScript להרצה
+            args: ארגומנטים (arguments[0], ...)
+            is_async: הגוף הוא async function (await / Promise)
         """
+        payload = {'script': script}
+        if args:
+            payload['args'] = list(args)
+        if is_async:
+            payload['async'] = True
+        
         response = self.session.post(
             f'{self.base_url}/execute_js',
-            json={'script': script}
+            json=payload
+        )
+        return response.json()
+    
+    def register_script(self, source, name=None, is_async=False, inject=False):
+        """
+        רישום סקריפט בשרת - נשלח פעם אחת ומופעל אחר כך לפי id
+        
+        Args:
+            source: גוף הסקריפט (כמו ב-execute_js)
+            name: שם להפעלה במקום ה-id (אופציונלי)
+            is_async: הגוף הוא async function
+            inject: להגדיר אותו מראש בכל מסמך חדש
+        
+        Returns:
+            script_id (hash של התוכן)
+        """
+        payload = {'source': source, 'async': is_async, 'inject': inject}
+        if name:
+            payload['name'] = name
+        
+        response = self.session.post(f'{self.base_url}/scripts', json=payload)
+        data = response.json()
+        
+        if not data.get('success'):
+            raise Exception(f"Register script failed: {data.get('error')}")
+        
+        return data['script']['script_id']
+    
+    def run_script(self, script_id, *args):
+        """
+        הפעלת סקריפט רשום (id או שם) עם ארגומנטים
+        
+        Returns:
+            ערך ההחזרה של הסקריפט
+        """
+        response = self.session.post(f'{self.base_url}/scripts/{script_id}/run', json={'args': list(args)})
+        data = response.json()
+        
+        if not data.get('success'):
+            raise Exception(f"Script {script_id} failed: {data.get('error')}")
+        
+        return data['result']
+    
+    def scripts(self):
+        """
+        הסקריפטים הרשומים בשרת
+        """
+        response = self.session.get(f'{self.base_url}/scripts')
+        return response.json()['scripts']
+    
+    def page_cache(self):
+        """
+        מצב מטמון הדפים בשרת (hit_rate, bytes, הדפים השמורים)
+        """
+        response = self.session.get(f'{self.base_url}/page_cache')
+        return response.json()
+    
+    def clear_page_cache(self, url=None):
+        """
+        ריקון מטמון הדפים - כולו או URL אחד
+        """
+        params = {'url': url} if url else None
+        response = self.session.delete(f'{self.base_url}/page_cache', params=params)
+        return response.json()
+    
+    def batch(self, on_error='stop'):
+        """
+        רצף פעולות שנשלח לשרת בקריאה אחת
+        
+        Args:
+            on_error: 'stop' (ברירת מחדל) או 'continue' - ניתן לשנות לכל צעד
+        
+        Returns:
+            BatchBuilder - להוסיף צעדים ולקרוא ל-run()
+        """
+        return BatchBuilder(self, on_error)
+    
+    def _run_batch(self, steps, on_error):
+        response = self.session.post(
+            f'{self.base_url}/batch',
+            json={'steps': steps, 'on_error': on_error}
         )
         return response.json()
     
-    def oracle_login(self, username, password, domain='Default'):
+    def fetch_many(self, urls, concurrency=4, include=None, wait_until=None, timeout=None, profile=None,
+                   tabs=False, **options):
+        """
+        טעינת הרבה URLs במקביל בשרת - מחזיר generator של תוצאות לפי סדר הסיום
+        
+        Args:
+            urls: רשימת כתובות
+            concurrency: כמה דפדפנים במקביל
+            include: מה להחזיר לכל דף - html, text, screenshot, fields
+            profile: פרופיל חסימת משאבים (למשל 'lite')
+            tabs: טאבים בדפדפן של ה-session במקום דפדפנים נפרדים (פחות זיכרון)
+            **options: selector, screenshot={...}, max_age / cache (page_cache של השרת)
+        
+        Yields:
+            {"index", "url", "status", "final_url", "title", "http_status", ...}
+            (שורת הסיכום {"done": True, ...} לא מוחזרת - היא נשמרת ב-self.last_fetch)
+        """
+        payload = {'urls': list(urls), 'concurrency': concurrency, **options}
+        if include:
+            payload['include'] = list(include)
+        if wait_until:
+            payload['wait_until'] = wait_until
+        if timeout is not None:
+            payload['timeout'] = timeout
+        if profile is not None:
+            payload['profile'] = profile
+        if tabs:
+            payload['tabs'] = True
+        
+        # בלי timeout כולל - רק בין שורה לשורה
+        with self.session.post(f'{self.base_url}/fetch_many', json=payload, stream=True,
+                               timeout=(CONNECT_TIMEOUT, request_timeout(self.timeout, timeout))) as response:
+            if response.headers.get('Content-Type', '').startswith('application/json'):
+                raise Exception(f"fetch_many failed: {response.json().get('error')}")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                record = json.loads(line)
+                if record.get('done'):
+                    self.last_fetch = record
+                    continue
+                yield record
+    
+    def register_recipe(self, recipe):
+        """
+        רישום recipe בשרת (dict בפורמט של POST /recipes)
+        """
+        response = self.session.post(f'{self.base_url}/recipes', json=recipe)
+        data = response.json()
+        
+        if not data.get('success'):
+            raise Exception(f"Register recipe failed: {data.get('error')}")
+        
+        return data['recipe']
+    
+    def recipes(self):
+        """
+        רשימת ה-recipes הרשומים בשרת
+        """
+        response = self.session.get(f'{self.base_url}/recipes')
+        return response.json()['recipes']
+    
+    def run_recipe(self, name, reuse_auth=True, **params):
+        """
+        הרצת recipe בשרת
+        
+        Args:
+            name: שם ה-recipe
+            reuse_auth: לשחזר התחברות קודמת אם ל-recipe יש auth
+            **params: הפרמטרים של ה-recipe
+        
+        Returns:
+            {"success", "failed_step", "outputs", "steps": [... elapsed_ms ...]}
+        """
+        payload = {'params': params}
+        if not reuse_auth:
+            payload['reuse_auth'] = False
+        
+        response = self.session.post(f'{self.base_url}/recipes/{name}/run', json=payload)
+        result = response.json()
+        
+        if 'error' in result:
+            raise Exception(f"Recipe {name} failed: {result['error']}")
+        
+        return result
+    
+    def submit_job(self, action, **params):
+        """
+        הרצת פעולה ברקע בשרת
+        
+        Args:
+            action: שם הפעולה (navigate, click, ... או batch עם steps=[...])
+            **params: השדות של הפעולה
+        
+        Returns:
+            job_id
+        """
+        response = self.session.post(
+            f'{self.base_url}/jobs',
+            json={'action': action, **params}
+        )
+        data = response.json()
+        
+        if not data.get('success'):
+            raise Exception(f"Submit job failed: {data.get('error')}")
+        
+        return data['job_id']
+    
+    def job(self, job_id, wait=0):
+        """
+        מצב job (long-poll עד wait שניות)
+        """
+        response = self.session.get(
+            f'{self.base_url}/jobs/{job_id}',
+            params={'wait': wait},
+            timeout=(CONNECT_TIMEOUT, request_timeout(self.timeout, wait))
+        )
+        return response.json()
+    
+    def wait_job(self, job_id, timeout=300, poll=30):
+        """
+        המתנה לסיום job והחזרת התוצאה
+        """
+        deadline = time.time() + timeout
+        while True:
+            job = self.job(job_id, wait=min(poll, max(deadline - time.time(), 0)))
+            if job.get('status') not in ('queued', 'running'):
+                return job
+            if time.time() >= deadline:
+                raise TimeoutError(f"Job {job_id} did not finish in {timeout}s")
+    
+    def oracle_login(self, username, password, domain='Default', wait_until=None, reuse_auth=True):
         """
         התחברות אוטומטית ל-Oracle Cloud
         
@@ -143,32 +942,38 @@ class BrowserEmbassyClient:
             username: שם משתמש (email)
             password: סיסמה
             domain: דומיין (ברירת מחדל: Default)
+            wait_until: המתנה אחרי Sign In (ברירת מחדל: url-change)
+            reuse_auth: לשחזר התחברות קודמת מהשרת אם יש (False = התחברות מלאה)
         """
         print(f"🔐 Logging into Oracle Cloud...")
         print(f"   Username: {username}")
         print(f"   Domain: {domain}")
         
+        payload = {
+            'username': username,
+            'password': password,
+            'domain': domain
+        }
+        if wait_until:
+            payload['wait_until'] = wait_until
+        if not reuse_auth:
+            payload['reuse_auth'] = False
+        
         response = self.session.post(
             f'{self.base_url}/oracle_login',
-            json={
-                'username': username,
-                'password': password,
-                'domain': domain
-            }
+            json=payload
         )
         
         result = response.json()
         
         if result.get('success'):
-            print(f"✅ Login process completed")
+            print(f"✅ Login process completed ({result.get('auth', {}).get('source', 'login')})")
             print(f"📍 Current URL: {result.get('current_url')}")
             print(f"📄 Page title: {result.get('page_title')}")
             
-            # שמור screenshot
+            # שמור screenshot (ה-PNG כמו שהגיע, בלי פענוח)
             if result.get('screenshot'):
-                img_data = base64.b64decode(result['screenshot'])
-                img = Image.open(BytesIO(img_data))
-                img.save('oracle_login_result.png')
+                Path('oracle_login_result.png').write_bytes(base64.b64decode(result['screenshot']))
                 print(f"📸 Screenshot saved: oracle_login_result.png")
         
         return result
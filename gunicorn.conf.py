@@ -0,0 +1,14 @@
+"""
+הגדרות gunicorn - warm-up של הדפדפן בכל worker מיד אחרי ה-fork
+
+Chrome לא שורד fork, לכן הדפדפן מופעל ב-worker עצמו ולא ב-master (גם עם --preload).
+ה-warm-up רץ ב-thread ברקע: ה-workers עולים במקביל וכל אחד מפעיל את הדפדפן שלו,
+ובינתיים /status מחזיר 503 (readiness gate).
+"""
+
+
+def post_fork(server, worker):
+    from app import warmup
+
+    server.log.info(f"Worker {worker.pid}: starting browser warm-up")
+    warmup.start()
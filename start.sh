@@ -14,4 +14,5 @@ websockify --web=/opt/noVNC 6080 localhost:5900 > /dev/null 2>&1 &
 sleep 2
 
 echo "🚀 Starting Flask API..."
-exec gunicorn -b 0.0.0.0:7860 -w 2 --timeout 300 app:app
+# worker אחד עם threads - מאגר הדפדפנים וה-sessions חיים בתהליך אחד
+exec gunicorn -c gunicorn.conf.py -b 0.0.0.0:7860 -w 1 -k gthread --threads ${GUNICORN_THREADS:-8} --timeout 300 app:app